@@ -0,0 +1,104 @@
+# bench/lista_bench.py
+"""
+Micro-benchmark della costruzione degli embed di /lista.
+
+Confronta il renderer a passaggio singolo (ListaRenderer) con il
+raggruppamento precedente (sorted(set(...)) e una scansione completa per
+ogni giorno) su inventari sintetici, e verifica che gli embed prodotti
+rispettino i limiti di Discord.
+
+Uso:
+    python bench/lista_bench.py
+    python bench/lista_bench.py --dimensioni 10 100 1000 5000 --ripetizioni 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from config import GIORNI  # noqa: E402
+from lista_renderer import (  # noqa: E402
+    ListaRenderer, LIMITE_VALORE_FIELD, LIMITE_FIELD, LIMITE_CARATTERI_MESSAGGIO
+)
+
+NOMI = ("pollo", "petto di tacchino", "salmone", "merluzzo", "piselli", "spinaci",
+        "lasagne della nonna", "ragù", "pane", "hamburger", "zucchine grigliate", "gnocchi")
+
+
+def inventario(n, seme=42):
+    """n alimenti sintetici distribuiti sui 7 giorni"""
+    casuale = random.Random(seme)
+    return [
+        {
+            "nome_alimento": f"{casuale.choice(NOMI)} {i}",
+            "quantita": casuale.randint(1, 12),
+            "unita": "porzioni",
+            "scongela_per_giorno": casuale.randint(1, 7)
+        }
+        for i in range(n)
+    ]
+
+
+def lista_precedente(alimenti):
+    """Il raggruppamento di mostra_lista prima di ListaRenderer (senza limiti)"""
+    embed = discord.Embed(
+        title="🧊 Il Tuo Freezer",
+        description=f"Hai **{len(alimenti)}** alimenti salvati:",
+        color=discord.Color.blue()
+    )
+    for giorno_num in sorted(set([a['scongela_per_giorno'] for a in alimenti])):
+        alimenti_giorno = [a for a in alimenti if a['scongela_per_giorno'] == giorno_num]
+        testo = "\n".join([
+            f"• **{a['nome_alimento'].capitalize()}**: {a['quantita']} {a.get('unita', 'pz')}"
+            for a in alimenti_giorno
+        ])
+        embed.add_field(name=f"📅 {GIORNI[giorno_num]}", value=testo, inline=False)
+    return [embed]
+
+
+def violazioni(embeds):
+    """Conta gli embed che Discord rifiuterebbe"""
+    errori = 0
+    for embed in embeds:
+        if len(embed) > LIMITE_CARATTERI_MESSAGGIO or len(embed.fields) > LIMITE_FIELD:
+            errori += 1
+        errori += sum(1 for field in embed.fields if len(field.value) > LIMITE_VALORE_FIELD)
+    return errori
+
+
+def misura(funzione, alimenti, ripetizioni):
+    """Tempo medio per chiamata in microsecondi (migliore di 5 serie)"""
+    serie = timeit.repeat(lambda: funzione(alimenti), number=ripetizioni, repeat=5)
+    return min(serie) / ripetizioni * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della costruzione degli embed di /lista")
+    parser.add_argument("--dimensioni", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ripetizioni", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"\n📋 Lista bench — ripetizioni={args.ripetizioni}")
+    print(f"{'alimenti':>9} {'precedente':>12} {'renderer':>12} {'embed':>6} {'field':>6} {'fuori limite':>13}")
+    print("-" * 62)
+
+    for n in args.dimensioni:
+        alimenti = inventario(n)
+        precedente = misura(lista_precedente, alimenti, args.ripetizioni)
+        renderer = misura(ListaRenderer.crea_embed, alimenti, args.ripetizioni)
+
+        embeds = ListaRenderer.crea_embed(alimenti)
+        assert sum(len(e.fields) for e in embeds) >= min(n, 1)
+        fuori_limite = f"{violazioni(lista_precedente(alimenti))} → {violazioni(embeds)}"
+
+        print(f"{n:>9} {precedente:>10.0f}µs {renderer:>10.0f}µs {len(embeds):>6} "
+              f"{sum(len(e.fields) for e in embeds):>6} {fuori_limite:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# bench/voice_bench.py
+"""
+Benchmark offline della pipeline vocale (ffmpeg + Vosk + parsing).
+
+Per ogni fixture audio nella cartella (.ogg, .opus, .wav) cerca:
+- <nome>.txt  -> trascrizione di riferimento (per il WER)
+- <nome>.json -> campi attesi da estrai_info_alimento (per la parse accuracy)
+
+Uso:
+    python bench/voice_bench.py fixtures/ --pool-size 2 --chunk 4000
+    VOSK_MODEL_PATH=./altro-modello python bench/voice_bench.py fixtures/
+
+Riporta tempo di conversione, real-time factor del riconoscimento,
+quota di silenzio tagliata dal VAD (--no-vad per disattivarlo),
+RSS di picco, word error rate e accuratezza del parsing, più il
+throughput end-to-end con il pool configurato.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from voice_handler import VoiceHandler, SAMPLE_RATE  # noqa: E402
+from vad import VoiceActivityDetector  # noqa: E402
+
+ESTENSIONI_AUDIO = (".ogg", ".opus", ".wav")
+CAMPI_PARSING = ("nome", "quantita", "grammi", "giorno", "orario")
+
+
+def normalizza_parole(testo):
+    """Minuscolo, senza punteggiatura, diviso in parole"""
+    return re.sub(r"[^\w\s]", " ", testo.lower()).split()
+
+
+def word_error_rate(riferimento, ipotesi):
+    """Ritorna (errori, parole di riferimento) con distanza di Levenshtein sulle parole"""
+    ref = normalizza_parole(riferimento)
+    hyp = normalizza_parole(ipotesi or "")
+
+    precedente = list(range(len(hyp) + 1))
+    for i, parola_ref in enumerate(ref, 1):
+        corrente = [i] + [0] * len(hyp)
+        for j, parola_hyp in enumerate(hyp, 1):
+            corrente[j] = min(
+                precedente[j] + 1,          # cancellazione
+                corrente[j - 1] + 1,        # inserimento
+                precedente[j - 1] + (parola_ref != parola_hyp)  # sostituzione
+            )
+        precedente = corrente
+
+    return precedente[-1], len(ref)
+
+
+def picco_rss_mb():
+    """RSS massimo del processo in MB (ru_maxrss è in KB su Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def carica_fixture(cartella):
+    """Elenca le fixture audio con riferimenti opzionali"""
+    fixture = []
+    for nome_file in sorted(os.listdir(cartella)):
+        base, ext = os.path.splitext(nome_file)
+        if ext.lower() not in ESTENSIONI_AUDIO:
+            continue
+
+        percorso = os.path.join(cartella, nome_file)
+        riferimento = None
+        atteso = None
+
+        if os.path.exists(os.path.join(cartella, base + ".txt")):
+            with open(os.path.join(cartella, base + ".txt"), encoding="utf-8") as f:
+                riferimento = f.read().strip()
+
+        if os.path.exists(os.path.join(cartella, base + ".json")):
+            with open(os.path.join(cartella, base + ".json"), encoding="utf-8") as f:
+                atteso = json.load(f)
+
+        with open(percorso, "rb") as f:
+            fixture.append({
+                "nome": nome_file,
+                "audio": f.read(),
+                "riferimento": riferimento,
+                "atteso": atteso
+            })
+    return fixture
+
+
+def parsing_corretto(info, atteso):
+    """True se tutti i campi attesi coincidono con quelli estratti"""
+    if info is None:
+        return atteso is None or atteso == {}
+    return all(info.get(campo) == atteso[campo] for campo in CAMPI_PARSING if campo in atteso)
+
+
+def misura_fixture(fixture, chunk_frames):
+    """Esegue conversione e riconoscimento di una fixture misurando ogni fase"""
+    inizio = time.perf_counter()
+    pcm = VoiceHandler.converti_audio(fixture["audio"], fixture["nome"])
+    tempo_conversione = time.perf_counter() - inizio
+
+    durata_audio = len(pcm) / (2 * SAMPLE_RATE)
+
+    inizio = time.perf_counter()
+    frazione_rimossa = 0.0
+    if VoiceHandler.vad_abilitato:
+        pcm, statistiche = VoiceActivityDetector.rimuovi_silenzi(pcm, SAMPLE_RATE)
+        frazione_rimossa = statistiche["frazione_rimossa"]
+    tempo_vad = time.perf_counter() - inizio
+
+    inizio = time.perf_counter()
+    transcript = VoiceHandler.riconosci_pcm(pcm, chunk_frames=chunk_frames)
+    tempo_riconoscimento = time.perf_counter() - inizio
+
+    info = VoiceHandler.estrai_info_alimento(transcript) if transcript else None
+
+    risultato = {
+        "nome": fixture["nome"],
+        "durata_audio_s": durata_audio,
+        "conversione_s": tempo_conversione,
+        "vad_s": tempo_vad,
+        "silenzio_rimosso": frazione_rimossa,
+        "riconoscimento_s": tempo_riconoscimento,
+        "rtf": tempo_riconoscimento / durata_audio if durata_audio else 0.0,
+        "transcript": transcript,
+        "errori": None,
+        "parole_ref": None,
+        "parsing_ok": None
+    }
+
+    if fixture["riferimento"] is not None:
+        risultato["errori"], risultato["parole_ref"] = word_error_rate(fixture["riferimento"], transcript)
+
+    if fixture["atteso"] is not None:
+        risultato["parsing_ok"] = parsing_corretto(info, fixture["atteso"])
+
+    return risultato
+
+
+async def misura_throughput(fixture, ripetizioni):
+    """Passa tutte le fixture da trascrivi_audio_vosk in parallelo sul pool configurato"""
+    lavori = [
+        VoiceHandler.trascrivi_audio_vosk(f["audio"], f["nome"])
+        for _ in range(ripetizioni)
+        for f in fixture
+    ]
+    inizio = time.perf_counter()
+    await asyncio.gather(*lavori)
+    return len(lavori), time.perf_counter() - inizio
+
+
+def stampa_report(risultati, lavori, tempo_totale, args):
+    """Stampa il report leggibile"""
+    print(f"\n🎤 Voice bench — pool={args.pool_size} chunk={args.chunk} "
+          f"vad={'on' if VoiceHandler.vad_abilitato else 'off'} "
+          f"modello={os.getenv('VOSK_MODEL_PATH', 'default')}")
+    print(f"{'fixture':<30} {'audio':>7} {'conv':>7} {'recog':>7} {'RTF':>6} {'VAD':>5} {'WER':>6} parse")
+
+    for r in risultati:
+        wer = f"{r['errori'] / r['parole_ref']:.0%}" if r["parole_ref"] else "-"
+        parse = {True: "ok", False: "KO", None: "-"}[r["parsing_ok"]]
+        print(f"{r['nome'][:30]:<30} {r['durata_audio_s']:>6.2f}s {r['conversione_s']:>6.3f}s "
+              f"{r['riconoscimento_s']:>6.3f}s {r['rtf']:>6.3f} {r['silenzio_rimosso']:>5.0%} {wer:>6} {parse}")
+
+    durata_totale = sum(r["durata_audio_s"] for r in risultati)
+    riconoscimento_totale = sum(r["riconoscimento_s"] for r in risultati)
+    conversione_totale = sum(r["conversione_s"] for r in risultati)
+    errori = sum(r["errori"] for r in risultati if r["errori"] is not None)
+    parole = sum(r["parole_ref"] for r in risultati if r["parole_ref"])
+    con_parsing = [r for r in risultati if r["parsing_ok"] is not None]
+
+    print("-" * 75)
+    print(f"Conversione totale:   {conversione_totale:.3f}s "
+          f"(media {conversione_totale / len(risultati):.3f}s)")
+    print(f"RTF complessivo:      {riconoscimento_totale / durata_totale:.3f}" if durata_totale else "RTF: -")
+    print(f"WER complessivo:      {errori / parole:.1%} su {parole} parole" if parole else "WER: -")
+    if con_parsing:
+        corretti = sum(1 for r in con_parsing if r["parsing_ok"])
+        print(f"Parse accuracy:       {corretti}/{len(con_parsing)} ({corretti / len(con_parsing):.0%})")
+    print(f"Throughput (pool={args.pool_size}): {lavori} vocali in {tempo_totale:.2f}s "
+          f"({lavori / tempo_totale:.2f}/s)")
+    print(f"RSS di picco:         {picco_rss_mb():.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della pipeline vocale")
+    parser.add_argument("cartella", help="Cartella con le fixture audio")
+    parser.add_argument("--pool-size", type=int, default=2, help="Thread del pool vocali")
+    parser.add_argument("--chunk", type=int, default=4000, help="Campioni per AcceptWaveform")
+    parser.add_argument("--ripetizioni", type=int, default=1, help="Ripetizioni per il throughput")
+    parser.add_argument("--no-vad", action="store_true", help="Disattiva il taglio dei silenzi")
+    parser.add_argument("--json", action="store_true", help="Stampa i risultati in JSON")
+    args = parser.parse_args()
+
+    fixture = carica_fixture(args.cartella)
+    if not fixture:
+        print(f"❌ Nessuna fixture audio in {args.cartella}")
+        sys.exit(1)
+
+    inizio = time.perf_counter()
+    VoiceHandler.carica_modello()
+    if not VoiceHandler.model:
+        sys.exit(1)
+    print(f"📥 Modello caricato in {time.perf_counter() - inizio:.2f}s")
+
+    VoiceHandler.configura_pool(args.pool_size)
+    VoiceHandler.chunk_frames = args.chunk
+    VoiceHandler.vad_abilitato = not args.no_vad
+
+    risultati = [misura_fixture(f, args.chunk) for f in fixture]
+    lavori, tempo_totale = asyncio.run(misura_throughput(fixture, args.ripetizioni))
+
+    if args.json:
+        print(json.dumps({
+            "pool_size": args.pool_size,
+            "chunk": args.chunk,
+            "vad": VoiceHandler.vad_abilitato,
+            "picco_rss_mb": picco_rss_mb(),
+            "throughput_s": lavori / tempo_totale,
+            "risultati": risultati
+        }, indent=2, ensure_ascii=False))
+    else:
+        stampa_report(risultati, lavori, tempo_totale, args)
+
+
+if __name__ == "__main__":
+    main()
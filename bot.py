@@ -4,13 +4,32 @@
 import discord
 from discord.ext import commands
 import asyncio
+import hashlib
+import json
+import signal
+import time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config import TOKEN
-from commands import BotCommands
+from config import TOKEN, WATCHDOG_ENABLED
+from commands import BotCommands, AlberoComandi
 from events import BotEvents
 from web_server import WebServer
 from voice_handler import VoiceHandler
+from database import DatabaseManager
+from metrics import Metrics, Gauge
+from readiness import Readiness
+from loop_watchdog import LoopWatchdog
+from profiling import Profiler
+from tracing import Tracing
+from shutdown import Shutdown
+from provisioning import ThreadProvisioning
+from views import MenuPrincipale
+from notifications import BottoneScongelato
+from mongo_logger import setup_logging, get_logger, campi
+
+log = get_logger(__name__)
+
+INIZIO_PROCESSO = time.perf_counter()
 
 # Configurazione intents
 intents = discord.Intents.default()
@@ -18,106 +37,201 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-# Inizializza bot
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Inizializza bot (l'attività viene inviata a ogni identify, anche dopo le riconnessioni)
+bot = commands.Bot(
+    command_prefix='!',
+    intents=intents,
+    tree_cls=AlberoComandi,
+    activity=discord.Activity(
+        type=discord.ActivityType.watching,
+        name="il tuo freezer 🧊 | /menu"
+    )
+)
 
 # Inizializza scheduler
 scheduler = AsyncIOScheduler()
 
+AVVIO_FASI = Gauge("freezerbot_startup_phase_seconds", "Durata delle fasi di avvio", labels=("fase",))
 
-@bot.event
-async def on_ready():
-    """Evento quando il bot si connette"""
-    from notifications import NotificationManager
+
+# Lavoro di avvio: una sola volta per processo (on_ready scatta anche dopo le riconnessioni)
+avvio_completato = False
+
+
+async def fase_avvio(nome, coro):
+    """Esegue una fase di avvio misurandone la durata"""
+    inizio = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        durata = time.perf_counter() - inizio
+        AVVIO_FASI.set(durata, fase=nome)
+        log.info("⏱️ Avvio: %s in %.0fms", nome, durata * 1000,
+                 extra=campi(fase=nome, latency_ms=round(durata * 1000, 1)))
+
+
+def calcola_hash_comandi():
+    """Hash del payload dei comandi slash: cambia solo se cambiano i comandi"""
+    payload = sorted(
+        (comando.to_dict(bot.tree) for comando in bot.tree.get_commands()),
+        key=lambda c: (c.get("type", 1), c["name"])
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def sincronizza_comandi():
+    """Sincronizza i comandi slash solo se il tree è cambiato dall'ultima sync"""
+    chiave = f"comandi_hash_{bot.application_id}"
+    hash_comandi = calcola_hash_comandi()
     
-    print(f'✅ Bot connesso come {bot.user}')
-    print(f'ID: {bot.user.id}')
-    print('-------------------')
+    if await asyncio.to_thread(DatabaseManager.get_meta, chiave) == hash_comandi:
+        log.info("✅ Comandi slash invariati, sync saltata")
+        return
     
-    # Sincronizza i comandi slash
     try:
         synced = await bot.tree.sync()
-        print(f'✅ Sincronizzati {len(synced)} comandi')
+        log.info("✅ Sincronizzati %d comandi", len(synced))
+        await asyncio.to_thread(DatabaseManager.salva_meta, chiave, hash_comandi)
     except Exception as e:
-        print(f'❌ Errore sincronizzazione comandi: {e}')
+        log.error("❌ Errore sincronizzazione comandi: %s", e)
+
+
+async def avvia_scheduler():
+    """Registra i job delle notifiche e avvia lo scheduler"""
+    from notifications import NotificationManager
+    
+    # ========== JOB 1: PREPARA NOTIFICHE GIORNALIERE ==========
+    # Esegue ogni giorno a mezzanotte e 1 minuto
+    scheduler.add_job(
+        NotificationManager.prepara_notifiche_giornaliere,
+        'cron',
+        hour=0,
+        minute=1,
+        args=[bot],
+        id='prepara_notifiche',
+        replace_existing=True
+    )
+    log.info('✅ Job "prepara_notifiche" schedulato: ogni giorno alle 00:01')
+    
+    # ========== JOB 2: ELABORA CODA NOTIFICHE ==========
+    # Esegue ogni minuto per elaborare la coda
+    scheduler.add_job(
+        NotificationManager.elabora_coda_notifiche,
+        'interval',
+        minutes=1,
+        args=[bot],
+        id='elabora_coda',
+        replace_existing=True
+    )
+    log.info('✅ Job "elabora_coda" schedulato: ogni 1 minuto')
+    
+    # ========== JOB 3: PULIZIA NOTIFICHE VECCHIE ==========
+    # Esegue ogni giorno alle 2:00 di notte
+    scheduler.add_job(
+        NotificationManager.pulisci_notifiche_vecchie,
+        'cron',
+        hour=2,
+        minute=0,
+        id='pulizia_notifiche',
+        replace_existing=True
+    )
+    log.info('✅ Job "pulizia_notifiche" schedulato: ogni giorno alle 02:00')
+    
+    # Avvia lo scheduler
+    scheduler.start()
+    log.info("✅ Scheduler avviato")
+
+
+@bot.event
+async def on_ready():
+    """Evento quando il bot si connette (anche dopo ogni riconnessione)"""
+    from notifications import NotificationManager
+    global avvio_completato
+    
+    if avvio_completato:
+        log.info("🔄 Riconnesso come %s, avvio già completato", bot.user)
+        return
+    avvio_completato = True
+    
+    log.info("✅ Bot connesso come %s (ID: %s) dopo %.1fs dall'avvio del processo",
+             bot.user, bot.user.id, time.perf_counter() - INIZIO_PROCESSO)
+    
+    # Carica il modello Vosk in background: non ritarda gateway e /health
+    VoiceHandler.avvia_caricamento_in_background()
+    
+    # Sincronizza i comandi slash (solo se cambiati)
+    await fase_avvio("sync_comandi", sincronizza_comandi())
     
     # Avvia scheduler per notifiche
     if not scheduler.running:
-        # ========== JOB 1: PREPARA NOTIFICHE GIORNALIERE ==========
-        # Esegue ogni giorno a mezzanotte e 1 minuto
-        scheduler.add_job(
-            NotificationManager.prepara_notifiche_giornaliere,
-            'cron',
-            hour=0,
-            minute=1,
-            args=[bot],
-            id='prepara_notifiche',
-            replace_existing=True
-        )
-        print('✅ Job "prepara_notifiche" schedulato: ogni giorno alle 00:01')
-        
-        # ========== JOB 2: ELABORA CODA NOTIFICHE ==========
-        # Esegue ogni minuto per elaborare la coda
-        scheduler.add_job(
-            NotificationManager.elabora_coda_notifiche,
-            'interval',
-            minutes=1,
-            args=[bot],
-            id='elabora_coda',
-            replace_existing=True
-        )
-        print('✅ Job "elabora_coda" schedulato: ogni 1 minuto')
-        
-        # ========== JOB 3: PULIZIA NOTIFICHE VECCHIE ==========
-        # Esegue ogni giorno alle 2:00 di notte
-        scheduler.add_job(
-            NotificationManager.pulisci_notifiche_vecchie,
-            'cron',
-            hour=2,
-            minute=0,
-            id='pulizia_notifiche',
-            replace_existing=True
-        )
-        print('✅ Job "pulizia_notifiche" schedulato: ogni giorno alle 02:00')
-        
-        # Avvia lo scheduler
-        scheduler.start()
-        print('✅ Scheduler avviato')
+        await fase_avvio("scheduler", avvia_scheduler())
         
         # ========== IMPORTANTE: Prepara notifiche per OGGI al primo avvio ==========
-        print('🔄 Esecuzione iniziale: preparazione notifiche per oggi...')
-        await NotificationManager.prepara_notifiche_giornaliere(bot)
-        print('✅ Preparazione iniziale completata')
-    
-    # Imposta stato del bot
-    await bot.change_presence(
-        activity=discord.Activity(
-            type=discord.ActivityType.watching,
-            name="il tuo freezer 🧊 | /menu"
-        )
-    )
+        log.info("🔄 Esecuzione iniziale: preparazione notifiche per oggi...")
+        await fase_avvio("prepara_notifiche", NotificationManager.prepara_notifiche_giornaliere(bot))
+        log.info("✅ Preparazione iniziale completata")
+    
+    # Worker dei thread privati (riprende i backfill interrotti)
+    await fase_avvio("provisioning", ThreadProvisioning.avvia(bot))
+    
+    AVVIO_FASI.set(time.perf_counter() - INIZIO_PROCESSO, fase="totale")
+    log.info("✅ Avvio completato in %.1fs", time.perf_counter() - INIZIO_PROCESSO)
 
 
 async def main():
     """Funzione principale per avviare bot e web server"""
+    setup_logging()
+    
+    # Latenza di comandi, bottoni e modal (ack, DB, REST, totale)
+    Tracing.installa()
+    
     # Registra comandi ed eventi
-    VoiceHandler.carica_modello()
     BotCommands.setup_commands(bot)
     BotEvents.setup_events(bot, scheduler)
     
+    # Componenti persistenti: un'istanza per tutti i messaggi, anche dopo un riavvio
+    bot.add_view(MenuPrincipale(timeout=None))
+    bot.add_dynamic_items(BottoneScongelato)
+    
+    # Avvia monitor delle metriche (lag event loop, coda notifiche)
+    Metrics.avvia(bot)
+    
+    # Avvia le probe di readiness (Mongo, gateway, scheduler, Vosk)
+    Readiness.avvia(bot, scheduler)
+    
+    # Job dello scheduler profilabili da /debug/profilo/job/<id>
+    Profiler.configura(scheduler)
+    
+    # Avvia il watchdog dei blocchi dell'event loop
+    if WATCHDOG_ENABLED:
+        LoopWatchdog.avvia()
+    
     # Avvia web server in background (UNA VOLTA SOLA!)
     asyncio.create_task(WebServer.start_web_server())
     
+    # SIGTERM (deploy) e Ctrl+C avviano l'arresto controllato
+    loop = asyncio.get_running_loop()
+    arresto = asyncio.Event()
+    for segnale in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(segnale, arresto.set)
+        except NotImplementedError:
+            pass  # Windows: resta KeyboardInterrupt
+    
     # Avvia il bot
+    connessione = asyncio.create_task(bot.start(TOKEN))
+    segnale_ricevuto = asyncio.create_task(arresto.wait())
     try:
-        await bot.start(TOKEN)
-    except KeyboardInterrupt:
-        print("\n🛑 Bot fermato manualmente")
+        await asyncio.wait({connessione, segnale_ricevuto}, return_when=asyncio.FIRST_COMPLETED)
+        if arresto.is_set():
+            log.info("🛑 Segnale di arresto ricevuto")
+        elif connessione.exception():
+            log.error("❌ Connessione terminata: %s", connessione.exception())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        log.info("🛑 Bot fermato manualmente")
     finally:
-        if scheduler.running:
-            scheduler.shutdown()
-        await bot.close()
-        print("✅ Bot chiuso correttamente.")
+        segnale_ricevuto.cancel()
+        await Shutdown.esegui(bot, scheduler)
 
 
 if __name__ == "__main__":
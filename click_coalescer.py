@@ -0,0 +1,141 @@
+# click_coalescer.py
+"""Raggruppa i click +1/-1 ravvicinati in una sola scrittura e una sola modifica del messaggio"""
+
+import asyncio
+import time
+import discord
+from config import CLICK_DEBOUNCE_MS, CLICK_ATTESA_MAX_MS
+from database import DatabaseManager
+from metrics import Counter
+from shutdown import Shutdown
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+
+class _Raffica:
+    """Click in attesa per una coppia (utente, alimento)"""
+    __slots__ = ("delta", "interaction", "view", "inizio", "task")
+
+    def __init__(self):
+        self.delta = 0
+        self.interaction = None
+        self.view = None
+        self.inizio = time.monotonic()
+        self.task = None
+
+
+class ClickCoalescer:
+    """
+    Debounce dei bottoni di GestioneAlimentoView.
+
+    Ogni click viene confermato subito (defer) e aggiorna la quantità
+    ottimistica della view (view.quantita); la scrittura parte
+    CLICK_DEBOUNCE_MS dopo l'ultimo click (al massimo CLICK_ATTESA_MAX_MS
+    dopo il primo) con il delta netto (quantità ottimistica finale meno
+    quella iniziale): un solo update su Mongo e una sola edit del
+    messaggio, con l'alimento restituito dal database.
+    """
+
+    _raffiche = {}  # (user_id, id_univoco) -> _Raffica in attesa
+    _in_scrittura = {}  # (user_id, id_univoco) -> Task della scrittura in corso
+
+    @staticmethod
+    async def clicca(interaction: discord.Interaction, view, delta: int):
+        """Registra un click della view sull'alimento che gestisce"""
+        await interaction.response.defer()
+        CLICK_RICEVUTI.inc()
+
+        chiave = (str(view.user_id), view.id_univoco)
+        raffica = ClickCoalescer._raffiche.get(chiave)
+        if raffica is None:
+            raffica = ClickCoalescer._raffiche[chiave] = _Raffica()
+
+        # Il delta netto somma le variazioni effettive dopo il limite a 0, come
+        # la quantità mostrata: a 0, -1 e poi +1 scrivono +1 e non si annullano
+        quantita = max(0, view.quantita + delta)
+        raffica.delta += quantita - view.quantita
+        raffica.interaction = interaction  # Il token più recente per la edit finale
+        raffica.view = view
+        view.quantita = quantita
+
+        if raffica.task:
+            raffica.task.cancel()
+        attesa = min(
+            CLICK_DEBOUNCE_MS / 1000,
+            raffica.inizio + CLICK_ATTESA_MAX_MS / 1000 - time.monotonic()
+        )
+        raffica.task = asyncio.create_task(ClickCoalescer._scrivi_dopo(chiave, max(0.0, attesa)))
+
+    @staticmethod
+    async def svuota():
+        """Scrive subito tutti i click in attesa (all'arresto)"""
+        chiavi = list(ClickCoalescer._raffiche)
+        for chiave in chiavi:
+            ClickCoalescer._raffiche[chiave].task.cancel()
+        await asyncio.gather(*(ClickCoalescer._scrivi(chiave) for chiave in chiavi))
+
+    @staticmethod
+    async def _scrivi_dopo(chiave, attesa: float):
+        await asyncio.sleep(attesa)
+        await ClickCoalescer._scrivi(chiave)
+
+    @staticmethod
+    async def _scrivi(chiave):
+        # Tolta dalle attese prima di qualsiasi await: i click successivi aprono una nuova raffica
+        raffica = ClickCoalescer._raffiche.pop(chiave, None)
+        if raffica is None:
+            return
+
+        # Le scritture della stessa coppia restano in ordine
+        precedente = ClickCoalescer._in_scrittura.get(chiave)
+        corrente = ClickCoalescer._in_scrittura[chiave] = asyncio.current_task()
+        try:
+            if precedente:
+                await asyncio.shield(precedente)
+            with Shutdown.in_volo("click"):
+                await ClickCoalescer._applica(chiave, raffica)
+        except Exception as e:
+            log.exception("❌ Errore scrittura click: %s", e,
+                          extra=campi(user_id=chiave[0], id_univoco=chiave[1]))
+        finally:
+            if ClickCoalescer._in_scrittura.get(chiave) is corrente:
+                del ClickCoalescer._in_scrittura[chiave]
+
+    @staticmethod
+    async def _applica(chiave, raffica: _Raffica):
+        """Un update con il delta netto e una edit con la quantità reale"""
+        # Import qui per evitare circular import
+        from ui_handlers import UIHandlers
+        from notifications import NotificationManager
+
+        if raffica.delta == 0:
+            return  # +1 e -1 si annullano: né scrittura né edit
+
+        user_id, id_univoco = chiave
+        view, interaction = raffica.view, raffica.interaction
+        alimento = await asyncio.to_thread(
+            DatabaseManager.aggiorna_quantita, user_id, id_univoco, raffica.delta, True
+        )
+        CLICK_SCRITTURE.inc()
+
+        if alimento is None:
+            await interaction.edit_original_response(
+                content="❌ Alimento non trovato! Potrebbe essere stato eliminato.",
+                embed=None,
+                view=None
+            )
+            return
+
+        view.quantita = alimento['quantita']
+        await interaction.edit_original_response(embed=UIHandlers.crea_embed_alimento(alimento), view=view)
+
+        # Notifica se finito
+        if raffica.delta < 0 and alimento['quantita'] == 1:
+            await NotificationManager.notifica_quantita_finita(interaction.user, alimento)
+
+
+CLICK_RICEVUTI = Counter("freezerbot_quantity_clicks_total", "Click sui bottoni +1/-1")
+CLICK_SCRITTURE = Counter(
+    "freezerbot_quantity_click_writes_total", "Scritture su Mongo dopo il raggruppamento dei click +1/-1"
+)
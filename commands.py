@@ -2,10 +2,32 @@
 """Comandi slash del bot"""
 
 import discord
+import time
+from functools import partial
 from discord import app_commands
-from ui_handlers import UIHandlers
+from config import GIORNI, ORARIO_PROMEMORIA_DEFAULT
 from database import DatabaseManager
-from thread_manager import ThreadManager
+from models import AlimentoHelper
+from food_index import FoodIndex
+from ui_handlers import UIHandlers
+from thread_manager import ThreadManager, ThreadResolver
+from provisioning import ThreadProvisioning
+from templates import EmbedTemplates
+from rate_limiter import RateLimiter, COSTI_COMANDI
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+
+class AlberoComandi(app_commands.CommandTree):
+    """CommandTree con il limite di interazioni per utente davanti a ogni comando slash"""
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # L'autocomplete non può ricevere risposte ed è servito dalla memoria
+        if interaction.type is discord.InteractionType.autocomplete:
+            return True
+        nome = interaction.data.get("name", "?")
+        return await RateLimiter.consenti(interaction, "comando", nome, COSTI_COMANDI.get(nome, 1))
 
 
 class BotCommands:
@@ -23,58 +45,213 @@ class BotCommands:
         @bot.tree.command(name="lista", description="Mostra tutti gli alimenti nel freezer")
         async def lista_command(interaction: discord.Interaction):
             """Comando /lista per vedere gli alimenti"""
-            await UIHandlers.mostra_lista(interaction)
+            await UIHandlers.mostra_lista(interaction, tutte_le_pagine=True)
         
-        @bot.tree.command(name="aggiungi", description="Aggiungi alimenti o porzioni")
-        async def aggiungi_command(interaction: discord.Interaction):
-            """Comando /aggiungi"""
-            await UIHandlers.mostra_menu_aggiungi(interaction)
+        scelte_giorno = [app_commands.Choice(name=nome, value=numero) for numero, nome in GIORNI.items()]
+        scelte_orario = [
+            app_commands.Choice(name=f"{h:02d}:00", value=f"{h:02d}:00") for h in range(8, 23)
+        ]
         
-        @bot.tree.command(name="help", description="Guida all'uso di FreezerBot")
-        async def help_command(interaction: discord.Interaction):
-            """Comando /help"""
-            embed = discord.Embed(
-                title="📚 Guida FreezerBot",
-                description="Ecco come usare il bot per gestire il tuo freezer!",
-                color=discord.Color.blue()
-            )
+        async def autocomplete_alimento(interaction: discord.Interaction, corrente: str):
+            """Suggerisce i nomi degli alimenti dell'utente dall'indice in memoria"""
+            user_id = interaction.user.id
+            # Solo la prima volta: carica l'indice da Mongo fuori dal loop
+            await FoodIndex.carica(user_id)
+            nomi = FoodIndex.completa(user_id, corrente)
+            return [app_commands.Choice(name=nome.capitalize(), value=nome) for nome in nomi]
+        
+        async def nome_esatto(interaction: discord.Interaction, nome: str):
+            """
+            Il nome così com'è se l'utente ha quell'alimento, altrimenti None
+            dopo aver risposto con il suggerimento: /consuma e /rimuovi non
+            agiscono mai su un nome indovinato.
+            """
+            nome = FoodIndex.normalizza(nome)
+            await FoodIndex.carica(interaction.user.id)
+            if FoodIndex.esiste(interaction.user.id, nome):
+                return nome
             
-            embed.add_field(
-                name="🎯 Comandi Principali",
-                value="`/menu` - Apri il menu principale\n"
-                      "`/lista` - Vedi tutti gli alimenti\n"
-                      "`/aggiungi` - Aggiungi alimenti",
-                inline=False
+            suggerito = FoodIndex.miglior_corrispondenza(interaction.user.id, nome)
+            await interaction.response.send_message(
+                f"❓ Non hai **{nome}** nel freezer."
+                + (f" Forse intendevi **{suggerito}**?" if suggerito else "")
+                + " Scegli il nome dai suggerimenti del comando.",
+                ephemeral=True
             )
-            
-            embed.add_field(
-                name="📢 Come funzionano i promemoria?",
-                value="Il bot ti invierà un messaggio privato il giorno e l'ora che scegli "
-                      "per ricordarti di tirare fuori l'alimento dal freezer!",
-                inline=False
+            return None
+        
+        async def aggiungi_diretto(interaction: discord.Interaction, nome: str,
+                                   quantita: int, giorno: int, grammi: int, orario: str):
+            """Upsert dell'alimento con il nome scelto e risposta con il risultato"""
+            alimento_dict = AlimentoHelper.crea_alimento_dict(
+                interaction.user.id, nome, quantita, grammi, giorno, orario
             )
+            alimento, creato = DatabaseManager.aggiungi_porzioni(alimento_dict)
             
-            embed.add_field(
-                name="⚠️ Notifica quantità finita",
-                value="Quando la quantità arriva a 1, riceverai una notifica con "
-                      "i grammi da comprare per quel giorno della settimana.",
-                inline=False
+            embed = UIHandlers.crea_embed_alimento(alimento)
+            embed.description = (
+                "✅ Aggiunto al freezer!" if creato else f"✅ Aggiunte {quantita} porzioni!"
             )
+            # Dal bottone del suggerimento: sostituisce la domanda con il risultato
+            if interaction.response.is_done():
+                await interaction.edit_original_response(embed=embed, view=None)
+            else:
+                await interaction.response.send_message(embed=embed)
+        
+        @bot.tree.command(name="aggiungi", description="Aggiungi alimenti o porzioni")
+        @app_commands.describe(
+            nome="Nome dell'alimento (senza argomenti si apre il menu)",
+            quantita="Porzioni da aggiungere",
+            giorno="Giorno in cui lo mangerai",
+            grammi="Grammi per porzione (da comprare)",
+            orario="Orario del promemoria il giorno prima"
+        )
+        @app_commands.autocomplete(nome=autocomplete_alimento)
+        @app_commands.choices(giorno=scelte_giorno, orario=scelte_orario)
+        async def aggiungi_command(
+            interaction: discord.Interaction,
+            nome: app_commands.Range[str, 1, 50] = None,
+            quantita: app_commands.Range[int, 1, 99] = 1,
+            giorno: int = None,
+            grammi: app_commands.Range[int, 1, 5000] = None,
+            orario: str = ORARIO_PROMEMORIA_DEFAULT
+        ):
+            """Comando /aggiungi: menu, oppure aggiunta diretta con un upsert"""
+            if nome is None:
+                await UIHandlers.mostra_menu_aggiungi(interaction)
+                return
             
-            embed.add_field(
-                name="💡 Suggerimenti",
-                value="• Puoi avere più varianti dello stesso alimento per giorni diversi\n"
-                      "• Usa i bottoni per aggiungere/rimuovere porzioni velocemente\n"
-                      "• Abilita/disabilita le notifiche dalle impostazioni",
-                inline=False
+            if giorno is None or grammi is None:
+                await interaction.response.send_message(
+                    "⚠️ Per aggiungere direttamente servono anche **giorno** e **grammi** "
+                    "(oppure usa `/aggiungi` senza argomenti per il menu).",
+                    ephemeral=True
+                )
+                return
+            
+            nome = FoodIndex.normalizza(nome)
+            await FoodIndex.carica(interaction.user.id)
+            aggiungi = partial(aggiungi_diretto, quantita=quantita, giorno=giorno, grammi=grammi, orario=orario)
+            
+            # Nome quasi uguale a un alimento già presente: lo propone, ma sceglie l'utente
+            suggerito = FoodIndex.miglior_corrispondenza(interaction.user.id, nome)
+            if suggerito and suggerito != nome:
+                await UIHandlers.mostra_suggerimento_nome(interaction, nome, suggerito, aggiungi)
+                return
+            
+            await aggiungi(interaction, nome)
+        
+        @bot.tree.command(name="consuma", description="Togli porzioni di un alimento")
+        @app_commands.describe(
+            nome="Nome dell'alimento",
+            porzioni="Porzioni da togliere",
+            giorno="Variante del giorno (se non indicato, quella con più porzioni)"
+        )
+        @app_commands.autocomplete(nome=autocomplete_alimento)
+        @app_commands.choices(giorno=scelte_giorno)
+        async def consuma_command(
+            interaction: discord.Interaction,
+            nome: str,
+            porzioni: app_commands.Range[int, 1, 99] = 1,
+            giorno: int = None
+        ):
+            """Comando /consuma: una sola scrittura atomica"""
+            from notifications import NotificationManager
+            
+            nome_finale = await nome_esatto(interaction, nome)
+            if nome_finale is None:
+                return
+            alimento = DatabaseManager.consuma_porzioni(interaction.user.id, nome_finale, porzioni, giorno)
+            
+            if alimento is None:
+                await interaction.response.send_message(
+                    f"❌ Nessun **{nome_finale}** con almeno {porzioni} porzioni"
+                    + (f" per {GIORNI[giorno]}" if giorno else "") + ".",
+                    ephemeral=True
+                )
+                return
+            
+            embed = UIHandlers.crea_embed_alimento(alimento)
+            embed.description = f"➖ Tolte {porzioni} porzioni"
+            await interaction.response.send_message(embed=embed)
+            
+            # Come il bottone "Rimuovi 1": avviso quando resta l'ultima porzione
+            if alimento['quantita'] == 1:
+                await NotificationManager.notifica_quantita_finita(interaction.user, alimento)
+        
+        @bot.tree.command(name="rimuovi", description="Elimina un alimento dal freezer")
+        @app_commands.describe(
+            nome="Nome dell'alimento",
+            giorno="Solo la variante di questo giorno (se non indicato, tutte)"
+        )
+        @app_commands.autocomplete(nome=autocomplete_alimento)
+        @app_commands.choices(giorno=scelte_giorno)
+        async def rimuovi_command(interaction: discord.Interaction, nome: str, giorno: int = None):
+            """Comando /rimuovi: una sola delete"""
+            nome_finale = await nome_esatto(interaction, nome)
+            if nome_finale is None:
+                return
+            eliminati = DatabaseManager.elimina_alimento_per_nome(interaction.user.id, nome_finale, giorno)
+            
+            if not eliminati:
+                await interaction.response.send_message(
+                    f"❌ **{nome_finale}** non trovato nel freezer.", ephemeral=True
+                )
+                return
+            
+            await interaction.response.send_message(
+                f"🗑️ **{nome_finale.capitalize()}** eliminato dal freezer"
+                + (f" ({eliminati} varianti)" if eliminati > 1 else "") + "!"
             )
+        
+        @bot.tree.command(name="help", description="Guida all'uso di FreezerBot")
+        async def help_command(interaction: discord.Interaction):
+            """Comando /help"""
+            await interaction.response.send_message(embed=EmbedTemplates.crea("help"), ephemeral=True)
+
+        @bot.tree.command(name="provisioning", description="Crea i thread privati per i membri che non ne hanno uno")
+        @app_commands.describe(azione="Avvia il backfill o mostra l'avanzamento")
+        @app_commands.choices(azione=[
+            app_commands.Choice(name="avvia", value="avvia"),
+            app_commands.Choice(name="stato", value="stato")
+        ])
+        @app_commands.default_permissions(manage_guild=True)
+        @app_commands.guild_only()
+        async def provisioning_command(interaction: discord.Interaction, azione: str = "stato"):
+            """Comando /provisioning per il backfill dei thread privati"""
+            await interaction.response.defer(ephemeral=True)
             
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            if azione == "avvia":
+                risultato = await ThreadProvisioning.backfill(interaction.guild)
+                log.info("📋 Backfill avviato da %s", interaction.user.name,
+                         extra=campi(user_id=str(interaction.user.id), comando="provisioning"))
+                await interaction.followup.send(
+                    f"📋 **{risultato['da_creare']}** membri in coda per il thread privato "
+                    f"({risultato['gia_presenti']} ne hanno già uno).",
+                    ephemeral=True
+                )
+                return
+            
+            stato = ThreadProvisioning.stato(interaction.guild.id)
+            backfill = stato["backfill"]
+            righe = [
+                f"📥 In coda: **{stato['in_coda']}**",
+                f"⚡ Velocità: **{stato['thread_al_minuto']:.0f}** thread/min"
+            ]
+            if backfill:
+                righe.append(
+                    f"📋 Backfill {backfill['stato'].replace('_', ' ')}: "
+                    f"{backfill['creati'] + backfill['falliti']}/{backfill['totale']} "
+                    f"({backfill['creati']} creati, {backfill['falliti']} falliti)"
+                )
+            await interaction.followup.send("\n".join(righe), ephemeral=True)
 
         @bot.tree.command(name="reset", description="Resetta completamente il thread (elimina e ricrea)")
         async def reset_command(interaction: discord.Interaction):
             """Comando per resettare il thread completamente"""
-            print("🔴 COMANDO RESET AVVIATO")
+            inizio = time.perf_counter()
+            log_campi = campi(user_id=str(interaction.user.id), comando="reset")
+            log.info("🔴 COMANDO RESET AVVIATO", extra=log_campi)
             
             await interaction.response.defer(ephemeral=True)
             
@@ -87,7 +264,7 @@ class BotCommands:
                     )
                     return
                 
-                print(f"✅ È un thread: {interaction.channel.name}")
+                log.debug("✅ È un thread: %s", interaction.channel.name, extra=log_campi)
                 thread_name = interaction.channel.name
                 channel = interaction.channel.parent
                 user = interaction.user
@@ -95,29 +272,25 @@ class BotCommands:
                 
                 # Archivia il thread vecchio
                 try:
-                    print("🔄 Archiviando thread vecchio...")
                     await interaction.channel.edit(archived=True)
-                    print("✅ Thread archiviato")
+                    log.debug("✅ Thread archiviato", extra=log_campi)
                 except Exception as e:
-                    print(f"⚠️ Errore nell'archiviare thread: {e}")
+                    log.warning("⚠️ Errore nell'archiviare thread: %s", e, extra=log_campi)
                 
                 # Crea un nuovo thread con lo stesso nome
-                print("🔄 Creando nuovo thread...")
                 new_thread = await channel.create_thread(
                     name=thread_name,
                     type=discord.ChannelType.private_thread
                 )
-                print(f"✅ Nuovo thread creato: {new_thread.id}")
+                log.debug("✅ Nuovo thread creato: %s", new_thread.id, extra=log_campi)
                 
                 # Aggiorna il database con il nuovo thread ID
-                print("🔄 Aggiornando database...")
-                DatabaseManager.save_user_thread(guild.id, user.id, channel.id, new_thread.id)
-                print("✅ Database aggiornato")
+                ThreadResolver.salva(guild.id, user.id, channel.id, new_thread.id)
+                log.debug("✅ Database aggiornato", extra=log_campi)
                 
                 # Invia il messaggio di benvenuto nel nuovo thread
-                print("🔄 Inviando messaggio di benvenuto...")
                 await ThreadManager._invia_messaggio_benvenuto(new_thread, user)
-                print("✅ Messaggio di benvenuto inviato")
+                log.debug("✅ Messaggio di benvenuto inviato", extra=log_campi)
                 
                 # Notifica l'utente nel vecchio thread
                 await interaction.followup.send(
@@ -125,12 +298,11 @@ class BotCommands:
                     ephemeral=True
                 )
                 
-                print(f"✅ RESET COMPLETATO")
+                log_campi["campi"]["latency_ms"] = round((time.perf_counter() - inizio) * 1000, 1)
+                log.info("✅ RESET COMPLETATO", extra=log_campi)
                 
             except Exception as e:
-                print(f"❌ ERRORE CRITICO: {type(e).__name__}: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("❌ ERRORE CRITICO: %s: %s", type(e).__name__, e, extra=log_campi)
                 
                 try:
                     await interaction.followup.send(
@@ -138,4 +310,4 @@ class BotCommands:
                         ephemeral=True
                     )
                 except:
-                    print("❌ Impossibile inviare messaggio di errore")
+                    log.error("❌ Impossibile inviare messaggio di errore", extra=log_campi)
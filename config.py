@@ -24,3 +24,66 @@ GIORNI_INVERSO = {v: k for k, v in GIORNI.items()}
 
 # Nomi canali
 NOME_CANALE_LISTA_SPESA = "lista-spesa"
+
+# Cache trascrizioni vocali (LRU in memoria + livello Mongo opzionale con TTL)
+TRANSCRIPT_CACHE_SIZE = int(os.getenv('TRANSCRIPT_CACHE_SIZE', 256))
+TRANSCRIPT_CACHE_MONGO = os.getenv('TRANSCRIPT_CACHE_MONGO', 'false').lower() in ('1', 'true', 'yes')
+TRANSCRIPT_CACHE_TTL = int(os.getenv('TRANSCRIPT_CACHE_TTL', 604800))  # 7 giorni
+
+# Modello Vosk: caricato in background dopo la connessione al gateway
+VOSK_WARMUP = os.getenv('VOSK_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+VOSK_MODEL_WAIT_TIMEOUT = float(os.getenv('VOSK_MODEL_WAIT_TIMEOUT', 120))
+
+# Pipeline vocale
+VOICE_POOL_SIZE = int(os.getenv('VOICE_POOL_SIZE', 2))  # Vocali elaborati in parallelo
+VOICE_CHUNK_FRAMES = int(os.getenv('VOICE_CHUNK_FRAMES', 4000))  # Campioni per AcceptWaveform
+
+# VAD a energia prima del riconoscimento
+VOICE_VAD_ENABLED = os.getenv('VOICE_VAD_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+VAD_FRAME_MS = int(os.getenv('VAD_FRAME_MS', 30))
+VAD_SOGLIA_MIN = float(os.getenv('VAD_SOGLIA_MIN', 300))  # RMS minimo su int16 (~ -40 dBFS)
+VAD_MOLTIPLICATORE_RUMORE = float(os.getenv('VAD_MOLTIPLICATORE_RUMORE', 3.0))
+VAD_MARGINE_MS = int(os.getenv('VAD_MARGINE_MS', 210))
+VAD_PAUSA_MAX_MS = int(os.getenv('VAD_PAUSA_MAX_MS', 300))
+
+# Ricerca fuzzy dei nomi alimenti (coefficiente di Dice sui trigrammi, 0-1)
+FUZZY_SOGLIA = float(os.getenv('FUZZY_SOGLIA', 0.7))
+
+# Metriche (/metrics): intervallo di aggiornamento dei valori letti da Mongo
+METRICS_REFRESH_INTERVAL = float(os.getenv('METRICS_REFRESH_INTERVAL', 30))
+
+# Readiness (/ready): probe in background, l'endpoint legge solo la cache
+READY_PROBE_INTERVAL = float(os.getenv('READY_PROBE_INTERVAL', 10))
+READY_PROBE_TIMEOUT = float(os.getenv('READY_PROBE_TIMEOUT', 3))
+READY_RICHIEDI_VOSK = os.getenv('READY_RICHIEDI_VOSK', 'false').lower() in ('1', 'true', 'yes')
+
+# Watchdog dell'event loop: rileva le chiamate sincrone che lo bloccano
+WATCHDOG_ENABLED = os.getenv('WATCHDOG_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+WATCHDOG_SOGLIA_MS = float(os.getenv('WATCHDOG_SOGLIA_MS', 200))  # Blocco minimo registrato
+WATCHDOG_INTERVALLO_MS = float(os.getenv('WATCHDOG_INTERVALLO_MS', 50))  # Battito e campionamento
+
+# Endpoint di debug/profiling (/debug/*): disabilitati se ADMIN_TOKEN non è impostato
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PROFILO_MAX_SECONDI = float(os.getenv('PROFILO_MAX_SECONDI', 120))
+PROFILO_HZ = int(os.getenv('PROFILO_HZ', 100))  # Frequenza del profiler a campionamento
+
+# Tracing delle interazioni (comandi slash, bottoni, modal)
+TRACCIA_LENTA_MS = float(os.getenv('TRACCIA_LENTA_MS', 1500))  # Log delle interazioni più lente
+TRACCIA_FINESTRA = int(os.getenv('TRACCIA_FINESTRA', 500))  # Campioni per i percentili di ogni interazione
+
+# Arresto controllato: tempo massimo per completare invii e vocali in corso
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 20))
+
+# Provisioning dei thread privati (nuovi membri e backfill)
+PROVISIONING_THREAD_AL_MINUTO = float(os.getenv('PROVISIONING_THREAD_AL_MINUTO', 20))
+
+# Orario del promemoria per /aggiungi quando non viene indicato
+ORARIO_PROMEMORIA_DEFAULT = os.getenv('ORARIO_PROMEMORIA_DEFAULT', '18:00')
+
+# Bottoni +1/-1: i click ravvicinati diventano una sola scrittura e una sola modifica del messaggio
+CLICK_DEBOUNCE_MS = float(os.getenv('CLICK_DEBOUNCE_MS', 700))  # Pausa dopo l'ultimo click
+CLICK_ATTESA_MAX_MS = float(os.getenv('CLICK_ATTESA_MAX_MS', 3000))  # Attesa massima dal primo click
+
+# Limite di interazioni per utente (token bucket): raffica massima e ricarica
+LIMITE_INTERAZIONI_RAFFICA = float(os.getenv('LIMITE_INTERAZIONI_RAFFICA', 10))
+LIMITE_INTERAZIONI_AL_SECONDO = float(os.getenv('LIMITE_INTERAZIONI_AL_SECONDO', 1))
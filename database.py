@@ -1,10 +1,19 @@
 # database.py
 """Gestione connessione MongoDB e operazioni database"""
 
-from pymongo import MongoClient
+import re
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
 from datetime import datetime
 from bson import ObjectId
 from config import MONGODB_URI
+from food_index import FoodIndex
+from models import AlimentoHelper
+from mongo_logger import get_logger, campi
+from metrics import Metrics, DB_DURATA, DB_CHIAMATE, DB_ERRORI
+from tracing import Tracing
+
+log = get_logger(__name__)
 
 # Connessione MongoDB
 client = MongoClient(MONGODB_URI)
@@ -12,6 +21,11 @@ db = client['freezerbot']
 alimenti_collection = db['alimenti']
 user_threads_collection = db['user_threads']
 notification_queue_collection = db['notification_queue'] 
+transcript_cache_collection = db['transcript_cache']
+bot_meta_collection = db['bot_meta']
+
+# Le transazioni richiedono un replica set o mongos: verificato al primo uso
+_transazioni_supportate = None
 
 
 class DatabaseManager:
@@ -22,6 +36,14 @@ class DatabaseManager:
         """Ottiene tutti gli alimenti di un utente"""
         return list(alimenti_collection.find({"user_id": str(user_id)}))
     
+    @staticmethod
+    def get_nomi_alimenti_utente(user_id):
+        """Ottiene i nomi degli alimenti di un utente (una voce per variante)"""
+        return [
+            a['nome_alimento']
+            for a in alimenti_collection.find({"user_id": str(user_id)}, {"nome_alimento": 1, "_id": 0})
+        ]
+    
     @staticmethod
     def get_alimento_by_id(user_id, id_univoco):
         """Ottiene un alimento specifico"""
@@ -36,24 +58,27 @@ class DatabaseManager:
         try:
             return alimenti_collection.find_one({"_id": ObjectId(alimento_id)})
         except Exception as e:
-            print(f"❌ Errore get_alimento_by_object_id: {e}")
+            log.error("❌ Errore get_alimento_by_object_id: %s", e, extra=campi(alimento_id=str(alimento_id)))
             return None
     
     @staticmethod
-    def aggiorna_quantita(user_id, id_univoco, delta):
-        """Aggiorna la quantità di un alimento"""
-        alimento = DatabaseManager.get_alimento_by_id(user_id, id_univoco)
-        if not alimento:
-            return None
-        
-        nuova_quantita = max(0, alimento['quantita'] + delta)
+    def aggiorna_quantita(user_id, id_univoco, delta, completo=False):
+        """
+        Aggiorna la quantità di un alimento in una sola scrittura atomica.
         
-        alimenti_collection.update_one(
+        La pipeline di update somma il delta e limita il risultato a zero.
+        Ritorna la nuova quantità (o, con completo=True, l'alimento aggiornato)
+        oppure None se l'alimento non esiste.
+        """
+        alimento = alimenti_collection.find_one_and_update(
             {"user_id": str(user_id), "id_univoco": id_univoco},
-            {"$set": {"quantita": nuova_quantita}}
+            [{"$set": {"quantita": {"$max": [0, {"$add": ["$quantita", delta]}]}}}],
+            projection=None if completo else {"quantita": 1, "_id": 0},
+            return_document=ReturnDocument.AFTER
         )
-        
-        return nuova_quantita
+        if alimento is None or completo:
+            return alimento
+        return alimento['quantita']
     
     @staticmethod
     def rimuovi_alimento(user_id, id_univoco):
@@ -62,8 +87,75 @@ class DatabaseManager:
             "user_id": str(user_id),
             "id_univoco": id_univoco
         })
+        if result.deleted_count > 0:
+            FoodIndex.invalida(user_id)
         return result.deleted_count > 0
     
+    # ========== OPERAZIONI ATOMICHE (comandi slash con argomenti) ==========
+    
+    @staticmethod
+    def consuma_porzioni(user_id, nome, porzioni=1, giorno=None):
+        """
+        Toglie porzioni in una sola scrittura atomica.
+        
+        Se ci sono più varianti e il giorno non è indicato, consuma da quella
+        con più porzioni. Ritorna l'alimento aggiornato o None se nessuna
+        variante ha abbastanza porzioni.
+        """
+        filtro = {
+            "user_id": str(user_id),
+            "nome_alimento": nome.lower(),
+            "quantita": {"$gte": porzioni}
+        }
+        if giorno is not None:
+            filtro["scongela_per_giorno"] = giorno
+        
+        return alimenti_collection.find_one_and_update(
+            filtro,
+            {"$inc": {"quantita": -porzioni}},
+            sort=[("quantita", DESCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    @staticmethod
+    def aggiungi_porzioni(alimento_data):
+        """
+        Aggiunge porzioni alla variante (creandola se non esiste) con un upsert atomico.
+        
+        Ritorna (alimento aggiornato, True se appena creato).
+        """
+        quantita = alimento_data['quantita']
+        nuovi_campi = {
+            k: v for k, v in alimento_data.items()
+            if k not in ('quantita', 'user_id', 'id_univoco')  # Già nel filtro dell'upsert
+        }
+        
+        precedente = alimenti_collection.find_one_and_update(
+            {"user_id": alimento_data['user_id'], "id_univoco": alimento_data['id_univoco']},
+            {"$inc": {"quantita": quantita}, "$setOnInsert": nuovi_campi},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if precedente is None:
+            FoodIndex.aggiungi(alimento_data['user_id'], alimento_data['nome_alimento'])
+            return dict(alimento_data), True
+        
+        precedente['quantita'] += quantita
+        return precedente, False
+    
+    @staticmethod
+    def elimina_alimento_per_nome(user_id, nome, giorno=None):
+        """Elimina un alimento (tutte le varianti, o solo quella del giorno). Ritorna quante ne ha eliminate"""
+        filtro = {"user_id": str(user_id), "nome_alimento": nome.lower()}
+        if giorno is not None:
+            filtro["scongela_per_giorno"] = giorno
+        
+        eliminati = alimenti_collection.delete_many(filtro).deleted_count
+        if eliminati:
+            FoodIndex.invalida(user_id)
+        return eliminati
+    
     @staticmethod
     def alimento_esiste(id_univoco):
         """Controlla se un alimento esiste già"""
@@ -71,7 +163,7 @@ class DatabaseManager:
             alimento = alimenti_collection.find_one({"id_univoco": id_univoco})
             return alimento
         except Exception as e:
-            print(f"❌ Errore controllo esistenza: {e}")
+            log.error("❌ Errore controllo esistenza: %s", e)
             return None
 
     @staticmethod
@@ -79,10 +171,12 @@ class DatabaseManager:
         """Inserisce un nuovo alimento SENZA fare upsert"""
         try:
             result = alimenti_collection.insert_one(alimento_data)
-            print(f"✅ Alimento inserito: {alimento_data['nome_alimento']}")
+            FoodIndex.aggiungi(alimento_data['user_id'], alimento_data['nome_alimento'])
+            log.info("✅ Alimento inserito: %s", alimento_data['nome_alimento'],
+                     extra=campi(user_id=alimento_data['user_id'], alimento_id=str(result.inserted_id)))
             return result
         except Exception as e:
-            print(f"❌ Errore inserimento: {e}")
+            log.error("❌ Errore inserimento: %s", e)
             return None
 
     @staticmethod
@@ -93,10 +187,10 @@ class DatabaseManager:
                 {"id_univoco": id_univoco},
                 {"$inc": {"quantita": quantita_da_aggiungere}}
             )
-            print(f"✅ Quantità incrementata per {id_univoco}")
+            log.debug("✅ Quantità incrementata per %s", id_univoco, extra=campi(delta=quantita_da_aggiungere))
             return result
         except Exception as e:
-            print(f"❌ Errore incremento: {e}")
+            log.error("❌ Errore incremento: %s", e)
             return None
     
     @staticmethod
@@ -107,6 +201,109 @@ class DatabaseManager:
             {"$set": updates}
         )
     
+    @staticmethod
+    def cambia_giorno_alimento(user_id, id_univoco, nuovo_giorno):
+        """
+        Sposta un alimento su un altro giorno di scongelamento.
+        
+        Aggiorna scongela_per_giorno, reminder_day e id_univoco sullo stesso
+        documento; se esiste già la variante di destinazione (stesso nome e
+        grammi) le porzioni vengono unite a quella. Le notifiche pending del
+        vecchio giorno vengono saltate e, se il nuovo promemoria cade oggi,
+        viene messa in coda quella di oggi.
+        
+        Con un replica set tutto avviene in una transazione; altrimenti le
+        operazioni sono ordinate in modo che l'alimento esista sempre.
+        Ritorna (alimento risultante, True se unito a una variante esistente)
+        oppure (None, False) se l'alimento non esiste.
+        """
+        if not DatabaseManager._supporta_transazioni():
+            return DatabaseManager._cambia_giorno(user_id, id_univoco, nuovo_giorno, None)
+        
+        with client.start_session() as session:
+            return session.with_transaction(
+                lambda s: DatabaseManager._cambia_giorno(user_id, id_univoco, nuovo_giorno, s)
+            )
+    
+    @staticmethod
+    def _cambia_giorno(user_id, id_univoco, nuovo_giorno, session):
+        alimento = alimenti_collection.find_one(
+            {"user_id": str(user_id), "id_univoco": id_univoco}, session=session
+        )
+        if not alimento:
+            return None, False
+        if alimento['scongela_per_giorno'] == nuovo_giorno:
+            return alimento, False
+        
+        nuovo_id_univoco = AlimentoHelper.crea_id_univoco(
+            alimento['nome_alimento'], nuovo_giorno, alimento['portion_to_buy'], user_id
+        )
+        
+        # Variante di destinazione già presente: unisce le porzioni e rimuove l'origine
+        risultato = alimenti_collection.find_one_and_update(
+            {"user_id": str(user_id), "id_univoco": nuovo_id_univoco},
+            {"$inc": {"quantita": alimento['quantita']}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        unito = risultato is not None
+        if unito:
+            alimenti_collection.delete_one({"_id": alimento['_id']}, session=session)
+        else:
+            risultato = alimenti_collection.find_one_and_update(
+                {"_id": alimento['_id']},
+                {"$set": {
+                    "id_univoco": nuovo_id_univoco,
+                    "scongela_per_giorno": nuovo_giorno,
+                    "reminder_day": AlimentoHelper.calcola_reminder_day(nuovo_giorno)
+                }},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+        
+        # Le notifiche già in coda erano per il vecchio giorno
+        notification_queue_collection.update_many(
+            {"alimento_id": str(alimento['_id']), "stato": "pending"},
+            {"$set": {"stato": "skipped", "errore": "Giorno di scongelamento cambiato"}},
+            session=session
+        )
+        
+        # Se il promemoria ora cade oggi, la preparazione di mezzanotte non lo ha accodato
+        oggi = datetime.now()
+        data_oggi = oggi.date().isoformat()
+        if (risultato['reminder_day'] == oggi.weekday() + 1
+                and risultato.get('notifiche_abilitate') and risultato['quantita'] > 0
+                and not notification_queue_collection.find_one({
+                    "alimento_id": str(risultato['_id']),
+                    "data_notifica": data_oggi,
+                    "stato": {"$in": ["pending", "sent"]}
+                }, session=session)):
+            notification_queue_collection.insert_one(
+                DatabaseManager._documento_notifica(
+                    risultato['_id'], risultato['user_id'], risultato['nome_alimento'], data_oggi,
+                    risultato['reminder_hours'],
+                    datetime.combine(
+                        oggi.date(), datetime.strptime(risultato['reminder_hours'], "%H:%M").time()
+                    ).isoformat()
+                ),
+                session=session
+            )
+        
+        if unito:
+            FoodIndex.invalida(user_id)
+        return risultato, unito
+    
+    @staticmethod
+    def _supporta_transazioni():
+        global _transazioni_supportate
+        if _transazioni_supportate is None:
+            try:
+                hello = client.admin.command('hello')
+                _transazioni_supportate = "setName" in hello or hello.get("msg") == "isdbgrid"
+            except PyMongoError:
+                return False  # Server non raggiungibile: riprova alla prossima chiamata
+        return _transazioni_supportate
+    
     @staticmethod
     def aggiorna_ultima_notifica(alimento_id, timestamp):
         """Aggiorna il timestamp dell'ultima notifica"""
@@ -116,7 +313,7 @@ class DatabaseManager:
                 {"$set": {"ultima_notifica": timestamp}}
             )
         except Exception as e:
-            print(f"❌ Errore aggiornamento ultima_notifica: {e}")
+            log.error("❌ Errore aggiornamento ultima_notifica: %s", e, extra=campi(alimento_id=str(alimento_id)))
     
     @staticmethod
     def get_alimenti_per_reminder(giorno_attuale, ora_formattata):
@@ -146,6 +343,17 @@ class DatabaseManager:
             "user_id": str(user_id)
         })
     
+    @staticmethod
+    def get_thread_utenti_guild(guild_id):
+        """Thread di tutti gli utenti della guild in una sola query: {user_id: thread_id}"""
+        return {
+            int(documento['user_id']): int(documento['thread_id'])
+            for documento in user_threads_collection.find(
+                {"guild_id": str(guild_id)},
+                {"user_id": 1, "thread_id": 1, "_id": 0}
+            )
+        }
+    
     @staticmethod
     def save_user_thread(guild_id, user_id, channel_id, thread_id):
         """Salva il thread di un utente"""
@@ -164,25 +372,33 @@ class DatabaseManager:
                                orario_notifica, datetime_notifica):
         """Crea una nuova notifica nella coda"""
         try:
-            notification_queue_collection.insert_one({
-                "alimento_id": str(alimento_id),
-                "user_id": str(user_id),
-                "alimento_nome": alimento_nome,
-                "data_notifica": data_notifica,
-                "orario_notifica": orario_notifica,
-                "datetime_notifica": datetime_notifica,
-                "stato": "pending",  # pending, sent, failed, skipped
-                "tentativi": 0,
-                "max_tentativi": 3,
-                "created_at": datetime.now().isoformat(),
-                "sent_at": None,
-                "errore": None
-            })
+            notification_queue_collection.insert_one(DatabaseManager._documento_notifica(
+                alimento_id, user_id, alimento_nome, data_notifica, orario_notifica, datetime_notifica
+            ))
             return True
         except Exception as e:
-            print(f"❌ Errore creazione notifica in coda: {e}")
+            log.error("❌ Errore creazione notifica in coda: %s", e,
+                      extra=campi(alimento_id=str(alimento_id), user_id=str(user_id)))
             return False
     
+    @staticmethod
+    def _documento_notifica(alimento_id, user_id, alimento_nome, data_notifica,
+                            orario_notifica, datetime_notifica):
+        return {
+            "alimento_id": str(alimento_id),
+            "user_id": str(user_id),
+            "alimento_nome": alimento_nome,
+            "data_notifica": data_notifica,
+            "orario_notifica": orario_notifica,
+            "datetime_notifica": datetime_notifica,
+            "stato": "pending",  # pending, sent, failed, skipped
+            "tentativi": 0,
+            "max_tentativi": 3,
+            "created_at": datetime.now().isoformat(),
+            "sent_at": None,
+            "errore": None
+        }
+    
     @staticmethod
     def notifica_in_coda_esiste(alimento_id, data_notifica):
         """Controlla se esiste già una notifica in coda per quell'alimento in quella data"""
@@ -215,7 +431,7 @@ class DatabaseManager:
             )
             return True
         except Exception as e:
-            print(f"❌ Errore marca_notifica_come_inviata: {e}")
+            log.error("❌ Errore marca_notifica_come_inviata: %s", e, extra=campi(notifica_id=str(notifica_id)))
             return False
     
     @staticmethod
@@ -231,7 +447,7 @@ class DatabaseManager:
             )
             return True
         except Exception as e:
-            print(f"❌ Errore marca_notifica_come_fallita: {e}")
+            log.error("❌ Errore marca_notifica_come_fallita: %s", e, extra=campi(notifica_id=str(notifica_id)))
             return False
     
     @staticmethod
@@ -247,7 +463,7 @@ class DatabaseManager:
             )
             return True
         except Exception as e:
-            print(f"❌ Errore marca_notifica_come_skipped: {e}")
+            log.error("❌ Errore marca_notifica_come_skipped: %s", e, extra=campi(notifica_id=str(notifica_id)))
             return False
     
     @staticmethod
@@ -263,9 +479,28 @@ class DatabaseManager:
             )
             return True
         except Exception as e:
-            print(f"❌ Errore incrementa_tentativi_notifica: {e}")
+            log.error("❌ Errore incrementa_tentativi_notifica: %s", e, extra=campi(notifica_id=str(notifica_id)))
             return False
     
+    @staticmethod
+    def ping():
+        """Round-trip verso il server Mongo (solleva eccezione se non raggiungibile)"""
+        client.admin.command('ping')
+    
+    @staticmethod
+    def conta_notifiche_per_stato():
+        """Conta le notifiche in coda raggruppate per stato"""
+        try:
+            return {
+                gruppo['_id']: gruppo['count']
+                for gruppo in notification_queue_collection.aggregate([
+                    {"$group": {"_id": "$stato", "count": {"$sum": 1}}}
+                ])
+            }
+        except Exception as e:
+            log.error("❌ Errore conta_notifiche_per_stato: %s", e)
+            return None
+    
     @staticmethod
     def marca_notifiche_failed_per_max_tentativi():
         """Marca come failed le notifiche che hanno superato il max tentativi"""
@@ -276,7 +511,7 @@ class DatabaseManager:
             )
             return result.modified_count
         except Exception as e:
-            print(f"❌ Errore marca_notifiche_failed: {e}")
+            log.error("❌ Errore marca_notifiche_failed: %s", e)
             return 0
     
     @staticmethod
@@ -290,5 +525,86 @@ class DatabaseManager:
             })
             return result.deleted_count
         except Exception as e:
-            print(f"❌ Errore elimina_notifiche_vecchie: {e}")
-            return 0
\ No newline at end of file
+            log.error("❌ Errore elimina_notifiche_vecchie: %s", e)
+            return 0
+
+    @staticmethod
+    def get_trascrizione_cache(audio_hash):
+        """Ottiene una trascrizione salvata tramite hash del contenuto audio"""
+        try:
+            return transcript_cache_collection.find_one({"_id": audio_hash})
+        except Exception as e:
+            log.error("❌ Errore get_trascrizione_cache: %s", e)
+            return None
+    
+    @staticmethod
+    def salva_trascrizione_cache(audio_hash, transcript, info):
+        """Salva (o aggiorna) una trascrizione nella cache persistente"""
+        try:
+            transcript_cache_collection.update_one(
+                {"_id": audio_hash},
+                {"$set": {
+                    "transcript": transcript,
+                    "info": info,
+                    "created_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            log.error("❌ Errore salva_trascrizione_cache: %s", e)
+            return False
+    
+    @staticmethod
+    def crea_indice_ttl_trascrizioni(expire_seconds):
+        """Crea l'indice TTL che fa scadere le trascrizioni in cache"""
+        try:
+            transcript_cache_collection.create_index(
+                [("created_at", ASCENDING)],
+                expireAfterSeconds=expire_seconds
+            )
+        except Exception as e:
+            log.error("❌ Errore creazione indice TTL trascrizioni: %s", e)
+    
+    # ========== METADATI DEL BOT ==========
+    
+    @staticmethod
+    def get_meta(chiave):
+        """Legge un valore dai metadati del bot (None se assente o in errore)"""
+        try:
+            documento = bot_meta_collection.find_one({"_id": chiave})
+            return documento["valore"] if documento else None
+        except Exception as e:
+            log.error("❌ Errore get_meta %s: %s", chiave, e)
+            return None
+    
+    @staticmethod
+    def get_meta_per_prefisso(prefisso):
+        """Metadati con chiave che inizia per prefisso: {chiave: valore}"""
+        try:
+            return {
+                documento["_id"]: documento["valore"]
+                for documento in bot_meta_collection.find({"_id": {"$regex": f"^{re.escape(prefisso)}"}})
+            }
+        except Exception as e:
+            log.error("❌ Errore get_meta_per_prefisso %s: %s", prefisso, e)
+            return {}
+    
+    @staticmethod
+    def salva_meta(chiave, valore):
+        """Salva un valore nei metadati del bot"""
+        try:
+            bot_meta_collection.update_one(
+                {"_id": chiave},
+                {"$set": {"valore": valore, "aggiornato_il": datetime.now()}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            log.error("❌ Errore salva_meta %s: %s", chiave, e)
+            return False
+
+
+# Conteggio chiamate e latenza per metodo, esposti su /metrics
+# e sommati alla traccia dell'interazione in corso
+Metrics.strumenta_classe(DatabaseManager, DB_DURATA, DB_CHIAMATE, DB_ERRORI, osservatore=Tracing.aggiungi_db)
@@ -3,7 +3,12 @@
 
 import discord
 from discord.ext import commands
-from thread_manager import ThreadManager
+from provisioning import ThreadProvisioning
+from thread_manager import ThreadResolver
+from config import NOME_CANALE_LISTA_SPESA
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
 
 
 class BotEvents:
@@ -15,34 +20,48 @@ class BotEvents:
         Registra gli eventi del bot.
         
         NOTA: on_ready è definito in bot.py/main.py per gestire lo scheduler.
-        Qui registriamo solo on_member_join e on_command_error.
+        Qui registriamo on_member_join, on_command_error e gli eventi
+        che invalidano la cache di ThreadResolver.
         """
         
         @bot.event
         async def on_member_join(member):
             """Evento quando un nuovo utente entra nel server"""
-            print(f"👋 Nuovo membro: {member.name} (ID: {member.id})")
+            log_campi = campi(user_id=str(member.id), guild_id=str(member.guild.id))
+            log.info("👋 Nuovo membro: %s", member.name, extra=log_campi)
             
             # Ignora i bot
             if member.bot:
-                print(f"🤖 {member.name} è un bot, lo ignoro")
+                log.debug("🤖 %s è un bot, lo ignoro", member.name, extra=log_campi)
                 return
             
-            try:
-                # Crea il thread privato per l'utente
-                thread = await ThreadManager.crea_thread_utente(member.guild, member)
-                
-                if thread:
-                    print(f"✅ Thread creato con successo per {member.name}")
-                else:
-                    print(f"⚠️ Impossibile creare thread per {member.name}")
-                    
-            except Exception as e:
-                print(f"❌ Errore nella gestione del nuovo membro {member.name}: {e}")
+            # Il thread privato viene creato dalla coda di provisioning,
+            # a velocità controllata anche durante un'ondata di ingressi
+            if ThreadProvisioning.accoda(member.guild.id, member.id):
+                log.info("📥 %s in coda per il thread privato", member.name, extra=log_campi)
+        
+        # ========== INVALIDAZIONE CACHE CANALI/THREAD ==========
+        
+        @bot.event
+        async def on_guild_channel_delete(channel):
+            ThreadResolver.dimentica_canale(channel.guild.id, channel.id)
+        
+        @bot.event
+        async def on_guild_channel_update(before, after):
+            if after.name != NOME_CANALE_LISTA_SPESA:
+                ThreadResolver.dimentica_canale(after.guild.id, after.id)
+        
+        @bot.event
+        async def on_raw_thread_delete(payload):
+            ThreadResolver.dimentica_thread(payload.thread_id)
+        
+        @bot.event
+        async def on_guild_remove(guild):
+            ThreadResolver.dimentica_guild(guild.id)
         
         @bot.event
         async def on_command_error(ctx, error):
             """Gestisce errori nei comandi"""
             if isinstance(error, commands.CommandNotFound):
                 return
-            print(f'Errore: {error}')
\ No newline at end of file
+            log.error("Errore: %s", error)
\ No newline at end of file
@@ -0,0 +1,187 @@
+# food_index.py
+"""Indice in memoria dei nomi degli alimenti per utente (ricerca fuzzy a trigrammi e per prefisso)"""
+
+import asyncio
+import bisect
+import threading
+from collections import Counter
+from config import FUZZY_SOGLIA
+
+
+class _IndiceUtente:
+    """Indice dei nomi di un singolo utente"""
+    __slots__ = ("varianti", "trigrammi", "posting", "ordinati")
+
+    def __init__(self):
+        self.varianti = Counter()  # nome -> numero di varianti (giorno/grammi) con quel nome
+        self.trigrammi = {}        # nome -> frozenset di trigrammi
+        self.posting = {}          # trigramma -> set di nomi che lo contengono
+        self.ordinati = []         # nomi distinti in ordine alfabetico (ricerca per prefisso)
+
+
+class FoodIndex:
+    """
+    Indice fuzzy per utente su nome_alimento.
+
+    Viene caricato da Mongo al primo utilizzo per ogni utente e poi tenuto
+    aggiornato da DatabaseManager a ogni inserimento/rimozione, quindi le
+    ricerche non toccano il database. La similarità è il coefficiente di
+    Dice sui trigrammi: "petto di polo" trova "petto di pollo".
+
+    Per l'autocomplete i nomi sono tenuti anche in una lista ordinata:
+    un prefisso è un intervallo contiguo trovato con bisect.
+
+    Il caricamento è una query completa: dall'event loop va fatto con
+    await carica() prima delle ricerche. I nomi inseriti mentre è in corso
+    vengono applicati all'indice appena caricato, non persi.
+    """
+
+    _utenti = {}  # user_id -> _IndiceUtente
+    _in_caricamento = {}  # user_id -> nomi inseriti durante il caricamento
+    _lock = threading.Lock()
+
+    @staticmethod
+    def normalizza(nome: str) -> str:
+        """Minuscolo e spazi compattati: la forma usata per chiavi e confronti"""
+        return " ".join(nome.lower().split())
+
+    @staticmethod
+    def trigrammi(nome: str) -> frozenset:
+        """Trigrammi del nome normalizzato, con padding per pesare inizio e fine"""
+        testo = f"  {FoodIndex.normalizza(nome)} "
+        return frozenset(testo[i:i + 3] for i in range(len(testo) - 2))
+
+    @staticmethod
+    async def carica(user_id):
+        """Carica l'indice dell'utente in un thread (nulla da fare se è già in memoria)"""
+        if not FoodIndex.indicizzato(user_id):
+            await asyncio.to_thread(FoodIndex._indice, user_id)
+
+    @staticmethod
+    def aggiungi(user_id, nome: str):
+        """Registra una variante con questo nome (se l'utente è indicizzato o in caricamento)"""
+        with FoodIndex._lock:
+            indice = FoodIndex._utenti.get(str(user_id))
+            if indice is not None:
+                FoodIndex._aggiungi_nome(indice, nome)
+            elif str(user_id) in FoodIndex._in_caricamento:
+                FoodIndex._in_caricamento[str(user_id)].append(nome)
+
+    @staticmethod
+    def invalida(user_id):
+        """Scarta l'indice dell'utente: verrà ricaricato alla prossima ricerca"""
+        with FoodIndex._lock:
+            FoodIndex._utenti.pop(str(user_id), None)
+
+    @staticmethod
+    def indicizzato(user_id) -> bool:
+        """True se l'indice dell'utente è già in memoria (nessuna query alla prossima ricerca)"""
+        return str(user_id) in FoodIndex._utenti
+
+    @staticmethod
+    def esiste(user_id, nome: str) -> bool:
+        """True se l'utente ha almeno un alimento con esattamente questo nome"""
+        return FoodIndex.normalizza(nome) in FoodIndex._indice(user_id).varianti
+
+    @staticmethod
+    def nomi(user_id) -> list:
+        """Tutti i nomi distinti dell'utente, in ordine alfabetico"""
+        return list(FoodIndex._indice(user_id).ordinati)
+
+    @staticmethod
+    def completa(user_id, prefisso: str, limite: int = 25) -> list:
+        """
+        Suggerimenti per l'autocomplete: prima i nomi che iniziano con il
+        testo digitato, poi (se ne restano) quelli simili.
+        """
+        prefisso = FoodIndex.normalizza(prefisso)
+        ordinati = FoodIndex._indice(user_id).ordinati
+
+        inizio = bisect.bisect_left(ordinati, prefisso)
+        risultati = []
+        for nome in ordinati[inizio:inizio + limite]:
+            if not nome.startswith(prefisso):
+                break
+            risultati.append(nome)
+
+        if len(risultati) < limite and len(prefisso) >= 3:
+            for nome, _ in FoodIndex.trova_simili(user_id, prefisso, limite=limite):
+                if nome not in risultati:
+                    risultati.append(nome)
+                    if len(risultati) == limite:
+                        break
+        return risultati
+
+    @staticmethod
+    def trova_simili(user_id, nome: str, limite: int = 3, soglia: float = FUZZY_SOGLIA) -> list:
+        """
+        Nomi esistenti simili a quello dato, in ordine di similarità.
+
+        Ritorna una lista di tuple (nome, punteggio) con punteggio >= soglia.
+        """
+        nome = FoodIndex.normalizza(nome)
+        indice = FoodIndex._indice(user_id)
+
+        if nome in indice.varianti:
+            return [(nome, 1.0)]
+
+        cercati = FoodIndex.trigrammi(nome)
+        condivisi = Counter()
+        for trigramma in cercati:
+            for candidato in indice.posting.get(trigramma, ()):
+                condivisi[candidato] += 1
+
+        risultati = []
+        for candidato, comuni in condivisi.items():
+            punteggio = 2 * comuni / (len(cercati) + len(indice.trigrammi[candidato]))
+            if punteggio >= soglia:
+                risultati.append((candidato, punteggio))
+
+        risultati.sort(key=lambda r: r[1], reverse=True)
+        return risultati[:limite]
+
+    @staticmethod
+    def miglior_corrispondenza(user_id, nome: str):
+        """Il nome esistente più simile (o None se nessuno supera la soglia)"""
+        simili = FoodIndex.trova_simili(user_id, nome, limite=1)
+        return simili[0][0] if simili else None
+
+    @staticmethod
+    def _indice(user_id) -> _IndiceUtente:
+        """Indice dell'utente, caricato da Mongo se non ancora presente"""
+        user_id = str(user_id)
+        indice = FoodIndex._utenti.get(user_id)
+        if indice is not None:
+            return indice
+
+        # Import qui per evitare circular import (database aggiorna l'indice)
+        from database import DatabaseManager
+
+        with FoodIndex._lock:
+            FoodIndex._in_caricamento.setdefault(user_id, [])
+
+        indice = _IndiceUtente()
+        for nome in DatabaseManager.get_nomi_alimenti_utente(user_id):
+            FoodIndex._aggiungi_nome(indice, nome)
+
+        with FoodIndex._lock:
+            indice = FoodIndex._utenti.setdefault(user_id, indice)
+            # Inserimenti arrivati durante la query: la lettura può averli visti o no
+            for nome in FoodIndex._in_caricamento.pop(user_id, []):
+                if FoodIndex.normalizza(nome) not in indice.varianti:
+                    FoodIndex._aggiungi_nome(indice, nome)
+            return indice
+
+    @staticmethod
+    def _aggiungi_nome(indice: _IndiceUtente, nome: str):
+        """Aggiunge una variante all'indice"""
+        nome = FoodIndex.normalizza(nome)
+        indice.varianti[nome] += 1
+        if nome in indice.trigrammi:
+            return
+
+        trigrammi = FoodIndex.trigrammi(nome)
+        indice.trigrammi[nome] = trigrammi
+        for trigramma in trigrammi:
+            indice.posting.setdefault(trigramma, set()).add(nome)
+        bisect.insort(indice.ordinati, nome)
@@ -0,0 +1,95 @@
+# lista_renderer.py
+"""Costruzione degli embed di /lista, raggruppati per giorno e divisi ai limiti di Discord"""
+
+import discord
+from config import GIORNI
+
+# Limiti di Discord per gli embed
+LIMITE_VALORE_FIELD = 1024
+LIMITE_FIELD = 25
+LIMITE_CARATTERI_MESSAGGIO = 6000  # Somma di titolo, descrizione, field e footer di tutti gli embed
+
+TITOLO = "🧊 Il Tuo Freezer"
+RISERVA_FOOTER = 32  # Spazio per "Pagina N/M"
+
+
+class ListaRenderer:
+    """
+    Rende la lista degli alimenti in uno o più embed.
+
+    Un solo passaggio raggruppa gli alimenti per giorno; le righe di ogni
+    giorno vengono impacchettate in field da al massimo 1024 caratteri e i
+    field in embed da al massimo 25 field e 6000 caratteri. Il limite dei
+    6000 caratteri vale per tutti gli embed di un messaggio, quindi ogni
+    embed restituito va inviato in un messaggio a sé.
+    """
+
+    @staticmethod
+    def raggruppa(alimenti) -> dict:
+        """{giorno: [righe]} in un solo passaggio, giorni in ordine"""
+        per_giorno = {giorno: [] for giorno in GIORNI}
+        for a in alimenti:
+            riga = f"• **{a['nome_alimento'].capitalize()}**: {a['quantita']} {a.get('unita', 'pz')}"
+            per_giorno[a['scongela_per_giorno']].append(riga[:LIMITE_VALORE_FIELD])
+        return {giorno: righe for giorno, righe in per_giorno.items() if righe}
+
+    @staticmethod
+    def field(nome_giorno: str, righe: list):
+        """Divide le righe di un giorno in field (nome, valore) entro LIMITE_VALORE_FIELD"""
+        blocco = []
+        lunghezza = 0
+        nome = f"📅 {nome_giorno}"
+        for riga in righe:
+            # +1 per il separatore "\n"
+            if blocco and lunghezza + 1 + len(riga) > LIMITE_VALORE_FIELD:
+                yield nome, "\n".join(blocco)
+                nome = f"📅 {nome_giorno} (continua)"
+                blocco = []
+                lunghezza = 0
+            lunghezza += len(riga) + (1 if blocco else 0)
+            blocco.append(riga)
+        if blocco:
+            yield nome, "\n".join(blocco)
+
+    @staticmethod
+    def crea_embed(alimenti, nota_pagine: str = "") -> list:
+        """
+        Embed della lista (uno per messaggio); quello vuoto se non ci sono alimenti.
+
+        nota_pagine viene aggiunta al footer "Pagina N/M" quando le pagine
+        sono più di una, ed è contata nei 6000 caratteri di ogni embed.
+        """
+        if not alimenti:
+            return [discord.Embed(
+                title=TITOLO,
+                description="Il freezer è vuoto! Usa **➕ Aggiungi** per iniziare.",
+                color=discord.Color.blue()
+            )]
+
+        descrizione = f"Hai **{len(alimenti)}** alimenti salvati:"
+        pagine = [[]]  # Field di ogni embed
+        riserva = RISERVA_FOOTER + len(nota_pagine)
+        caratteri = len(TITOLO) + len(descrizione) + riserva
+
+        for giorno, righe in ListaRenderer.raggruppa(alimenti).items():
+            for nome, valore in ListaRenderer.field(GIORNI[giorno], righe):
+                dimensione = len(nome) + len(valore)
+                if len(pagine[-1]) == LIMITE_FIELD or caratteri + dimensione > LIMITE_CARATTERI_MESSAGGIO:
+                    pagine.append([])
+                    caratteri = len(TITOLO) + riserva
+                pagine[-1].append((nome, valore))
+                caratteri += dimensione
+
+        embeds = []
+        for numero, campi in enumerate(pagine, 1):
+            embed = discord.Embed(
+                title=TITOLO,
+                description=descrizione if numero == 1 else None,
+                color=discord.Color.blue()
+            )
+            for nome, valore in campi:
+                embed.add_field(name=nome, value=valore, inline=False)
+            if len(pagine) > 1:
+                embed.set_footer(text=f"Pagina {numero}/{len(pagine)}{nota_pagine}")
+            embeds.append(embed)
+        return embeds
@@ -0,0 +1,216 @@
+# loop_watchdog.py
+"""Watchdog dell'event loop: rileva i blocchi e cattura lo stack del chiamante"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from config import WATCHDOG_SOGLIA_MS, WATCHDOG_INTERVALLO_MS
+from metrics import Counter as CounterMetrica, Histogram
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+MAX_HOTSPOT = 200
+MAX_RECENTI = 50
+RIGHE_STACK = 15
+
+BLOCCHI_LOOP = CounterMetrica(
+    "freezerbot_event_loop_blocks_total", "Blocchi dell'event loop oltre la soglia del watchdog"
+)
+DURATA_BLOCCHI = Histogram(
+    "freezerbot_event_loop_block_seconds", "Durata dei blocchi dell'event loop",
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class _Blocco:
+    """Blocco in corso: campioni dello stack raccolti finché il loop non riparte"""
+    __slots__ = ("inizio", "siti", "chiamate", "stack")
+
+    def __init__(self, inizio):
+        self.inizio = inizio
+        self.siti = Counter()     # sito nel nostro codice -> campioni
+        self.chiamate = Counter()  # frame più interno (spesso una libreria) -> campioni
+        self.stack = {}            # sito -> stack del primo campione
+
+
+class LoopWatchdog:
+    """
+    Thread che misura la reattività dell'event loop.
+
+    Un task sul loop aggiorna un battito ogni WATCHDOG_INTERVALLO_MS; il
+    thread controlla il battito con la stessa cadenza e, se è in ritardo
+    più di WATCHDOG_SOGLIA_MS, campiona lo stack del thread del loop con
+    sys._current_frames. A blocco finito registra durata e sito più
+    campionato: il frame più interno che appartiene al bot (es. una
+    chiamata pymongo dentro un comando), più il frame effettivamente in
+    esecuzione. I siti vengono aggregati e ordinati per tempo totale.
+    """
+
+    _thread = None
+    _task = None
+    _stop = threading.Event()
+    _lock = threading.Lock()
+    _thread_loop = None
+    _ultimo_battito = 0.0
+
+    hotspot = {}  # sito -> statistiche aggregate
+    recenti = deque(maxlen=MAX_RECENTI)
+    blocchi_totali = 0
+
+    @staticmethod
+    def avvia():
+        """Avvia battito e thread di controllo (da chiamare nel thread del loop)"""
+        if LoopWatchdog._thread is not None:
+            return
+        LoopWatchdog._thread_loop = threading.get_ident()
+        LoopWatchdog._ultimo_battito = time.monotonic()
+        LoopWatchdog._stop.clear()
+        LoopWatchdog._task = asyncio.create_task(LoopWatchdog._battito())
+        LoopWatchdog._thread = threading.Thread(
+            target=LoopWatchdog._controlla, name="loop-watchdog", daemon=True
+        )
+        LoopWatchdog._thread.start()
+        log.info("🐕 Watchdog event loop avviato (soglia %.0fms)", WATCHDOG_SOGLIA_MS)
+
+    @staticmethod
+    def ferma():
+        LoopWatchdog._stop.set()
+        if LoopWatchdog._task:
+            LoopWatchdog._task.cancel()
+            LoopWatchdog._task = None
+        LoopWatchdog._thread = None
+
+    @staticmethod
+    async def _battito():
+        intervallo = WATCHDOG_INTERVALLO_MS / 1000
+        while True:
+            LoopWatchdog._ultimo_battito = time.monotonic()
+            await asyncio.sleep(intervallo)
+
+    @staticmethod
+    def _controlla():
+        """Ciclo del thread watchdog"""
+        intervallo = WATCHDOG_INTERVALLO_MS / 1000
+        soglia = WATCHDOG_SOGLIA_MS / 1000
+        blocco = None
+
+        while not LoopWatchdog._stop.wait(intervallo):
+            ultimo = LoopWatchdog._ultimo_battito
+            ritardo = time.monotonic() - ultimo - intervallo
+
+            if ritardo > soglia:
+                if blocco is None:
+                    blocco = _Blocco(ultimo + intervallo)
+                LoopWatchdog._campiona(blocco)
+            elif blocco is not None:
+                # Il loop è ripartito: il battito segna la fine del blocco
+                LoopWatchdog._registra(blocco, ultimo - blocco.inizio)
+                blocco = None
+
+    @staticmethod
+    def _campiona(blocco: _Blocco):
+        """Aggiunge al blocco un campione dello stack del thread del loop"""
+        frame = sys._current_frames().get(LoopWatchdog._thread_loop)
+        if frame is None:
+            return
+
+        stack = traceback.extract_stack(frame)
+        if not stack:
+            return
+
+        interno = stack[-1]
+        sito = interno
+        for riga in reversed(stack):
+            if riga.filename.startswith(CARTELLA_PROGETTO) and "site-packages" not in riga.filename:
+                sito = riga
+                break
+
+        chiave = LoopWatchdog._formatta(sito)
+        blocco.siti[chiave] += 1
+        blocco.chiamate[LoopWatchdog._formatta(interno)] += 1
+        if chiave not in blocco.stack:
+            blocco.stack[chiave] = [
+                LoopWatchdog._formatta(riga) for riga in stack[-RIGHE_STACK:]
+            ]
+
+    @staticmethod
+    def _formatta(riga) -> str:
+        percorso = os.path.relpath(riga.filename, CARTELLA_PROGETTO)
+        if percorso.startswith(".."):
+            percorso = riga.filename
+        return f"{percorso}:{riga.lineno} in {riga.name}"
+
+    @staticmethod
+    def _registra(blocco: _Blocco, durata: float):
+        """Aggrega un blocco concluso negli hotspot"""
+        BLOCCHI_LOOP.inc()
+        DURATA_BLOCCHI.observe(durata)
+
+        if not blocco.siti:
+            return
+
+        sito = blocco.siti.most_common(1)[0][0]
+        chiamata = blocco.chiamate.most_common(1)[0][0]
+
+        with LoopWatchdog._lock:
+            LoopWatchdog.blocchi_totali += 1
+            LoopWatchdog.recenti.append({
+                "sito": sito,
+                "chiamata": chiamata,
+                "durata_ms": round(durata * 1000, 1),
+                "quando": time.time()
+            })
+
+            statistiche = LoopWatchdog.hotspot.get(sito)
+            if statistiche is None:
+                if len(LoopWatchdog.hotspot) >= MAX_HOTSPOT:
+                    return
+                statistiche = LoopWatchdog.hotspot[sito] = {
+                    "sito": sito,
+                    "blocchi": 0,
+                    "totale_ms": 0.0,
+                    "max_ms": 0.0,
+                    "chiamate": Counter(),
+                    "stack": blocco.stack[sito]
+                }
+            statistiche["blocchi"] += 1
+            statistiche["totale_ms"] += durata * 1000
+            statistiche["max_ms"] = max(statistiche["max_ms"], durata * 1000)
+            statistiche["chiamate"][chiamata] += 1
+
+        log.warning(
+            "🐢 Event loop bloccato per %.0fms in %s (%s)", durata * 1000, sito, chiamata,
+            extra=campi(sito=sito, chiamata=chiamata, latency_ms=round(durata * 1000, 1))
+        )
+
+    @staticmethod
+    def report(limite: int = 20) -> dict:
+        """Hotspot ordinati per tempo totale di blocco, più i blocchi recenti"""
+        with LoopWatchdog._lock:
+            hotspot = [
+                {
+                    **s,
+                    "totale_ms": round(s["totale_ms"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                    "medio_ms": round(s["totale_ms"] / s["blocchi"], 1),
+                    "chiamate": dict(s["chiamate"].most_common(5))
+                }
+                for s in LoopWatchdog.hotspot.values()
+            ]
+            recenti = list(LoopWatchdog.recenti)
+            totali = LoopWatchdog.blocchi_totali
+
+        hotspot.sort(key=lambda s: s["totale_ms"], reverse=True)
+        return {
+            "attivo": LoopWatchdog._thread is not None,
+            "soglia_ms": WATCHDOG_SOGLIA_MS,
+            "blocchi_totali": totali,
+            "hotspot": hotspot[:limite],
+            "recenti": recenti[::-1]
+        }
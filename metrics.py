@@ -0,0 +1,310 @@
+# metrics.py
+"""Metriche in memoria esposte in formato Prometheus su /metrics"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from config import METRICS_REFRESH_INTERVAL
+
+DURATA_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+VOICE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _formatta_labels(nomi, valori, extra=None):
+    """Formatta {nome="valore",...} con l'escape richiesto dal formato testuale"""
+    coppie = list(zip(nomi, valori))
+    if extra:
+        coppie.append(extra)
+    if not coppie:
+        return ""
+    parti = []
+    for nome, valore in coppie:
+        valore = str(valore).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parti.append(f'{nome}="{valore}"')
+    return "{" + ",".join(parti) + "}"
+
+
+def _formatta_valore(valore):
+    if valore == float("inf"):
+        return "+Inf"
+    return repr(float(valore))
+
+
+class Metrica:
+    """
+    Base per le metriche: un valore per ogni combinazione di label.
+
+    Se viene passata una funzione, il valore viene letto al momento dello
+    scrape (utile per valori già tenuti altrove, es. RSS o latenza gateway).
+    La funzione può ritornare un numero o un dict {tupla_label: valore}.
+    """
+    tipo = "untyped"
+
+    def __init__(self, nome, descrizione, labels=(), funzione=None):
+        self.nome = nome
+        self.descrizione = descrizione
+        self.labels = tuple(labels)
+        self.funzione = funzione
+        self._valori = {}
+        self._lock = threading.Lock()
+        Metrics.registra(self)
+
+    def _chiave(self, labels):
+        return tuple(str(labels[nome]) for nome in self.labels)
+
+    def campioni(self):
+        """Coppie (suffisso+labels, valore) da esportare"""
+        if self.funzione:
+            try:
+                valori = self.funzione()
+            except Exception:
+                return []
+            if valori is None:
+                return []
+            if not isinstance(valori, dict):
+                valori = {(): valori}
+        else:
+            with self._lock:
+                valori = dict(self._valori)
+        return [(_formatta_labels(self.labels, chiave), valore) for chiave, valore in valori.items()]
+
+    def esporta(self):
+        righe = [f"# HELP {self.nome} {self.descrizione}", f"# TYPE {self.nome} {self.tipo}"]
+        for labels, valore in self.campioni():
+            righe.append(f"{self.nome}{labels} {_formatta_valore(valore)}")
+        return righe
+
+
+class Counter(Metrica):
+    """Contatore monotono"""
+    tipo = "counter"
+
+    def inc(self, quantita=1, **labels):
+        chiave = self._chiave(labels)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0) + quantita
+
+
+class Gauge(Metrica):
+    """Valore che può salire e scendere"""
+    tipo = "gauge"
+
+    def set(self, valore, **labels):
+        with self._lock:
+            self._valori[self._chiave(labels)] = valore
+
+    def inc(self, quantita=1, **labels):
+        chiave = self._chiave(labels)
+        with self._lock:
+            self._valori[chiave] = self._valori.get(chiave, 0) + quantita
+
+    def dec(self, quantita=1, **labels):
+        self.inc(-quantita, **labels)
+
+
+class Histogram(Metrica):
+    """Istogramma a bucket fissi (cumulativi all'esportazione)"""
+    tipo = "histogram"
+
+    def __init__(self, nome, descrizione, labels=(), buckets=DURATA_BUCKETS):
+        super().__init__(nome, descrizione, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, valore, **labels):
+        chiave = self._chiave(labels)
+        with self._lock:
+            stato = self._valori.get(chiave)
+            if stato is None:
+                stato = self._valori[chiave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valore <= limite:
+                    stato[0][i] += 1
+                    break
+            stato[1] += valore
+            stato[2] += 1
+
+    def esporta(self):
+        righe = [f"# HELP {self.nome} {self.descrizione}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            valori = {chiave: (list(s[0]), s[1], s[2]) for chiave, s in self._valori.items()}
+        for chiave, (conteggi, somma, totale) in valori.items():
+            cumulato = 0
+            for limite, conteggio in zip(self.buckets, conteggi):
+                cumulato += conteggio
+                labels = _formatta_labels(self.labels, chiave, ("le", _formatta_valore(limite)))
+                righe.append(f"{self.nome}_bucket{labels} {cumulato}")
+            labels = _formatta_labels(self.labels, chiave, ("le", "+Inf"))
+            righe.append(f"{self.nome}_bucket{labels} {totale}")
+            labels = _formatta_labels(self.labels, chiave)
+            righe.append(f"{self.nome}_sum{labels} {_formatta_valore(somma)}")
+            righe.append(f"{self.nome}_count{labels} {totale}")
+        return righe
+
+
+def memoria_residente_bytes():
+    """Memoria residente del processo in byte"""
+    try:
+        with open("/proc/self/statm") as f:
+            pagine_residenti = int(f.read().split()[1])
+        return pagine_residenti * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Metrics:
+    """Registro delle metriche e monitor in background"""
+
+    _registro = []
+    _bot = None
+    _task = []
+
+    @staticmethod
+    def registra(metrica):
+        Metrics._registro.append(metrica)
+
+    @staticmethod
+    def esporta() -> str:
+        """Testo in formato di esposizione Prometheus (nessuna query a Mongo)"""
+        righe = []
+        for metrica in Metrics._registro:
+            righe.extend(metrica.esporta())
+        return "\n".join(righe) + "\n"
+
+    @staticmethod
+    def avvia(bot):
+        """Avvia i monitor in background (lag event loop, profondità coda notifiche)"""
+        Metrics._bot = bot
+        if not Metrics._task:
+            Metrics._task = [
+                asyncio.create_task(Metrics._monitora_event_loop()),
+                asyncio.create_task(Metrics._aggiorna_coda_notifiche())
+            ]
+
+    @staticmethod
+    def ferma():
+        for task in Metrics._task:
+            task.cancel()
+        Metrics._task = []
+
+    @staticmethod
+    async def _monitora_event_loop(intervallo=0.5):
+        """Misura di quanto il loop ritarda un risveglio programmato"""
+        while True:
+            inizio = time.perf_counter()
+            await asyncio.sleep(intervallo)
+            lag = max(0.0, time.perf_counter() - inizio - intervallo)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_ULTIMO.set(lag)
+
+    @staticmethod
+    async def _aggiorna_coda_notifiche():
+        """Una aggregazione ogni METRICS_REFRESH_INTERVAL, mai per scrape"""
+        # Import qui per evitare circular import (database usa le metriche)
+        from database import DatabaseManager
+
+        while True:
+            conteggi = await asyncio.to_thread(DatabaseManager.conta_notifiche_per_stato)
+            if conteggi is not None:
+                for stato in ("pending", "sent", "failed", "skipped"):
+                    CODA_NOTIFICHE.set(conteggi.get(stato, 0), stato=stato)
+            await asyncio.sleep(METRICS_REFRESH_INTERVAL)
+
+    @staticmethod
+    def strumenta_classe(classe, durata, chiamate, errori, osservatore=None):
+        """
+        Avvolge ogni staticmethod della classe misurando chiamate, errori e durata.
+
+        Se passato, osservatore(secondi) viene chiamato dopo ogni chiamata.
+        """
+        for nome, attributo in list(vars(classe).items()):
+            if not isinstance(attributo, staticmethod) or nome.startswith("_"):
+                continue
+            setattr(classe, nome, staticmethod(
+                Metrics._strumenta(attributo.__func__, nome, durata, chiamate, errori, osservatore)
+            ))
+
+    @staticmethod
+    def _strumenta(funzione, nome, durata, chiamate, errori, osservatore=None):
+        @functools.wraps(funzione)
+        def wrapper(*args, **kwargs):
+            inizio = time.perf_counter()
+            try:
+                return funzione(*args, **kwargs)
+            except Exception:
+                errori.inc(metodo=nome)
+                raise
+            finally:
+                secondi = time.perf_counter() - inizio
+                durata.observe(secondi, metodo=nome)
+                chiamate.inc(metodo=nome)
+                if osservatore:
+                    osservatore(secondi)
+        return wrapper
+
+
+def _latenza_gateway():
+    bot = Metrics._bot
+    if bot is None or bot.latency != bot.latency:  # NaN prima della connessione
+        return None
+    return bot.latency
+
+
+def _cache_trascrizioni(campo):
+    def leggi():
+        # Import qui: transcript_cache importa database, che importa metrics
+        from transcript_cache import TranscriptCache
+        statistiche = TranscriptCache.statistiche()
+        if campo == "hit_ratio":
+            return {("transcript",): statistiche["hit_rate"]}
+        return {("transcript", "hit"): statistiche["hits"], ("transcript", "miss"): statistiche["misses"]}
+    return leggi
+
+
+# =========================
+# Metriche del bot
+# =========================
+EVENT_LOOP_LAG = Histogram(
+    "freezerbot_event_loop_lag_seconds", "Ritardo dell'event loop su un risveglio programmato"
+)
+EVENT_LOOP_LAG_ULTIMO = Gauge(
+    "freezerbot_event_loop_lag_last_seconds", "Ultimo ritardo misurato dell'event loop"
+)
+GATEWAY_LATENCY = Gauge(
+    "freezerbot_gateway_latency_seconds", "Latenza heartbeat del gateway Discord", funzione=_latenza_gateway
+)
+DB_CHIAMATE = Counter(
+    "freezerbot_db_calls_total", "Chiamate a DatabaseManager", labels=("metodo",)
+)
+DB_ERRORI = Counter(
+    "freezerbot_db_errors_total", "Eccezioni sollevate da DatabaseManager", labels=("metodo",)
+)
+DB_DURATA = Histogram(
+    "freezerbot_db_call_duration_seconds", "Durata delle chiamate a DatabaseManager", labels=("metodo",)
+)
+CODA_NOTIFICHE = Gauge(
+    "freezerbot_notification_queue", "Notifiche in coda per stato", labels=("stato",)
+)
+DM_INVIATI = Counter(
+    "freezerbot_dm_sent_total", "Messaggi privati inviati", labels=("tipo",)
+)
+DM_FALLITI = Counter(
+    "freezerbot_dm_failed_total", "Messaggi privati non consegnati", labels=("tipo", "motivo")
+)
+VOICE_DURATA = Histogram(
+    "freezerbot_voice_job_seconds", "Durata delle fasi della pipeline vocale", labels=("fase",),
+    buckets=VOICE_BUCKETS
+)
+CACHE_HIT_RATIO = Gauge(
+    "freezerbot_cache_hit_ratio", "Frazione di richieste servite dalla cache", labels=("cache",),
+    funzione=_cache_trascrizioni("hit_ratio")
+)
+CACHE_RICHIESTE = Counter(
+    "freezerbot_cache_requests_total", "Richieste alla cache per esito", labels=("cache", "esito"),
+    funzione=_cache_trascrizioni("richieste")
+)
+PROCESS_RSS = Gauge(
+    "freezerbot_process_resident_memory_bytes", "Memoria residente del processo", funzione=memoria_residente_bytes
+)
@@ -1,8 +1,15 @@
+import atexit
 import logging
+import queue
+import random
 import sys
 import os
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timezone
+from bson import ObjectId, json_util
 from pymongo import MongoClient, ASCENDING
+from pymongo.errors import BulkWriteError
 
 
 # Recupera URI MongoDB dall'env
@@ -10,17 +17,167 @@ MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DB_NAME = "freezer-bot"
 COLLECTION_NAME = "logs"
 
+# Buffer dei log: i record vengono scritti su Mongo a blocchi da un thread dedicato
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 10000))        # record massimi in coda
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 200))            # record per insert_many
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 2.0))  # secondi massimi in coda
+LOG_DROP_POLICY = os.getenv("LOG_DROP_POLICY", "drop_newest")     # drop_newest | drop_oldest | block
+
+# Livelli e campionamento
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))  # frazione di DEBUG conservata
+
+# Spool su disco quando Mongo non è raggiungibile
+LOG_SPOOL_PATH = os.getenv("LOG_SPOOL_PATH", "./log_spool/mongo_logs.jsonl")
+LOG_SPOOL_MAX_BYTES = int(os.getenv("LOG_SPOOL_MAX_BYTES", 5 * 1024 * 1024))  # rotazione per dimensione
+LOG_SPOOL_MAX_FILES = int(os.getenv("LOG_SPOOL_MAX_FILES", 20))               # file ruotati conservati
+LOG_REPLAY_INTERVAL = float(os.getenv("LOG_REPLAY_INTERVAL", 15.0))           # secondi tra tentativi di replay
+LOG_MONGO_TIMEOUT_MS = int(os.getenv("LOG_MONGO_TIMEOUT_MS", 2000))           # server selection del client log
+LOG_BREAKER_SOGLIA = int(os.getenv("LOG_BREAKER_SOGLIA", 3))                  # fallimenti prima di aprire
+LOG_BREAKER_RESET = float(os.getenv("LOG_BREAKER_RESET", 30.0))               # secondi prima di riprovare
+
+
+# =========================
+# Circuit breaker
+# =========================
+class CircuitBreaker:
+    """
+    Decide se tentare Mongo o andare direttamente sullo spool.
+
+    - closed: Mongo sano, si scrive normalmente
+    - open: troppi fallimenti consecutivi, si va sullo spool senza tentare
+    - half_open: passato il tempo di reset, un solo tentativo di prova
+    """
+
+    def __init__(self, soglia=LOG_BREAKER_SOGLIA, reset_dopo=LOG_BREAKER_RESET):
+        self.soglia = soglia
+        self.reset_dopo = reset_dopo
+        self.stato = "closed"
+        self.fallimenti = 0
+        self._aperto_il = 0.0
+        self._lock = threading.Lock()
+
+    def consenti(self):
+        """True se si può tentare una scrittura su Mongo (non blocca mai)"""
+        with self._lock:
+            if self.stato == "closed":
+                return True
+            if self.stato == "open" and time.monotonic() - self._aperto_il >= self.reset_dopo:
+                self.stato = "half_open"
+                return True
+            return False
+
+    def successo(self):
+        with self._lock:
+            self.stato = "closed"
+            self.fallimenti = 0
+
+    def fallimento(self):
+        with self._lock:
+            self.fallimenti += 1
+            if self.stato == "half_open" or self.fallimenti >= self.soglia:
+                self.stato = "open"
+                self._aperto_il = time.monotonic()
+
+
+# =========================
+# Spool su disco
+# =========================
+class SpoolFile:
+    """
+    File append-only (una riga JSON esteso per record), ruotato per dimensione.
+
+    Il file corrente si chiama LOG_SPOOL_PATH; quando supera max_bytes viene
+    rinominato con un suffisso crescente e diventa pronto per il replay.
+    Oltre max_files ruotati, i più vecchi vengono eliminati.
+    """
+
+    def __init__(self, percorso=LOG_SPOOL_PATH, max_bytes=LOG_SPOOL_MAX_BYTES, max_files=LOG_SPOOL_MAX_FILES):
+        self.percorso = percorso
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(percorso) or ".", exist_ok=True)
+
+    def scrivi(self, documenti):
+        """Accoda i documenti al file corrente"""
+        righe = "".join(json_util.dumps(doc) + "\n" for doc in documenti)
+        with self._lock:
+            with open(self.percorso, "a", encoding="utf-8") as f:
+                f.write(righe)
+            if os.path.getsize(self.percorso) >= self.max_bytes:
+                self._ruota()
+
+    def file_da_riprodurre(self):
+        """File ruotati in ordine cronologico (il corrente viene ruotato prima)"""
+        with self._lock:
+            if os.path.exists(self.percorso) and os.path.getsize(self.percorso) > 0:
+                self._ruota()
+            return self._ruotati()
+
+    def ha_dati(self):
+        return bool(self._ruotati()) or (
+            os.path.exists(self.percorso) and os.path.getsize(self.percorso) > 0
+        )
+
+    @staticmethod
+    def leggi(percorso):
+        with open(percorso, encoding="utf-8") as f:
+            return [json_util.loads(riga) for riga in f if riga.strip()]
+
+    def _ruotati(self):
+        cartella = os.path.dirname(self.percorso) or "."
+        prefisso = os.path.basename(self.percorso) + "."
+        return sorted(
+            os.path.join(cartella, nome)
+            for nome in os.listdir(cartella)
+            if nome.startswith(prefisso) and nome[len(prefisso):].isdigit()
+        )
+
+    def _ruota(self):
+        os.replace(self.percorso, f"{self.percorso}.{time.time_ns():020d}")
+        ruotati = self._ruotati()
+        for vecchio in ruotati[:max(0, len(ruotati) - self.max_files)]:
+            os.remove(vecchio)
+
 # =========================
 # MongoDB Handler
 # =========================
 class MongoHandler(logging.Handler):
-    """Custom logging handler that saves logs to MongoDB"""
+    """
+    Custom logging handler that saves logs to MongoDB.
+
+    emit() mette il record in una coda in memoria e ritorna subito; un thread
+    in background li scrive con insert_many quando il blocco è pieno
+    (LOG_BATCH_SIZE) o quando è passato LOG_FLUSH_INTERVAL. Se la coda è piena
+    si applica LOG_DROP_POLICY, così il logging non blocca mai l'event loop.
+
+    Se Mongo è lento o giù, il circuit breaker manda i blocchi sullo spool su
+    disco; un secondo thread li reinvia con insert_many quando Mongo torna.
+    """
     
-    def __init__(self, mongo_uri=MONGODB_URI, db_name=DB_NAME, collection_name=COLLECTION_NAME):
+    def __init__(self, mongo_uri=MONGODB_URI, db_name=DB_NAME, collection_name=COLLECTION_NAME,
+                 buffer_size=LOG_BUFFER_SIZE, batch_size=LOG_BATCH_SIZE,
+                 flush_interval=LOG_FLUSH_INTERVAL, drop_policy=LOG_DROP_POLICY):
         super().__init__()
-        self.client = MongoClient(mongo_uri)
+        self.client = MongoClient(mongo_uri, serverSelectionTimeoutMS=LOG_MONGO_TIMEOUT_MS)
         self.collection = self.client[db_name][collection_name]
-        self._ensure_ttl_index()
+        
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.coda = queue.Queue(maxsize=buffer_size)
+        self.scartati = 0  # record persi per coda piena
+        self.breaker = CircuitBreaker()
+        self.spool = SpoolFile()
+        
+        self._stop = threading.Event()
+        self._chiuso = False
+        self._worker = threading.Thread(target=self._ciclo_flush, name="mongo-log-flusher", daemon=True)
+        self._worker.start()
+        self._replayer = threading.Thread(target=self._ciclo_replay, name="mongo-log-replayer", daemon=True)
+        self._replayer.start()
+        atexit.register(self.close)
 
     def _ensure_ttl_index(self, expire_seconds=604800):
         """
@@ -33,63 +190,226 @@ class MongoHandler(logging.Handler):
                 expireAfterSeconds=expire_seconds
             )
         except Exception as e:
-            print(f"❌ Errore creazione indice TTL: {e}")
+            self._diagnostica(f"❌ Errore creazione indice TTL: {e}")
 
     def emit(self, record):
+        # _id assegnato subito: anche i record finiti nello spool lo conservano,
+        # così un replay ripetuto li riconosce come duplicati invece di reinserirli
         log_entry = {
+            "_id": ObjectId(),
             "level": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
-            "timestamp": datetime.utcnow()
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc)
         }
+        
+        # Campi strutturati (user_id, alimento_id, job, latency_ms...) come chiavi BSON
+        for chiave, valore in getattr(record, "campi", {}).items():
+            log_entry.setdefault(chiave, valore)
+        
+        if record.exc_info:
+            log_entry["traceback"] = logging.Formatter().formatException(record.exc_info)
+        
+        try:
+            self.coda.put_nowait(log_entry)
+        except queue.Full:
+            self._coda_piena(log_entry)
+
+    def _coda_piena(self, log_entry):
+        """Applica la politica di scarto quando il buffer è pieno"""
+        if self.drop_policy == "block":
+            try:
+                self.coda.put(log_entry, timeout=self.flush_interval)
+                return
+            except queue.Full:
+                pass
+        elif self.drop_policy == "drop_oldest":
+            try:
+                self.coda.get_nowait()
+                self.coda.task_done()
+                self.scartati += 1
+                self.coda.put_nowait(log_entry)
+                return
+            except (queue.Empty, queue.Full):
+                pass
+        self.scartati += 1
+
+    def _ciclo_flush(self):
+        """Thread di scrittura: raccoglie blocchi dalla coda e li invia a Mongo"""
+        self._ensure_ttl_index()
+        
+        while not self._stop.is_set() or not self.coda.empty():
+            batch = self._raccogli_batch()
+            if batch:
+                self._scrivi(batch)
+
+    def _raccogli_batch(self):
+        """Attende il primo record, poi raccoglie fino a batch_size o flush_interval"""
+        try:
+            batch = [self.coda.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        
+        scadenza = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            restante = scadenza - time.monotonic()
+            if restante <= 0 or self._stop.is_set():
+                restante = 0
+            try:
+                batch.append(self.coda.get(timeout=restante) if restante else self.coda.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _scrivi(self, batch):
+        """Scrive un blocco di record con una sola insert_many, o sullo spool se Mongo non è sano"""
         try:
-            self.collection.insert_one(log_entry)
+            if not self.breaker.consenti():
+                self.spool.scrivi(batch)
+                return
+            
+            try:
+                self._inserisci(batch)
+                self.breaker.successo()
+            except Exception as e:
+                self.breaker.fallimento()
+                self._diagnostica(f"❌ Errore salvataggio {len(batch)} log su Mongo, uso lo spool: {e}")
+                self.spool.scrivi(batch)
         except Exception as e:
-            print(f"❌ Errore salvataggio log su Mongo: {e}")
+            self._diagnostica(f"❌ Errore scrittura spool log: {e}")
+        finally:
+            for _ in batch:
+                self.coda.task_done()
+
+    def _inserisci(self, documenti):
+        """insert_many idempotente: gli _id già presenti (replay ripetuti) non sono errori"""
+        try:
+            self.collection.insert_many(documenti, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+
+    def _ciclo_replay(self):
+        """
+        Thread di replay: reinvia lo spool a Mongo quando il breaker lo consente.
+
+        È anche lui a sondare il breaker (half_open dopo LOG_BREAKER_RESET):
+        senza nuovo traffico di log lo spool non verrebbe mai svuotato.
+        """
+        while not self._stop.wait(LOG_REPLAY_INTERVAL):
+            if not self.spool.ha_dati() or not self.breaker.consenti():
+                continue
+            try:
+                for percorso in self.spool.file_da_riprodurre():
+                    documenti = SpoolFile.leggi(percorso)
+                    for i in range(0, len(documenti), self.batch_size):
+                        self._inserisci(documenti[i:i + self.batch_size])
+                    os.remove(percorso)
+                    self._diagnostica(f"✅ Reinviati {len(documenti)} log dallo spool")
+                self.breaker.successo()
+            except Exception as e:
+                self.breaker.fallimento()
+                self._diagnostica(f"⚠️ Replay spool log interrotto: {e}")
+
+    def flush(self, timeout=5.0):
+        """Attende che i record in coda siano stati scritti (al massimo timeout secondi)"""
+        scadenza = time.monotonic() + timeout
+        while self.coda.unfinished_tasks and time.monotonic() < scadenza and self._worker.is_alive():
+            time.sleep(0.01)
+
+    def close(self):
+        """Svuota la coda e ferma il thread di scrittura"""
+        if self._chiuso:
+            return
+        self._chiuso = True
+        self._stop.set()
+        self._worker.join(timeout=self.flush_interval + 5)
+        super().close()
+
+    @staticmethod
+    def _diagnostica(messaggio):
+        """Scrive direttamente su stderr: passare dal logger creerebbe un ciclo"""
+        sys.__stderr__.write(messaggio + "\n")
 
 # =========================
-# Interceptor per print()
+# Campionamento dei log DEBUG
 # =========================
-class PrintInterceptor:
-    """Redirect stdout/stderr to logger"""
-    def __init__(self, logger):
-        self.logger = logger
+class SamplingFilter(logging.Filter):
+    """Lascia passare solo una frazione dei record DEBUG (gli altri livelli passano tutti)"""
 
-    def write(self, msg):
-        msg = msg.strip()
-        if msg:
-            self.logger.info(msg)
+    def __init__(self, rate=LOG_DEBUG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        # La decisione resta sul record: console e Mongo vedono gli stessi DEBUG
+        if not hasattr(record, "campionato"):
+            record.campionato = random.random() < self.rate
+        return record.campionato
+
+
+# =========================
+# API per i moduli
+# =========================
+def get_logger(nome):
+    """Logger del modulo, figlio di 'discord_bot' (nessun effetto collaterale all'import)"""
+    return logging.getLogger(f"discord_bot.{nome}")
+
+
+def campi(**valori):
+    """
+    Campi strutturati da passare come extra:
+
+        log.info("Notifica inviata: %s", nome, extra=campi(user_id=uid, job="elabora_coda"))
+    """
+    return {"campi": valori}
 
-    def flush(self):
-        pass
 
 # =========================
 # Setup logger globale
 # =========================
 logger = logging.getLogger("discord_bot")
-logger.setLevel(logging.INFO)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s")
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+mongo_handler = None
 
-# Mongo handler
-mongo_handler = MongoHandler()
-mongo_handler.setLevel(logging.INFO)
-mongo_handler.setFormatter(formatter)
-logger.addHandler(mongo_handler)
 
-# Redirect print() e stderr
-sys.stdout = PrintInterceptor(logger)
-sys.stderr = PrintInterceptor(logger)
+def setup_logging():
+    """Configura console + Mongo per tutti i logger 'discord_bot.*' (idempotente)"""
+    global mongo_handler
+    if mongo_handler is not None:
+        return logger
+    
+    livello = getattr(logging, LOG_LEVEL, logging.INFO)
+    logger.setLevel(livello)
+    
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(livello)
+    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s")
+    console_handler.setFormatter(formatter)
+    console_handler.addFilter(SamplingFilter())
+    logger.addHandler(console_handler)
+    
+    # Mongo handler
+    mongo_handler = MongoHandler()
+    mongo_handler.setLevel(livello)
+    mongo_handler.addFilter(SamplingFilter())
+    logger.addHandler(mongo_handler)
+    
+    # discord.py: solo avvisi ed errori
+    discord_logger = logging.getLogger("discord")
+    discord_logger.setLevel(logging.WARNING)
+    discord_logger.addHandler(console_handler)
+    discord_logger.addHandler(mongo_handler)
+    
+    return logger
 
 # =========================
 # TEST RAPIDO
 # =========================
 if __name__ == "__main__":
-    print("✅ Interceptor avviato!")
-    logger.info("🔹 Test log info")
-    logger.error("❌ Test log error")
+    setup_logging()
+    log = get_logger("test")
+    log.info("🔹 Test log info", extra=campi(user_id="123", latency_ms=4.2))
+    log.error("❌ Test log error")
@@ -2,27 +2,49 @@
 """Sistema di notifiche e reminder con coda persistente"""
 
 import discord
+import time
 from datetime import datetime, timedelta
 from database import DatabaseManager
 from config import GIORNI
+from mongo_logger import get_logger, campi
+from metrics import DM_INVIATI, DM_FALLITI
+from shutdown import Shutdown
+from views import VistaFreezer
+from rate_limiter import RateLimiter
 
+log = get_logger(__name__)
 
-class ConfermaScongelamentoView(discord.ui.View):
-    """View per confermare lo scongelamento dalla notifica"""
-    def __init__(self, alimento_id, user_id):
-        super().__init__(timeout=None) 
-        self.alimento_id = alimento_id
-        self.user_id = user_id
+
+class BottoneScongelato(discord.ui.DynamicItem[discord.ui.Button], template=r"scongelato:(?P<alimento_id>[0-9a-f]{24})"):
+    """
+    Bottone "Ho Scongelato" dei promemoria.
+
+    L'_id dell'alimento è nel custom_id: il bottone funziona anche dopo un
+    riavvio e nessuna view resta in memoria per ogni promemoria inviato.
+    """
+    def __init__(self, alimento_id):
+        super().__init__(discord.ui.Button(
+            label="✅ Ho Scongelato",
+            style=discord.ButtonStyle.green,
+            custom_id=f"scongelato:{alimento_id}"
+        ))
+        self.alimento_id = str(alimento_id)
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["alimento_id"])
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await RateLimiter.consenti(interaction, "view", "BottoneScongelato")
     
-    @discord.ui.button(label="✅ Ho Scongelato", style=discord.ButtonStyle.green, custom_id="conferma_scongelato")
-    async def conferma_scongelato(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def callback(self, interaction: discord.Interaction):
         """Bottone per confermare lo scongelamento e diminuire la quantità"""
         try:
             await interaction.response.defer()
             
-            alimento = DatabaseManager.get_alimento_by_id(self.user_id, self.alimento_id)
+            alimento = DatabaseManager.get_alimento_by_object_id(self.alimento_id)
             
-            if not alimento:
+            if not alimento or alimento['user_id'] != str(interaction.user.id):
                 await interaction.followup.send(
                     "❌ Alimento non trovato! Potrebbe essere stato eliminato.",
                     ephemeral=True
@@ -30,8 +52,8 @@ class ConfermaScongelamentoView(discord.ui.View):
                 return
             
             nuova_quantita = DatabaseManager.aggiorna_quantita(
-                self.user_id, 
-                self.alimento_id, 
+                alimento['user_id'], 
+                alimento['id_univoco'], 
                 -1
             )
             
@@ -69,22 +91,20 @@ class ConfermaScongelamentoView(discord.ui.View):
                 )
                 embed.color = discord.Color.red()
             
-            button.disabled = True
-            button.label = "✅ Confermato"
+            self.item.disabled = True
+            self.item.label = "✅ Confermato"
             
             await interaction.edit_original_response(
                 embed=embed,
-                view=self
+                view=self.view
             )
             
             if nuova_quantita == 1:
-                user = await interaction.client.fetch_user(int(self.user_id))
-                await NotificationManager.notifica_quantita_finita(user, alimento)
+                await NotificationManager.notifica_quantita_finita(interaction.user, alimento)
             
         except Exception as e:
-            print(f"❌ Errore nella conferma scongelamento: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("❌ Errore nella conferma scongelamento: %s", e,
+                          extra=campi(user_id=str(interaction.user.id), alimento_id=self.alimento_id))
             
             await interaction.followup.send(
                 "❌ Si è verificato un errore. Riprova!",
@@ -92,6 +112,13 @@ class ConfermaScongelamentoView(discord.ui.View):
             )
 
 
+class ConfermaScongelamentoView(VistaFreezer):
+    """View per confermare lo scongelamento dalla notifica"""
+    def __init__(self, alimento_id):
+        super().__init__(timeout=None)
+        self.add_item(BottoneScongelato(alimento_id))
+
+
 class NotificationManager:
     """Manager per gestire le notifiche con sistema di coda"""
     
@@ -116,17 +143,21 @@ class NotificationManager:
             )
             
             await user.send(embed=embed)
+            DM_INVIATI.inc(tipo="quantita_finita")
         except discord.Forbidden:
-            print(f"❌ Impossibile inviare DM a {user.id}")
+            DM_FALLITI.inc(tipo="quantita_finita", motivo="dm_chiusi")
+            log.warning("❌ Impossibile inviare DM a %s", user.id, extra=campi(user_id=str(user.id)))
         
     @staticmethod
     async def prepara_notifiche_giornaliere(bot):
         """Prepara le notifiche del giorno corrente (esegue a mezzanotte)"""
+        inizio = time.perf_counter()
         oggi = datetime.now()
         giorno_oggi = oggi.weekday() + 1
         data_oggi = oggi.date()
         
-        print(f"📅 Preparazione notifiche per {GIORNI[giorno_oggi]} ({data_oggi})")
+        log.info("📅 Preparazione notifiche per %s (%s)", GIORNI[giorno_oggi], data_oggi,
+                 extra=campi(job="prepara_notifiche"))
         
         alimenti = DatabaseManager.get_alimenti_per_giorno(giorno_oggi)
         
@@ -155,99 +186,129 @@ class NotificationManager:
                 
                 if success:
                     count += 1
-                    print(f"  ➕ Notifica preparata: {alimento['nome_alimento']} per user {alimento['user_id']}")
+                    log.debug("➕ Notifica preparata: %s", alimento['nome_alimento'],
+                              extra=campi(user_id=alimento['user_id'], alimento_id=str(alimento['_id']),
+                                          job="prepara_notifiche"))
         
-        print(f"✅ {count} notifiche preparate per oggi")
+        log.info("✅ %d notifiche preparate per oggi", count,
+                 extra=campi(job="prepara_notifiche", count=count,
+                             latency_ms=round((time.perf_counter() - inizio) * 1000, 1)))
         
     @staticmethod
     async def elabora_coda_notifiche(bot):
         """Elabora la coda e invia le notifiche pronte"""
+        inizio = time.perf_counter()
+        inviate = 0
         ora_attuale = datetime.now()
         
         notifiche_da_inviare = DatabaseManager.get_notifiche_da_inviare(ora_attuale.isoformat())
         
-        for notifica in notifiche_da_inviare:
-            try:
-                alimento = DatabaseManager.get_alimento_by_object_id(notifica['alimento_id'])
+        # Registrata come in corso: un arresto attende la fine dell'invio corrente
+        with Shutdown.in_volo("elabora_coda"):
+            for notifica in notifiche_da_inviare:
+                if Shutdown.in_arresto():
+                    log.info("🛑 Arresto in corso: le notifiche rimanenti restano in coda",
+                             extra=campi(job="elabora_coda"))
+                    break
                 
-                if not alimento:
-                    DatabaseManager.marca_notifica_come_fallita(
-                        notifica['_id'], 
-                        "Alimento non trovato"
+                try:
+                    alimento = DatabaseManager.get_alimento_by_object_id(notifica['alimento_id'])
+                    
+                    if not alimento:
+                        DatabaseManager.marca_notifica_come_fallita(
+                            notifica['_id'], 
+                            "Alimento non trovato"
+                        )
+                        continue
+                    
+                    if alimento['quantita'] <= 0:
+                        DatabaseManager.marca_notifica_come_skipped(
+                            notifica['_id'], 
+                            "Quantità 0"
+                        )
+                        continue
+                    
+                    user = await bot.fetch_user(int(notifica['user_id']))
+                    
+                    embed = discord.Embed(
+                        title="📢 Promemoria Scongelamento!",
+                        description=f"Ricorda di tirare fuori **{alimento['nome_alimento'].capitalize()}**!",
+                        color=discord.Color.blue()
                     )
-                    continue
-                
-                if alimento['quantita'] <= 0:
-                    DatabaseManager.marca_notifica_come_skipped(
-                        notifica['_id'], 
-                        "Quantità 0"
+                    embed.add_field(
+                        name="📅 Per domani",
+                        value=GIORNI[alimento['scongela_per_giorno']],
+                        inline=True
                     )
-                    continue
-                
-                user = await bot.fetch_user(int(notifica['user_id']))
-                
-                embed = discord.Embed(
-                    title="📢 Promemoria Scongelamento!",
-                    description=f"Ricorda di tirare fuori **{alimento['nome_alimento'].capitalize()}**!",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(
-                    name="📅 Per domani",
-                    value=GIORNI[alimento['scongela_per_giorno']],
-                    inline=True
-                )
-                embed.add_field(
-                    name="📦 Disponibili",
-                    value=f"{alimento['quantita']} {alimento.get('unita', 'pz')}",
-                    inline=True
-                )
-                embed.add_field(
-                    name="🛒 Grammi",
-                    value=f"{alimento['portion_to_buy']}g",
-                    inline=True
-                )
-                embed.set_footer(text="Clicca il bottone quando hai scongelato!")
-                
-                view = ConfermaScongelamentoView(alimento['id_univoco'], alimento['user_id'])
-                
-                await user.send(embed=embed, view=view)
-                
-                DatabaseManager.marca_notifica_come_inviata(
-                    notifica['_id'],
-                    notifica['tentativi']
-                )
-                
-                DatabaseManager.aggiorna_ultima_notifica(
-                    alimento['_id'],
-                    datetime.now().isoformat()
-                )
-                
-                print(f"✅ Notifica inviata: {alimento['nome_alimento']} a {user.name}")
-                
-            except discord.Forbidden:
-                DatabaseManager.incrementa_tentativi_notifica(
-                    notifica['_id'],
-                    "DM chiusi"
-                )
-                print(f"❌ DM chiusi per user {notifica['user_id']}")
-                
-            except Exception as e:
-                DatabaseManager.incrementa_tentativi_notifica(
-                    notifica['_id'],
-                    str(e)
-                )
-                print(f"❌ Errore notifica: {e}")
+                    embed.add_field(
+                        name="📦 Disponibili",
+                        value=f"{alimento['quantita']} {alimento.get('unita', 'pz')}",
+                        inline=True
+                    )
+                    embed.add_field(
+                        name="🛒 Grammi",
+                        value=f"{alimento['portion_to_buy']}g",
+                        inline=True
+                    )
+                    embed.set_footer(text="Clicca il bottone quando hai scongelato!")
+                    
+                    view = ConfermaScongelamentoView(alimento['_id'])
+                    
+                    await user.send(embed=embed, view=view)
+                    DM_INVIATI.inc(tipo="promemoria")
+                    
+                    DatabaseManager.marca_notifica_come_inviata(
+                        notifica['_id'],
+                        notifica['tentativi']
+                    )
+                    
+                    DatabaseManager.aggiorna_ultima_notifica(
+                        alimento['_id'],
+                        datetime.now().isoformat()
+                    )
+                    
+                    inviate += 1
+                    log.info("✅ Notifica inviata: %s a %s", alimento['nome_alimento'], user.name,
+                             extra=campi(user_id=notifica['user_id'], alimento_id=notifica['alimento_id'],
+                                         job="elabora_coda"))
+                    
+                except discord.Forbidden:
+                    DM_FALLITI.inc(tipo="promemoria", motivo="dm_chiusi")
+                    DatabaseManager.incrementa_tentativi_notifica(
+                        notifica['_id'],
+                        "DM chiusi"
+                    )
+                    log.warning("❌ DM chiusi per user %s", notifica['user_id'],
+                                extra=campi(user_id=notifica['user_id'], alimento_id=notifica['alimento_id'],
+                                            job="elabora_coda"))
+                    
+                except Exception as e:
+                    DM_FALLITI.inc(tipo="promemoria", motivo="errore")
+                    DatabaseManager.incrementa_tentativi_notifica(
+                        notifica['_id'],
+                        str(e)
+                    )
+                    log.error("❌ Errore notifica: %s", e,
+                              extra=campi(user_id=notifica['user_id'], alimento_id=notifica['alimento_id'],
+                                          job="elabora_coda"))
         
         failed_count = DatabaseManager.marca_notifiche_failed_per_max_tentativi()
         if failed_count > 0:
-            print(f"⚠️ {failed_count} notifiche marcate come failed (max tentativi raggiunto)")
+            log.warning("⚠️ %d notifiche marcate come failed (max tentativi raggiunto)", failed_count,
+                        extra=campi(job="elabora_coda", count=failed_count))
+        
+        if inviate:
+            log.info("📨 Coda elaborata: %d notifiche inviate", inviate,
+                     extra=campi(job="elabora_coda", count=inviate,
+                                 latency_ms=round((time.perf_counter() - inizio) * 1000, 1)))
     
     
     @staticmethod
     async def pulisci_notifiche_vecchie():
         """Rimuove notifiche più vecchie di 7 giorni"""
         deleted_count = DatabaseManager.elimina_notifiche_vecchie(giorni=7)
-        print(f"🧹 Rimosse {deleted_count} notifiche vecchie")
+        log.info("🧹 Rimosse %d notifiche vecchie", deleted_count,
+                 extra=campi(job="pulizia_notifiche", count=deleted_count))
     
     
     @staticmethod
@@ -256,5 +317,5 @@ class NotificationManager:
         Metodo legacy per retrocompatibilità.
         Da rimuovere dopo il passaggio completo al sistema di coda.
         """
-        print("⚠️ Metodo legacy controlla_reminder chiamato - considera di usare elabora_coda_notifiche")
+        log.warning("⚠️ Metodo legacy controlla_reminder chiamato - considera di usare elabora_coda_notifiche")
         await NotificationManager.elabora_coda_notifiche(bot)
\ No newline at end of file
@@ -0,0 +1,227 @@
+# profiling.py
+"""Profiling su richiesta: cProfile, campionamento degli stack e diff di tracemalloc"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from config import PROFILO_HZ
+from mongo_logger import get_logger
+
+log = get_logger(__name__)
+
+CARTELLA_PROGETTO = os.path.dirname(os.path.abspath(__file__))
+ORDINI_PSTATS = frozenset(pstats.Stats.sort_arg_dict_default)  # Chiavi accettate da sort_stats (valori di SortKey compresi)
+RAGGRUPPAMENTI_MEMORIA = ("lineno", "filename", "traceback")  # key_type di Snapshot.compare_to
+
+
+class ProfiloOccupato(Exception):
+    """Un'altra sessione di profiling è già in corso"""
+
+
+class Profiler:
+    """
+    Strumenti di profiling avviati solo su richiesta da /debug/*.
+
+    Nulla resta attivo quando non vengono usati: cProfile e il thread di
+    campionamento girano solo per la durata richiesta, tracemalloc solo tra
+    avvia_tracemalloc() e ferma_tracemalloc(). Una sola cattura alla volta.
+    """
+
+    scheduler = None
+    _occupato = threading.Lock()
+    _base_memoria = None
+
+    @staticmethod
+    def configura(scheduler):
+        Profiler.scheduler = scheduler
+
+    # =========================
+    # CPU
+    # =========================
+
+    @staticmethod
+    async def cprofile(secondi: float, limite: int = 40, ordine: str = "cumulative") -> str:
+        """cProfile del thread dell'event loop per N secondi, in formato pstats"""
+        Profiler._verifica_ordine(ordine)
+        if not Profiler._occupato.acquire(blocking=False):
+            raise ProfiloOccupato()
+        try:
+            profilo = cProfile.Profile()
+            profilo.enable()
+            try:
+                await asyncio.sleep(secondi)
+            finally:
+                profilo.disable()
+        finally:
+            Profiler._occupato.release()
+        return Profiler._formatta_pstats(profilo, limite, ordine, f"cProfile event loop, {secondi:g}s")
+
+    @staticmethod
+    async def campiona(secondi: float, solo_loop: bool = False) -> str:
+        """Campionamento degli stack per N secondi, in formato collapsed (flamegraph)"""
+        if not Profiler._occupato.acquire(blocking=False):
+            raise ProfiloOccupato()
+        try:
+            thread_loop = threading.get_ident() if solo_loop else None
+            return await asyncio.to_thread(Profiler._campiona_sync, secondi, thread_loop)
+        finally:
+            Profiler._occupato.release()
+
+    @staticmethod
+    def _campiona_sync(secondi: float, thread_loop=None) -> str:
+        """Legge sys._current_frames PROFILO_HZ volte al secondo e conta gli stack"""
+        intervallo = 1 / PROFILO_HZ
+        proprio = threading.get_ident()
+        nomi = {t.ident: t.name for t in threading.enumerate()}
+        stack = Counter()
+
+        fine = time.monotonic() + secondi
+        while time.monotonic() < fine:
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio or (thread_loop is not None and ident != thread_loop):
+                    continue
+                funzioni = []
+                while frame is not None:
+                    codice = frame.f_code
+                    funzioni.append(f"{codice.co_name} ({Profiler._percorso(codice.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                funzioni.append(nomi.get(ident, str(ident)))
+                stack[";".join(reversed(funzioni))] += 1
+            time.sleep(intervallo)
+
+        return "".join(f"{riga} {conteggio}\n" for riga, conteggio in stack.most_common())
+
+    @staticmethod
+    async def profila_job(job_id: str, attesa: float, esegui_ora: bool = False,
+                          limite: int = 40, ordine: str = "cumulative") -> str:
+        """
+        cProfile della prossima esecuzione del job dello scheduler.
+
+        La funzione del job viene sostituita per una sola esecuzione e poi
+        ripristinata. Il profilo copre il thread del loop mentre il job è in
+        corso, quindi include anche gli handler eseguiti nel frattempo.
+        """
+        scheduler = Profiler.scheduler
+        job = scheduler.get_job(job_id) if scheduler else None
+        if job is None:
+            raise KeyError(job_id)
+        if not asyncio.iscoroutinefunction(job.func):
+            raise ValueError(f"il job {job_id} non è una coroutine")
+        Profiler._verifica_ordine(ordine)
+
+        if not Profiler._occupato.acquire(blocking=False):
+            raise ProfiloOccupato()
+
+        originale = job.func
+        completato = asyncio.get_running_loop().create_future()
+        profilo = cProfile.Profile()
+
+        async def profilato(*args, **kwargs):
+            # Ripristina subito: le esecuzioni successive non sono profilate
+            job.modify(func=originale)
+            inizio = time.perf_counter()
+            profilo.enable()
+            try:
+                return await originale(*args, **kwargs)
+            finally:
+                profilo.disable()
+                if not completato.done():
+                    completato.set_result(time.perf_counter() - inizio)
+
+        try:
+            job.modify(func=profilato)
+            if esegui_ora:
+                job.modify(next_run_time=datetime.now(scheduler.timezone))
+            log.info("🔬 Profiling della prossima esecuzione di %s", job_id)
+            durata = await asyncio.wait_for(completato, attesa)
+        except asyncio.TimeoutError:
+            job.modify(func=originale)
+            raise
+        finally:
+            Profiler._occupato.release()
+
+        return Profiler._formatta_pstats(profilo, limite, ordine, f"cProfile job {job_id}, {durata:.2f}s")
+
+    @staticmethod
+    def _verifica_ordine(ordine: str):
+        """ValueError prima di profilare: sort_stats lo scoprirebbe solo a cattura finita"""
+        if ordine not in ORDINI_PSTATS:
+            raise ValueError(f"ordine deve essere uno tra: {', '.join(sorted(ORDINI_PSTATS))}")
+
+    @staticmethod
+    def _formatta_pstats(profilo, limite, ordine, titolo) -> str:
+        flusso = io.StringIO()
+        flusso.write(f"# {titolo}\n")
+        statistiche = pstats.Stats(profilo, stream=flusso)
+        statistiche.strip_dirs().sort_stats(ordine).print_stats(limite)
+        return flusso.getvalue()
+
+    @staticmethod
+    def _percorso(nome_file: str) -> str:
+        if nome_file.startswith(CARTELLA_PROGETTO):
+            return os.path.relpath(nome_file, CARTELLA_PROGETTO)
+        return os.path.basename(nome_file)
+
+    # =========================
+    # MEMORIA
+    # =========================
+
+    @staticmethod
+    def avvia_tracemalloc(frame: int = 10):
+        """Avvia tracemalloc e prende la snapshot di riferimento"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frame)
+        Profiler._base_memoria = Profiler._snapshot()
+        log.info("🔬 tracemalloc avviato (%d frame)", tracemalloc.get_traceback_limit())
+
+    @staticmethod
+    def ferma_tracemalloc():
+        """Ferma tracemalloc e libera le snapshot"""
+        Profiler._base_memoria = None
+        tracemalloc.stop()
+        log.info("🔬 tracemalloc fermato")
+
+    @staticmethod
+    def diff_memoria(limite: int = 25, raggruppa: str = "lineno", aggiorna_base: bool = False) -> dict:
+        """Differenza tra la snapshot attuale e quella di riferimento"""
+        if raggruppa not in RAGGRUPPAMENTI_MEMORIA:
+            raise ValueError(f"raggruppa deve essere uno tra: {', '.join(RAGGRUPPAMENTI_MEMORIA)}")
+        if not tracemalloc.is_tracing() or Profiler._base_memoria is None:
+            return None
+
+        attuale = Profiler._snapshot()
+        differenze = attuale.compare_to(Profiler._base_memoria, raggruppa)
+        if aggiorna_base:
+            Profiler._base_memoria = attuale
+
+        corrente, picco = tracemalloc.get_traced_memory()
+        return {
+            "memoria_tracciata_kb": round(corrente / 1024, 1),
+            "picco_kb": round(picco / 1024, 1),
+            "crescita": [
+                {
+                    "dove": [Profiler._percorso(f.filename) + f":{f.lineno}" for f in d.traceback],
+                    "diff_kb": round(d.size_diff / 1024, 1),
+                    "totale_kb": round(d.size / 1024, 1),
+                    "diff_oggetti": d.count_diff
+                }
+                for d in differenze[:limite]
+            ]
+        }
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
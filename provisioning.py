@@ -0,0 +1,222 @@
+# provisioning.py
+"""Coda di creazione dei thread privati, con velocità controllata e backfill riprendibile"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime
+from config import PROVISIONING_THREAD_AL_MINUTO
+from database import DatabaseManager
+from thread_manager import ThreadManager, ThreadResolver
+from metrics import Counter, Gauge
+from shutdown import Shutdown
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+PREFISSO_BACKFILL = "provisioning_"
+
+
+class ThreadProvisioning:
+    """
+    Crea i thread privati uno alla volta, al massimo
+    PROVISIONING_THREAD_AL_MINUTO al minuto.
+
+    Ogni thread costa quattro chiamate REST (create_thread, edit dei
+    permessi, add_user e un solo messaggio di benvenuto): un'ondata di
+    ingressi o un backfill vengono messi in coda invece di partire tutti
+    in parallelo.
+
+    Il backfill di una guild tiene in memoria gli id ancora da elaborare e
+    salva in bot_meta come cursore l'ultimo id prima del più piccolo di essi
+    (i membri sono ordinati per id), più gli id oltre il cursore già
+    elaborati fuori ordine: dopo un riavvio riprende da lì e ogni membro
+    viene contato una volta sola. Solo gli id del backfill contano per
+    l'avanzamento, non i nuovi ingressi.
+    """
+
+    _coda = asyncio.Queue()
+    _in_coda = set()  # (guild_id, user_id) già in coda
+    _worker = None
+    _bot = None
+    _completati = deque()  # Timestamp delle creazioni recenti, per la velocità
+    _backfill = {}  # guild_id -> stato del backfill in corso
+    _in_attesa = {}  # guild_id -> (deque ordinata e set degli id da elaborare, set degli elaborati oltre il cursore)
+
+    @staticmethod
+    async def avvia(bot):
+        """Avvia il worker e riprende i backfill interrotti"""
+        ThreadProvisioning._bot = bot
+        if ThreadProvisioning._worker is None:
+            ThreadProvisioning._worker = asyncio.create_task(ThreadProvisioning._elabora())
+
+        interrotti = await asyncio.to_thread(DatabaseManager.get_meta_per_prefisso, PREFISSO_BACKFILL)
+        for chiave, stato in interrotti.items():
+            if stato.get("stato") != "in_corso":
+                continue
+            guild = bot.get_guild(int(chiave[len(PREFISSO_BACKFILL):]))
+            if guild:
+                log.info("🔄 Ripresa backfill thread per %s da %s", guild.name, stato.get("cursore"))
+                await ThreadProvisioning.backfill(guild, riprendi=True)
+
+    @staticmethod
+    def accoda(guild_id, user_id) -> bool:
+        """Mette in coda un membro (False se era già in coda)"""
+        chiave = (int(guild_id), int(user_id))
+        if chiave in ThreadProvisioning._in_coda:
+            return False
+        ThreadProvisioning._in_coda.add(chiave)
+        ThreadProvisioning._coda.put_nowait(chiave)
+        return True
+
+    @staticmethod
+    async def backfill(guild, riprendi: bool = False) -> dict:
+        """
+        Accoda tutti i membri della guild senza thread.
+
+        Una sola query su user_threads per sapere chi ha già un thread; con
+        riprendi=True salta anche i membri fino al cursore salvato.
+        """
+        chiave = PREFISSO_BACKFILL + str(guild.id)
+        salvato = {}
+        if riprendi:
+            salvato = await asyncio.to_thread(DatabaseManager.get_meta, chiave) or {}
+        cursore = int(salvato.get("cursore") or 0)
+        gia_elaborati = salvato.get("creati", 0) + salvato.get("falliti", 0)
+        # Già contati in creati/falliti: non vanno rimessi in coda
+        oltre_cursore = {int(user_id) for user_id in salvato.get("elaborati_oltre_cursore", [])}
+
+        membri = guild.members if guild.chunked else [m async for m in guild.fetch_members(limit=None)]
+        con_thread = await ThreadResolver.utenti_con_thread(guild.id)
+
+        da_creare = sorted(
+            m.id for m in membri
+            if not m.bot and m.id > cursore and m.id not in con_thread and m.id not in oltre_cursore
+        )
+
+        stato = {
+            "stato": "in_corso" if da_creare else "completato",
+            "cursore": cursore,
+            "totale": gia_elaborati + len(da_creare),
+            "creati": salvato.get("creati", 0),
+            "falliti": salvato.get("falliti", 0),
+            "elaborati_oltre_cursore": sorted(oltre_cursore),
+            "avviato_il": salvato.get("avviato_il") or datetime.now().isoformat()
+        }
+        ThreadProvisioning._backfill[guild.id] = stato
+        # Nella deque anche gli elaborati oltre il cursore, così il cursore li supera
+        ThreadProvisioning._in_attesa[guild.id] = (
+            deque(sorted(oltre_cursore.union(da_creare))), set(da_creare), oltre_cursore
+        )
+        await asyncio.to_thread(DatabaseManager.salva_meta, chiave, stato)
+
+        for user_id in da_creare:
+            ThreadProvisioning.accoda(guild.id, user_id)
+
+        log.info("📋 Backfill thread %s: %d da creare, %d membri già con thread",
+                 guild.name, len(da_creare), len(con_thread),
+                 extra=campi(guild_id=str(guild.id), count=len(da_creare), job="provisioning"))
+        return {"da_creare": len(da_creare), "gia_presenti": len(con_thread)}
+
+    @staticmethod
+    def thread_al_minuto() -> float:
+        """Thread creati nell'ultimo minuto"""
+        limite = time.monotonic() - 60
+        while ThreadProvisioning._completati and ThreadProvisioning._completati[0] < limite:
+            ThreadProvisioning._completati.popleft()
+        return float(len(ThreadProvisioning._completati))
+
+    @staticmethod
+    def stato(guild_id) -> dict:
+        """Avanzamento del backfill della guild e della coda"""
+        return {
+            "in_coda": ThreadProvisioning._coda.qsize(),
+            "thread_al_minuto": ThreadProvisioning.thread_al_minuto(),
+            "backfill": ThreadProvisioning._backfill.get(int(guild_id))
+        }
+
+    @staticmethod
+    async def _elabora():
+        """Worker: un membro alla volta, distanziati per rispettare la velocità"""
+        intervallo = 60 / PROVISIONING_THREAD_AL_MINUTO
+        prossimo = 0.0
+
+        while not Shutdown.in_arresto():
+            guild_id, user_id = await ThreadProvisioning._coda.get()
+            try:
+                attesa = prossimo - time.monotonic()
+                if attesa > 0:
+                    await asyncio.sleep(attesa)
+                prossimo = time.monotonic() + intervallo
+
+                with Shutdown.in_volo("provisioning"):
+                    creato = await ThreadProvisioning._crea(guild_id, user_id)
+                    await ThreadProvisioning._aggiorna_backfill(guild_id, user_id, creato)
+            except Exception as e:
+                log.exception("❌ Errore provisioning thread: %s", e,
+                              extra=campi(guild_id=str(guild_id), user_id=str(user_id), job="provisioning"))
+            finally:
+                ThreadProvisioning._in_coda.discard((guild_id, user_id))
+                ThreadProvisioning._coda.task_done()
+
+    @staticmethod
+    async def _crea(guild_id, user_id) -> bool:
+        bot = ThreadProvisioning._bot
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            return False
+
+        member = guild.get_member(user_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(user_id)
+            except Exception:
+                return False  # Uscito dalla guild nel frattempo
+
+        thread = await ThreadManager.crea_thread_utente(guild, member)
+        if thread:
+            ThreadProvisioning._completati.append(time.monotonic())
+            THREAD_CREATI.inc()
+        return thread is not None
+
+    @staticmethod
+    async def _aggiorna_backfill(guild_id, user_id, creato: bool):
+        """Conta il membro e avanza il cursore (solo se fa parte del backfill)"""
+        stato = ThreadProvisioning._backfill.get(guild_id)
+        attesa = ThreadProvisioning._in_attesa.get(guild_id)
+        if not stato or stato["stato"] != "in_corso" or attesa is None or user_id not in attesa[1]:
+            return
+
+        ordine, rimanenti, oltre_cursore = attesa
+        rimanenti.discard(user_id)
+        oltre_cursore.add(user_id)
+        # Il cursore avanza fino al più piccolo id ancora da elaborare (escluso):
+        # chi è sotto il cursore è già stato elaborato
+        while ordine and ordine[0] not in rimanenti:
+            stato["cursore"] = ordine.popleft()
+        oltre_cursore.difference_update([i for i in oltre_cursore if i <= stato["cursore"]])
+        stato["elaborati_oltre_cursore"] = sorted(oltre_cursore)
+        stato["creati" if creato else "falliti"] += 1
+        elaborati = stato["creati"] + stato["falliti"]
+        if elaborati >= stato["totale"]:
+            stato["stato"] = "completato"
+            ThreadProvisioning._in_attesa.pop(guild_id, None)
+            log.info("✅ Backfill thread completato: %d creati, %d falliti",
+                     stato["creati"], stato["falliti"],
+                     extra=campi(guild_id=str(guild_id), count=stato["creati"], job="provisioning"))
+        elif elaborati % 10 == 0:
+            log.info("📈 Backfill thread: %d/%d (%.0f thread/min)",
+                     elaborati, stato["totale"], ThreadProvisioning.thread_al_minuto(),
+                     extra=campi(guild_id=str(guild_id), count=elaborati, job="provisioning"))
+        await asyncio.to_thread(DatabaseManager.salva_meta, PREFISSO_BACKFILL + str(guild_id), stato)
+
+
+THREAD_CREATI = Counter("freezerbot_threads_created_total", "Thread privati creati")
+CODA_PROVISIONING = Gauge(
+    "freezerbot_provisioning_queue", "Membri in attesa del thread privato",
+    funzione=lambda: ThreadProvisioning._coda.qsize()
+)
+THREAD_AL_MINUTO = Gauge(
+    "freezerbot_threads_per_minute", "Thread privati creati nell'ultimo minuto",
+    funzione=ThreadProvisioning.thread_al_minuto
+)
@@ -0,0 +1,91 @@
+# rate_limiter.py
+"""Limite di interazioni per utente (token bucket) davanti a comandi slash e view"""
+
+import math
+import time
+import discord
+from config import LIMITE_INTERAZIONI_RAFFICA, LIMITE_INTERAZIONI_AL_SECONDO
+from metrics import Counter, Gauge
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+# Costo in gettoni dei comandi più pesanti (gli altri costano 1)
+COSTI_COMANDI = {
+    "reset": 8,         # Elimina e ricrea il thread privato: molte chiamate REST
+    "provisioning": 5,  # Legge tutti i membri della guild
+    "lista": 2,         # Legge l'intero inventario e può inviare più messaggi
+}
+
+
+class RateLimiter:
+    """
+    Un secchio di LIMITE_INTERAZIONI_RAFFICA gettoni per utente, ricaricato
+    di LIMITE_INTERAZIONI_AL_SECONDO gettoni al secondo.
+
+    Ogni interazione preleva il suo costo prima di toccare Mongo o la REST
+    API; se i gettoni non bastano riceve solo una risposta ephemeral, così
+    un utente che martella i bottoni non rallenta gli altri. I secchi pieni
+    vengono scartati: un utente inattivo non occupa memoria.
+    """
+
+    _secchi = {}  # user_id -> [gettoni, ultimo aggiornamento]
+    _ultima_pulizia = time.monotonic()
+
+    @staticmethod
+    def preleva(user_id, costo: float = 1) -> float:
+        """Preleva i gettoni: 0 se consentito, altrimenti i secondi da attendere"""
+        ora = time.monotonic()
+        costo = min(costo, LIMITE_INTERAZIONI_RAFFICA)
+        secchio = RateLimiter._secchi.get(user_id)
+        if secchio is None:
+            gettoni = LIMITE_INTERAZIONI_RAFFICA
+        else:
+            ricaricati = (ora - secchio[1]) * LIMITE_INTERAZIONI_AL_SECONDO
+            gettoni = min(LIMITE_INTERAZIONI_RAFFICA, secchio[0] + ricaricati)
+
+        if ora - RateLimiter._ultima_pulizia > 60:
+            RateLimiter._pulisci(ora)
+
+        if gettoni >= costo:
+            RateLimiter._secchi[user_id] = [gettoni - costo, ora]
+            return 0.0
+        RateLimiter._secchi[user_id] = [gettoni, ora]
+        return (costo - gettoni) / LIMITE_INTERAZIONI_AL_SECONDO
+
+    @staticmethod
+    async def consenti(interaction: discord.Interaction, tipo: str, nome: str, costo: float = 1) -> bool:
+        """True se l'interazione può procedere; altrimenti risponde in ephemeral e la scarta"""
+        attesa = RateLimiter.preleva(interaction.user.id, costo)
+        if not attesa:
+            return True
+
+        INTERAZIONI_LIMITATE.inc(tipo=tipo, nome=nome)
+        log.debug("⏳ Interazione limitata: %s %s", tipo, nome,
+                  extra=campi(user_id=str(interaction.user.id)))
+        if not interaction.response.is_done():
+            await interaction.response.send_message(
+                f"⏳ Stai andando troppo veloce! Riprova tra {math.ceil(attesa)}s.",
+                ephemeral=True
+            )
+        return False
+
+    @staticmethod
+    def _pulisci(ora: float):
+        """Scarta i secchi già tornati pieni"""
+        tempo_ricarica = LIMITE_INTERAZIONI_RAFFICA / LIMITE_INTERAZIONI_AL_SECONDO
+        RateLimiter._secchi = {
+            user_id: secchio for user_id, secchio in RateLimiter._secchi.items()
+            if ora - secchio[1] < tempo_ricarica
+        }
+        RateLimiter._ultima_pulizia = ora
+
+
+INTERAZIONI_LIMITATE = Counter(
+    "freezerbot_throttled_interactions_total", "Interazioni scartate dal limite per utente",
+    labels=("tipo", "nome")
+)
+UTENTI_LIMITATORE = Gauge(
+    "freezerbot_rate_limiter_users", "Utenti con un secchio di gettoni non pieno",
+    funzione=lambda: len(RateLimiter._secchi)
+)
@@ -0,0 +1,151 @@
+# readiness.py
+"""Probe delle dipendenze per /ready, eseguite in background e tenute in cache"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from config import READY_PROBE_INTERVAL, READY_PROBE_TIMEOUT, READY_RICHIEDI_VOSK
+from mongo_logger import get_logger
+
+log = get_logger(__name__)
+
+
+class Readiness:
+    """
+    Stato di prontezza del bot.
+
+    Un task in background verifica ogni READY_PROBE_INTERVAL secondi Mongo,
+    gateway, scheduler e modello Vosk, e salva il risultato già serializzato:
+    /ready restituisce solo la cache, quindi i health check della piattaforma
+    non aggiungono carico a Mongo. Se il task si blocca la cache invecchia e
+    /ready risponde 503.
+    """
+
+    _bot = None
+    _scheduler = None
+    _task = None
+    _ping = None  # Future del ping Mongo in corso
+
+    pronto = False
+    in_arresto = False
+    corpo = json.dumps({"pronto": False, "motivo": "probe non ancora eseguite"})
+    aggiornato = 0.0
+
+    @staticmethod
+    def avvia(bot, scheduler):
+        """Avvia il ciclo delle probe"""
+        Readiness._bot = bot
+        Readiness._scheduler = scheduler
+        if Readiness._task is None:
+            Readiness._task = asyncio.create_task(Readiness._ciclo())
+
+    @staticmethod
+    def ferma():
+        if Readiness._task:
+            Readiness._task.cancel()
+            Readiness._task = None
+
+    @staticmethod
+    def segna_in_arresto():
+        """Da qui in poi /ready risponde 503: la piattaforma smette di instradare traffico"""
+        Readiness.in_arresto = True
+
+    @staticmethod
+    def stato():
+        """(pronto, corpo JSON) dalla cache, senza eseguire probe"""
+        if Readiness.in_arresto:
+            return False, json.dumps({"pronto": False, "motivo": "arresto in corso"})
+        if time.monotonic() - Readiness.aggiornato > 3 * READY_PROBE_INTERVAL:
+            return False, json.dumps({"pronto": False, "motivo": "probe non aggiornate"})
+        return Readiness.pronto, Readiness.corpo
+
+    @staticmethod
+    async def _ciclo():
+        while True:
+            try:
+                await Readiness.esegui_probe()
+            except Exception as e:
+                log.error("❌ Errore probe readiness: %s", e)
+            await asyncio.sleep(READY_PROBE_INTERVAL)
+
+    @staticmethod
+    async def esegui_probe():
+        """Esegue tutte le probe e aggiorna la cache"""
+        controlli = {
+            "mongo": await Readiness._probe_mongo(),
+            "gateway": Readiness._probe_gateway(),
+            "scheduler": Readiness._probe_scheduler(),
+            "vosk": Readiness._probe_vosk()
+        }
+
+        richiesti = ["mongo", "gateway", "scheduler"]
+        if READY_RICHIEDI_VOSK:
+            richiesti.append("vosk")
+        pronto = all(controlli[nome]["ok"] for nome in richiesti)
+
+        if pronto != Readiness.pronto:
+            falliti = [nome for nome in richiesti if not controlli[nome]["ok"]]
+            if pronto:
+                log.info("✅ Bot pronto")
+            else:
+                log.warning("⚠️ Bot non pronto: %s", ", ".join(falliti))
+
+        Readiness.corpo = json.dumps({
+            "pronto": pronto,
+            "controllato_il": datetime.now(timezone.utc).isoformat(),
+            "controlli": controlli
+        })
+        Readiness.pronto = pronto
+        Readiness.aggiornato = time.monotonic()
+
+    @staticmethod
+    async def _probe_mongo():
+        """Ping a Mongo in un thread, con timeout"""
+        # Import qui per evitare circular import
+        from database import DatabaseManager
+
+        # Un ping bloccato (server irraggiungibile) non ne accoda altri
+        if Readiness._ping is None or Readiness._ping.done():
+            Readiness._ping = asyncio.ensure_future(asyncio.to_thread(DatabaseManager.ping))
+
+        inizio = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(Readiness._ping), READY_PROBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return {"ok": False, "errore": f"timeout dopo {READY_PROBE_TIMEOUT}s"}
+        except Exception as e:
+            return {"ok": False, "errore": str(e)[:200]}
+        return {"ok": True, "latenza_ms": round((time.perf_counter() - inizio) * 1000, 1)}
+
+    @staticmethod
+    def _probe_gateway():
+        bot = Readiness._bot
+        pronto = bot.is_ready() and not bot.is_closed()
+        risultato = {"ok": pronto}
+        if pronto and bot.latency == bot.latency:  # NaN prima del primo heartbeat
+            risultato["latenza_ms"] = round(bot.latency * 1000, 1)
+        return risultato
+
+    @staticmethod
+    def _probe_scheduler():
+        scheduler = Readiness._scheduler
+        if not scheduler.running:
+            return {"ok": False, "errore": "scheduler fermo", "job": {}}
+
+        job = {}
+        for j in scheduler.get_jobs():
+            job[j.id] = j.next_run_time.isoformat() if j.next_run_time else None
+        # Un job in pausa (next_run_time None) non gira più
+        return {"ok": bool(job) and all(job.values()), "job": job}
+
+    @staticmethod
+    def _probe_vosk():
+        # Import qui: voice_handler è pesante e non serve per le altre probe
+        from voice_handler import VoiceHandler
+
+        if not VoiceHandler.model_pronto.is_set():
+            return {"ok": False, "stato": "caricamento"}
+        if VoiceHandler.model is None:
+            return {"ok": False, "stato": "errore"}
+        return {"ok": True, "stato": "caricato"}
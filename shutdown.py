@@ -0,0 +1,118 @@
+# shutdown.py
+"""Arresto controllato: smette di accettare lavoro, attende quello in corso e chiude le risorse"""
+
+import asyncio
+import contextlib
+import time
+from collections import Counter
+from config import SHUTDOWN_TIMEOUT
+from mongo_logger import get_logger
+
+log = get_logger(__name__)
+
+
+class Shutdown:
+    """
+    Coordina l'arresto del bot (SIGTERM di un deploy o Ctrl+C).
+
+    Le operazioni che non devono essere interrotte a metà (un invio di
+    promemoria tra user.send e marca_notifica_come_inviata, un vocale in
+    trascrizione) si registrano con `with Shutdown.in_volo(...)`. All'arresto:
+
+    1. /ready risponde 503 e lo scheduler va in pausa (nessun nuovo job)
+    2. i job in corso smettono di prendere nuovo lavoro (in_arresto())
+    3. si attendono le operazioni registrate, al massimo SHUTDOWN_TIMEOUT,
+       e solo dopo si ferma lo scheduler
+    4. si chiudono monitor, web server, gateway, log e client Mongo
+    """
+
+    _richiesto = False
+    _in_volo = {}  # Future -> nome dell'operazione
+    _completato = None
+
+    @staticmethod
+    def in_arresto() -> bool:
+        """True quando è iniziato l'arresto: non iniziare nuovo lavoro"""
+        return Shutdown._richiesto
+
+    @staticmethod
+    @contextlib.contextmanager
+    def in_volo(nome: str):
+        """Registra un'operazione che l'arresto deve attendere"""
+        fatto = asyncio.get_running_loop().create_future()
+        Shutdown._in_volo[fatto] = nome
+        try:
+            yield
+        finally:
+            del Shutdown._in_volo[fatto]
+            fatto.set_result(None)
+
+    @staticmethod
+    async def esegui(bot, scheduler):
+        """Sequenza di arresto (idempotente: le chiamate successive attendono la prima)"""
+        if Shutdown._completato is not None:
+            await Shutdown._completato.wait()
+            return
+        Shutdown._completato = asyncio.Event()
+        Shutdown._richiesto = True
+
+        # Import qui per evitare circular import
+        from click_coalescer import ClickCoalescer
+        from database import client
+        from metrics import Metrics
+        from readiness import Readiness
+        from voice_handler import VoiceHandler
+        from loop_watchdog import LoopWatchdog
+        from web_server import WebServer
+        import mongo_logger
+
+        inizio = time.perf_counter()
+        log.info("🛑 Arresto in corso...")
+
+        try:
+            # 1. Niente nuovo traffico né nuovi job. Solo pausa: shutdown() cancellerebbe
+            # i job in corso (es. tra user.send e marca_notifica_come_inviata)
+            Readiness.segna_in_arresto()
+            if scheduler.running:
+                scheduler.pause()
+
+            # 2-3. Scrive i click +1/-1 in attesa e attende invii e vocali in corso
+            await ClickCoalescer.svuota()
+            await Shutdown._attendi_in_volo(SHUTDOWN_TIMEOUT)
+            VoiceHandler.chiudi_pool()
+            if scheduler.running:
+                scheduler.shutdown(wait=False)
+
+            # 4. Chiusura delle risorse
+            Readiness.ferma()
+            Metrics.ferma()
+            LoopWatchdog.ferma()
+            await WebServer.stop_web_server()
+            await bot.close()
+        except Exception as e:
+            log.exception("❌ Errore durante l'arresto: %s", e)
+        finally:
+            log.info("✅ Bot chiuso correttamente in %.1fs", time.perf_counter() - inizio)
+            if mongo_logger.mongo_handler:
+                await asyncio.to_thread(mongo_logger.mongo_handler.close)
+            client.close()
+            Shutdown._completato.set()
+
+    @staticmethod
+    async def _attendi_in_volo(timeout: float):
+        if not Shutdown._in_volo:
+            return
+
+        log.info("⏳ Attendo %d operazioni in corso (%s)", len(Shutdown._in_volo),
+                 Shutdown._riepilogo(Shutdown._in_volo.values()))
+        _, rimaste = await asyncio.wait(list(Shutdown._in_volo), timeout=timeout)
+
+        if rimaste:
+            log.warning("⚠️ %d operazioni ancora in corso dopo %.0fs: %s", len(rimaste), timeout,
+                        Shutdown._riepilogo(Shutdown._in_volo.get(f, "?") for f in rimaste))
+        else:
+            log.info("✅ Operazioni in corso completate")
+
+    @staticmethod
+    def _riepilogo(nomi) -> str:
+        return ", ".join(f"{nome} x{n}" for nome, n in Counter(nomi).items())
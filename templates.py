@@ -0,0 +1,134 @@
+# templates.py
+"""Embed statici (menu, help, benvenuto) costruiti una volta sola all'avvio"""
+
+from types import MappingProxyType
+import discord
+
+
+class EmbedTemplates:
+    """
+    Registro di payload di embed precostruiti e immutabili.
+
+    Le schermate statiche vengono serializzate una volta con to_dict();
+    crea() restituisce un nuovo discord.Embed copiando solo il primo livello
+    e i field (Embed.from_dict tiene i riferimenti, quindi senza copia una
+    modifica all'embed alterebbe il template). I segnaposto {nome} in
+    titolo e descrizione vengono riempiti solo se si passano dei valori.
+    """
+
+    _registro = {}
+
+    @staticmethod
+    def registra(chiave_template: str, embed: discord.Embed):
+        payload = embed.to_dict()
+        payload["fields"] = tuple(MappingProxyType(field) for field in payload.get("fields", ()))
+        for chiave in ("footer", "author", "thumbnail", "image"):
+            if chiave in payload:
+                payload[chiave] = MappingProxyType(payload[chiave])
+        EmbedTemplates._registro[chiave_template] = MappingProxyType(payload)
+
+    @staticmethod
+    def crea(chiave_template: str, **valori) -> discord.Embed:
+        """Nuovo embed dal template, personalizzato con i valori dati"""
+        template = EmbedTemplates._registro[chiave_template]
+        payload = dict(template)
+        payload["fields"] = [dict(field) for field in template["fields"]]
+        for chiave in ("footer", "author", "thumbnail", "image"):
+            if chiave in template:
+                payload[chiave] = dict(template[chiave])
+
+        if valori:
+            for chiave in ("title", "description"):
+                if chiave in payload:
+                    payload[chiave] = payload[chiave].format(**valori)
+
+        return discord.Embed.from_dict(payload)
+
+
+# =========================
+# Menu principale
+# =========================
+_menu = discord.Embed(
+    title="🧊 FreezerBot",
+    description="Gestisci il tuo congelatore facilmente!",
+    color=discord.Color.blue()
+)
+_menu.add_field(
+    name="📋 Lista",
+    value="Vedi tutti gli alimenti",
+    inline=False
+)
+_menu.add_field(
+    name="➕ Aggiungi",
+    value="Aggiungi alimenti o porzioni",
+    inline=False
+)
+EmbedTemplates.registra("menu", _menu)
+
+# =========================
+# Help
+# =========================
+_help = discord.Embed(
+    title="📚 Guida FreezerBot",
+    description="Ecco come usare il bot per gestire il tuo freezer!",
+    color=discord.Color.blue()
+)
+_help.add_field(
+    name="🎯 Comandi Principali",
+    value="`/menu` - Apri il menu principale\n"
+          "`/lista` - Vedi tutti gli alimenti\n"
+          "`/aggiungi` - Aggiungi alimenti (menu, oppure `nome quantita giorno grammi`)\n"
+          "`/consuma` - Togli porzioni di un alimento\n"
+          "`/rimuovi` - Elimina un alimento",
+    inline=False
+)
+_help.add_field(
+    name="📢 Come funzionano i promemoria?",
+    value="Il bot ti invierà un messaggio privato il giorno e l'ora che scegli "
+          "per ricordarti di tirare fuori l'alimento dal freezer!",
+    inline=False
+)
+_help.add_field(
+    name="⚠️ Notifica quantità finita",
+    value="Quando la quantità arriva a 1, riceverai una notifica con "
+          "i grammi da comprare per quel giorno della settimana.",
+    inline=False
+)
+_help.add_field(
+    name="💡 Suggerimenti",
+    value="• Puoi avere più varianti dello stesso alimento per giorni diversi\n"
+          "• Usa i bottoni per aggiungere/rimuovere porzioni velocemente\n"
+          "• Abilita/disabilita le notifiche dalle impostazioni",
+    inline=False
+)
+EmbedTemplates.registra("help", _help)
+
+# =========================
+# Benvenuto nel thread privato
+# =========================
+_benvenuto = discord.Embed(
+    title="👋 Benvenuto nel tuo Freezer personale, {nome}!",
+    description="Questo è il tuo spazio privato per gestire il congelatore.",
+    color=discord.Color.blue()
+)
+_benvenuto.add_field(
+    name="🎯 Cosa puoi fare qui",
+    value="• Gestire gli alimenti nel tuo freezer\n"
+          "• Ricevere promemoria per scongelare\n"
+          "• Tenere traccia delle quantità\n"
+          "• Ricevere notifiche quando finiscono gli alimenti",
+    inline=False
+)
+_benvenuto.add_field(
+    name="🚀 Come iniziare",
+    value="Usa il menu qui sotto oppure il comando `/menu`!\n"
+          "Usa `/help` per vedere tutti i comandi disponibili.",
+    inline=False
+)
+_benvenuto.add_field(
+    name="🔒 Privacy",
+    value="Questo thread è **privato**: solo tu e il bot potete vedere i messaggi qui dentro.",
+    inline=False
+)
+_benvenuto.set_footer(text="FreezerBot 🧊 | Il tuo assistente per il congelatore")
+EmbedTemplates.registra("benvenuto", _benvenuto)
@@ -1,9 +1,130 @@
 # thread_manager.py
 """Gestione thread privati per gli utenti"""
 
+import asyncio
 import discord
 from database import DatabaseManager
 from config import NOME_CANALE_LISTA_SPESA
+from templates import EmbedTemplates
+from mongo_logger import get_logger, campi
+
+log = get_logger(__name__)
+
+
+class ThreadResolver:
+    """
+    Cache in memoria di guild -> canale #lista-spesa e (guild, utente) -> thread.
+
+    I thread di una guild vengono caricati da user_threads con una sola query
+    al primo utilizzo; da lì la cache è autorevole (solo il bot scrive
+    user_threads, sempre tramite salva()). Gli eventi del gateway la
+    invalidano quando canali o thread vengono eliminati.
+
+    guild.get_thread vede solo i thread attivi: per quelli archiviati si
+    ricade su fetch_channel e si riapre il thread invece di crearne uno nuovo.
+    """
+    
+    _canali = {}       # guild_id -> channel_id di #lista-spesa
+    _thread = {}       # guild_id -> {user_id: thread_id}
+    _proprietari = {}  # thread_id -> (guild_id, user_id)
+    
+    @staticmethod
+    async def canale_lista_spesa(guild):
+        """Canale #lista-spesa della guild (creato se non esiste)"""
+        canale_id = ThreadResolver._canali.get(guild.id)
+        canale = guild.get_channel(canale_id) if canale_id else None
+        if canale:
+            return canale
+        
+        # Cerca il canale #lista-spesa
+        canale = discord.utils.get(guild.text_channels, name=NOME_CANALE_LISTA_SPESA)
+        
+        # Se non esiste, crealo
+        if not canale:
+            log.info("📝 Creazione canale #%s...", NOME_CANALE_LISTA_SPESA)
+            canale = await guild.create_text_channel(
+                NOME_CANALE_LISTA_SPESA,
+                topic="📋 Canale per le liste della spesa personali",
+                reason="Creato automaticamente da FreezerBot"
+            )
+            log.info("✅ Canale #%s creato!", NOME_CANALE_LISTA_SPESA)
+        
+        ThreadResolver._canali[guild.id] = canale.id
+        return canale
+    
+    @staticmethod
+    async def utenti_con_thread(guild_id) -> set:
+        """Utenti della guild che hanno già un thread"""
+        return set(await ThreadResolver._thread_guild(guild_id))
+    
+    @staticmethod
+    async def thread_utente(guild, user_id):
+        """Thread dell'utente (riaperto se archiviato) o None se non ne ha uno"""
+        thread_id = (await ThreadResolver._thread_guild(guild.id)).get(int(user_id))
+        if thread_id is None:
+            return None
+        
+        thread = guild.get_thread(thread_id)
+        if thread:
+            return thread
+        
+        # Non in cache: archiviato, oppure eliminato (o reso inaccessibile) mentre il bot era offline
+        try:
+            thread = await guild.fetch_channel(thread_id)
+        except (discord.NotFound, discord.Forbidden):
+            log.warning("⚠️ Thread salvato non trovato o non accessibile, ne creo uno nuovo",
+                        extra=campi(user_id=str(user_id)))
+            ThreadResolver.dimentica_thread(thread_id)
+            return None
+        
+        if getattr(thread, "archived", False):
+            await thread.edit(archived=False)
+            log.info("📂 Thread archiviato riaperto", extra=campi(user_id=str(user_id), thread_id=str(thread_id)))
+        return thread
+    
+    @staticmethod
+    def salva(guild_id, user_id, channel_id, thread_id):
+        """Salva il thread dell'utente nel database e nella cache"""
+        DatabaseManager.save_user_thread(guild_id, user_id, channel_id, thread_id)
+        thread_guild = ThreadResolver._thread.get(int(guild_id))
+        if thread_guild is not None:
+            vecchio = thread_guild.get(int(user_id))
+            ThreadResolver._proprietari.pop(vecchio, None)
+            thread_guild[int(user_id)] = int(thread_id)
+            ThreadResolver._proprietari[int(thread_id)] = (int(guild_id), int(user_id))
+    
+    @staticmethod
+    def dimentica_thread(thread_id):
+        """Rimuove un thread dalla cache (eliminato)"""
+        proprietario = ThreadResolver._proprietari.pop(int(thread_id), None)
+        if proprietario:
+            guild_id, user_id = proprietario
+            ThreadResolver._thread.get(guild_id, {}).pop(user_id, None)
+    
+    @staticmethod
+    def dimentica_canale(guild_id, channel_id=None):
+        """Rimuove il canale #lista-spesa dalla cache (se è quello indicato)"""
+        if channel_id is None or ThreadResolver._canali.get(guild_id) == channel_id:
+            ThreadResolver._canali.pop(guild_id, None)
+    
+    @staticmethod
+    def dimentica_guild(guild_id):
+        """Rimuove tutto ciò che riguarda la guild (bot rimosso)"""
+        ThreadResolver.dimentica_canale(guild_id)
+        for thread_id in ThreadResolver._thread.pop(guild_id, {}).values():
+            ThreadResolver._proprietari.pop(thread_id, None)
+    
+    @staticmethod
+    async def _thread_guild(guild_id) -> dict:
+        """Thread della guild, caricati da Mongo al primo utilizzo"""
+        thread_guild = ThreadResolver._thread.get(guild_id)
+        if thread_guild is None:
+            caricati = await asyncio.to_thread(DatabaseManager.get_thread_utenti_guild, guild_id)
+            # Un altro task potrebbe averli caricati nel frattempo
+            thread_guild = ThreadResolver._thread.setdefault(guild_id, caricati)
+            for user_id, thread_id in thread_guild.items():
+                ThreadResolver._proprietari[thread_id] = (guild_id, user_id)
+        return thread_guild
 
 
 class ThreadManager:
@@ -13,31 +134,19 @@ class ThreadManager:
     async def crea_thread_utente(guild, member):
         """Crea o recupera il thread privato per un utente"""
         try:
-            # Cerca il canale #lista-spesa
-            canale = discord.utils.get(guild.text_channels, name=NOME_CANALE_LISTA_SPESA)
-            
-            # Se non esiste, crealo
-            if not canale:
-                print(f"📝 Creazione canale #{NOME_CANALE_LISTA_SPESA}...")
-                canale = await guild.create_text_channel(
-                    NOME_CANALE_LISTA_SPESA,
-                    topic="📋 Canale per le liste della spesa personali",
-                    reason="Creato automaticamente da FreezerBot"
-                )
-                print(f"✅ Canale #{NOME_CANALE_LISTA_SPESA} creato!")
-            
-            # Controlla se l'utente ha già un thread
-            thread_data = DatabaseManager.get_user_thread(guild.id, member.id)
+            canale = await ThreadResolver.canale_lista_spesa(guild)
             
-            if thread_data:
-                # Prova a recuperare il thread esistente
-                try:
-                    thread = guild.get_thread(int(thread_data['thread_id']))
-                    if thread:
-                        print(f"♻️ Thread esistente trovato per {member.name}")
-                        return thread
-                except:
-                    print(f"⚠️ Thread salvato non trovato, ne creo uno nuovo")
+            # Controlla se l'utente ha già un thread (anche archiviato)
+            thread = await ThreadResolver.thread_utente(guild, member.id)
+            if thread:
+                log.info("♻️ Thread esistente trovato per %s", member.name,
+                         extra=campi(user_id=str(member.id)))
+                # Un thread privato riaperto non riaggiunge chi ne era uscito
+                # (o chi è rientrato nella guild): reinvita l'utente se non
+                # risulta già tra i membri in cache
+                if thread.get_member(member.id) is None:
+                    await thread.add_user(member)
+                return thread
             
             # Crea un nuovo thread privato
             nome_thread = f"🧊 Freezer di {member.display_name}"
@@ -57,14 +166,15 @@ class ThreadManager:
             }
             )
             
-            print(f"✅ Thread privato creato per {member.name}")
+            log.info("✅ Thread privato creato per %s", member.name,
+                     extra=campi(user_id=str(member.id), thread_id=str(thread.id)))
             
             # Salva il thread nel database
-            DatabaseManager.save_user_thread(guild.id, member.id, canale.id, thread.id)
+            ThreadResolver.salva(guild.id, member.id, canale.id, thread.id)
             
             # Invita l'utente nel thread
             await thread.add_user(member)
-            print(f"✅ {member.name} aggiunto al thread")
+            log.debug("✅ %s aggiunto al thread", member.name, extra=campi(user_id=str(member.id)))
             
             # Invia messaggio di benvenuto
             await ThreadManager._invia_messaggio_benvenuto(thread, member)
@@ -72,69 +182,22 @@ class ThreadManager:
             return thread
             
         except discord.Forbidden:
-            print(f"❌ Permessi insufficienti per creare thread in {guild.name}")
+            log.error("❌ Permessi insufficienti per creare thread in %s", guild.name)
             return None
         except Exception as e:
-            print(f"❌ Errore nella creazione del thread: {e}")
+            log.exception("❌ Errore nella creazione del thread: %s", e, extra=campi(user_id=str(member.id)))
             return None
     
     @staticmethod
     async def _invia_messaggio_benvenuto(thread, member):
-        """Invia il messaggio di benvenuto nel thread"""
+        """Invia benvenuto e menu principale in un solo messaggio"""
         # Import qui per evitare circular import
         from views import MenuPrincipale
         
-        embed = discord.Embed(
-            title=f"👋 Benvenuto nel tuo Freezer personale, {member.display_name}!",
-            description="Questo è il tuo spazio privato per gestire il congelatore.",
-            color=discord.Color.blue()
+        await thread.send(
+            embeds=[
+                EmbedTemplates.crea("benvenuto", nome=member.display_name),
+                EmbedTemplates.crea("menu")
+            ],
+            view=MenuPrincipale()
         )
-        
-        embed.add_field(
-            name="🎯 Cosa puoi fare qui",
-            value="• Gestire gli alimenti nel tuo freezer\n"
-                  "• Ricevere promemoria per scongelare\n"
-                  "• Tenere traccia delle quantità\n"
-                  "• Ricevere notifiche quando finiscono gli alimenti",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="🚀 Come iniziare",
-            value="Usa il comando `/menu` per aprire il menu principale!\n"
-                  "Oppure usa `/help` per vedere tutti i comandi disponibili.",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="🔒 Privacy",
-            value="Questo thread è **privato**: solo tu e il bot potete vedere i messaggi qui dentro.",
-            inline=False
-        )
-        
-        embed.set_footer(text="FreezerBot 🧊 | Il tuo assistente per il congelatore")
-        
-        await thread.send(embed=embed)
-        
-        # Invia anche il menu principale
-        await thread.send("Ecco il tuo menu principale:")
-        
-        menu_embed = discord.Embed(
-            title="🧊 FreezerBot",
-            description="Gestisci il tuo congelatore facilmente!",
-            color=discord.Color.blue()
-        )
-        menu_embed.add_field(
-            name="📋 Lista",
-            value="Vedi tutti gli alimenti",
-            inline=False
-        )
-        menu_embed.add_field(
-            name="➕ Aggiungi",
-            value="Aggiungi alimenti o porzioni",
-            inline=False
-        )
-
-        
-        view = MenuPrincipale()
-        await thread.send(embed=menu_embed, view=view)
@@ -0,0 +1,187 @@
+# tracing.py
+"""Tracing della latenza delle interazioni (comandi slash, bottoni, modal)"""
+
+import contextvars
+import time
+from collections import deque
+from config import TRACCIA_LENTA_MS, TRACCIA_FINESTRA
+from metrics import Histogram, Gauge
+from mongo_logger import get_logger, campi
+from shutdown import Shutdown
+
+log = get_logger(__name__)
+
+QUANTILI = (0.5, 0.95, 0.99)
+INTERAZIONE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+class Traccia:
+    """Tempi di una singola interazione"""
+    __slots__ = ("nome", "inizio", "ack", "db", "db_chiamate", "rest", "rest_chiamate")
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.inizio = time.perf_counter()
+        self.ack = None  # Secondi dall'inizio alla prima risposta (defer/send/modal)
+        self.db = 0.0
+        self.db_chiamate = 0
+        self.rest = 0.0
+        self.rest_chiamate = 0
+
+
+_traccia_corrente = contextvars.ContextVar("traccia_corrente", default=None)
+
+
+class Tracing:
+    """
+    Misura ogni interazione dall'inizio del dispatch alla fine del callback.
+
+    Per ogni interazione registra:
+    - tempo fino alla prima risposta a Discord (il limite dei 3 secondi)
+    - tempo nelle chiamate a DatabaseManager
+    - tempo nelle chiamate REST a Discord
+    - tempo totale
+
+    La traccia corrente vive in una ContextVar: ogni dispatch di discord.py
+    gira nel suo task, quindi le interazioni concorrenti non si mescolano
+    (e asyncio.to_thread copia il contesto nel thread).
+    """
+
+    _campioni = {}  # nome -> {"totale": deque, "ack": deque}
+    _installato = False
+
+    @staticmethod
+    def installa():
+        """Aggancia il tracing a discord.py (comandi, view, modal, HTTP)"""
+        if Tracing._installato:
+            return
+        Tracing._installato = True
+
+        from discord import app_commands, ui
+        from discord.http import HTTPClient
+        from discord.webhook.async_ import AsyncWebhookAdapter
+
+        # Dispatch: ognuno gira in un task dedicato creato da discord.py
+        _call = app_commands.CommandTree._call
+
+        async def call_tracciato(self, interaction):
+            nome = "/" + interaction.data.get("name", "?")
+            if interaction.type.name == "autocomplete":
+                nome += " (autocomplete)"
+            await Tracing.esegui(nome, _call(self, interaction))
+
+        app_commands.CommandTree._call = call_tracciato
+
+        _view_task = ui.View._scheduled_task
+
+        async def view_tracciata(self, item, interaction):
+            callback = getattr(item.callback, "callback", item.callback)
+            nome = f"{type(self).__name__}.{getattr(callback, '__name__', item.custom_id)}"
+            await Tracing.esegui(nome, _view_task(self, item, interaction))
+
+        ui.View._scheduled_task = view_tracciata
+
+        _modal_task = ui.Modal._scheduled_task
+
+        async def modal_tracciato(self, interaction, *args):
+            await Tracing.esegui(f"{type(self).__name__}.on_submit", _modal_task(self, interaction, *args))
+
+        ui.Modal._scheduled_task = modal_tracciato
+
+        # Chiamate REST: bot (HTTPClient) e risposte alle interazioni (webhook)
+        HTTPClient.request = Tracing._strumenta_rest(HTTPClient.request)
+        AsyncWebhookAdapter.request = Tracing._strumenta_rest(AsyncWebhookAdapter.request)
+
+    @staticmethod
+    def _strumenta_rest(request):
+        async def wrapper(self, route, *args, **kwargs):
+            traccia = _traccia_corrente.get()
+            if traccia is None:
+                return await request(self, route, *args, **kwargs)
+
+            inizio = time.perf_counter()
+            if traccia.ack is None and route.path.endswith("/callback"):
+                traccia.ack = inizio - traccia.inizio
+            try:
+                return await request(self, route, *args, **kwargs)
+            finally:
+                traccia.rest += time.perf_counter() - inizio
+                traccia.rest_chiamate += 1
+        return wrapper
+
+    @staticmethod
+    def aggiungi_db(durata: float):
+        """Chiamato dal wrapper di DatabaseManager per ogni chiamata"""
+        traccia = _traccia_corrente.get()
+        if traccia is not None:
+            traccia.db += durata
+            traccia.db_chiamate += 1
+
+    @staticmethod
+    async def esegui(nome: str, coro):
+        """Esegue il dispatch di un'interazione dentro una traccia"""
+        traccia = Traccia(nome)
+        token = _traccia_corrente.set(traccia)
+        try:
+            with Shutdown.in_volo("interazione"):
+                return await coro
+        finally:
+            _traccia_corrente.reset(token)
+            Tracing._registra(traccia, time.perf_counter() - traccia.inizio)
+
+    @staticmethod
+    def _registra(traccia: Traccia, totale: float):
+        nome = traccia.nome
+        INTERAZIONE_DURATA.observe(totale, interazione=nome, fase="totale")
+        INTERAZIONE_DURATA.observe(traccia.db, interazione=nome, fase="db")
+        INTERAZIONE_DURATA.observe(traccia.rest, interazione=nome, fase="rest")
+        if traccia.ack is not None:
+            INTERAZIONE_DURATA.observe(traccia.ack, interazione=nome, fase="ack")
+
+        campioni = Tracing._campioni.get(nome)
+        if campioni is None:
+            campioni = Tracing._campioni[nome] = {
+                "totale": deque(maxlen=TRACCIA_FINESTRA),
+                "ack": deque(maxlen=TRACCIA_FINESTRA)
+            }
+        campioni["totale"].append(totale)
+        if traccia.ack is not None:
+            campioni["ack"].append(traccia.ack)
+
+        if totale * 1000 >= TRACCIA_LENTA_MS:
+            ack_ms = round(traccia.ack * 1000, 1) if traccia.ack is not None else None
+            log.warning(
+                "⏱️ Interazione lenta %s: totale %.0fms (ack %s, db %.0fms in %d chiamate, rest %.0fms in %d chiamate)",
+                nome, totale * 1000, f"{ack_ms:.0f}ms" if ack_ms is not None else "mai",
+                traccia.db * 1000, traccia.db_chiamate, traccia.rest * 1000, traccia.rest_chiamate,
+                extra=campi(
+                    interazione=nome, latency_ms=round(totale * 1000, 1), ack_ms=ack_ms,
+                    db_ms=round(traccia.db * 1000, 1), db_chiamate=traccia.db_chiamate,
+                    rest_ms=round(traccia.rest * 1000, 1), rest_chiamate=traccia.rest_chiamate
+                )
+            )
+
+    @staticmethod
+    def percentili() -> dict:
+        """{(interazione, fase, quantile): secondi} sugli ultimi TRACCIA_FINESTRA campioni"""
+        risultato = {}
+        for nome, campioni in list(Tracing._campioni.items()):
+            for fase, valori in campioni.items():
+                ordinati = sorted(valori)
+                if not ordinati:
+                    continue
+                for q in QUANTILI:
+                    indice = min(len(ordinati) - 1, int(q * len(ordinati)))
+                    risultato[(nome, fase, q)] = ordinati[indice]
+        return risultato
+
+
+INTERAZIONE_DURATA = Histogram(
+    "freezerbot_interaction_seconds", "Durata delle interazioni per fase", labels=("interazione", "fase"),
+    buckets=INTERAZIONE_BUCKETS
+)
+INTERAZIONE_PERCENTILI = Gauge(
+    "freezerbot_interaction_quantile_seconds",
+    f"Percentili delle interazioni sugli ultimi {TRACCIA_FINESTRA} campioni",
+    labels=("interazione", "fase", "quantile"), funzione=Tracing.percentili
+)
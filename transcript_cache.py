@@ -0,0 +1,115 @@
+# transcript_cache.py
+"""Cache delle trascrizioni vocali indicizzata per hash del contenuto audio"""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from database import DatabaseManager
+from config import TRANSCRIPT_CACHE_SIZE, TRANSCRIPT_CACHE_MONGO, TRANSCRIPT_CACHE_TTL
+
+
+class TranscriptCache:
+    """
+    Cache a due livelli per le trascrizioni Vosk.
+
+    - Livello 1: LRU in memoria, limitata a TRANSCRIPT_CACHE_SIZE voci
+    - Livello 2 (opzionale): collezione Mongo con scadenza TTL
+
+    La chiave è lo SHA-256 della configurazione del riconoscimento (modello,
+    VAD) e dei byte dell'allegato: lo stesso vocale inoltrato o reinviato non
+    passa più da ffmpeg e Vosk, ma cambiando modello o soglie le trascrizioni
+    vecchie non vengono più servite. Le letture e scritture su Mongo girano
+    in un thread, fuori dall'event loop.
+    """
+
+    _voci = OrderedDict()  # audio_hash -> (transcript, info)
+    _lock = threading.Lock()
+    _indice_ttl_creato = False
+
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def calcola_hash(audio_data: bytes, configurazione: str = "") -> str:
+        """Calcola l'hash della configurazione e del contenuto audio"""
+        hash_audio = hashlib.sha256(configurazione.encode("utf-8"))
+        hash_audio.update(b"\0")
+        hash_audio.update(audio_data)
+        return hash_audio.hexdigest()
+
+    @staticmethod
+    async def ottieni(audio_hash: str):
+        """
+        Cerca una trascrizione in cache.
+
+        Ritorna una tupla (transcript, info) oppure None se non presente.
+        """
+        with TranscriptCache._lock:
+            voce = TranscriptCache._voci.get(audio_hash)
+            if voce is not None:
+                TranscriptCache._voci.move_to_end(audio_hash)
+                TranscriptCache.hits += 1
+                return TranscriptCache._copia(voce)
+
+        if TRANSCRIPT_CACHE_MONGO:
+            documento = await asyncio.to_thread(DatabaseManager.get_trascrizione_cache, audio_hash)
+            if documento:
+                voce = (documento['transcript'], documento.get('info'))
+                TranscriptCache._salva_in_memoria(audio_hash, voce)
+                with TranscriptCache._lock:
+                    TranscriptCache.hits += 1
+                return TranscriptCache._copia(voce)
+
+        with TranscriptCache._lock:
+            TranscriptCache.misses += 1
+        return None
+
+    @staticmethod
+    async def salva(audio_hash: str, transcript: str, info: dict):
+        """Salva trascrizione e risultato del parsing"""
+        voce = (transcript, dict(info) if info else None)
+        TranscriptCache._salva_in_memoria(audio_hash, voce)
+
+        if TRANSCRIPT_CACHE_MONGO:
+            await asyncio.to_thread(TranscriptCache._salva_su_mongo, audio_hash, voce)
+
+    @staticmethod
+    def _salva_su_mongo(audio_hash, voce):
+        """Indice TTL (la prima volta) e upsert della voce, in un thread"""
+        if not TranscriptCache._indice_ttl_creato:
+            DatabaseManager.crea_indice_ttl_trascrizioni(TRANSCRIPT_CACHE_TTL)
+            TranscriptCache._indice_ttl_creato = True
+        DatabaseManager.salva_trascrizione_cache(audio_hash, *voce)
+
+    @staticmethod
+    def hit_rate() -> float:
+        """Percentuale di richieste servite dalla cache (0.0 - 1.0)"""
+        totale = TranscriptCache.hits + TranscriptCache.misses
+        return TranscriptCache.hits / totale if totale else 0.0
+
+    @staticmethod
+    def statistiche() -> dict:
+        """Contatori della cache"""
+        return {
+            "hits": TranscriptCache.hits,
+            "misses": TranscriptCache.misses,
+            "hit_rate": TranscriptCache.hit_rate(),
+            "voci": len(TranscriptCache._voci),
+            "capacita": TRANSCRIPT_CACHE_SIZE
+        }
+
+    @staticmethod
+    def _salva_in_memoria(audio_hash, voce):
+        """Inserisce una voce nella LRU eliminando la meno recente se piena"""
+        with TranscriptCache._lock:
+            TranscriptCache._voci[audio_hash] = voce
+            TranscriptCache._voci.move_to_end(audio_hash)
+            while len(TranscriptCache._voci) > TRANSCRIPT_CACHE_SIZE:
+                TranscriptCache._voci.popitem(last=False)
+
+    @staticmethod
+    def _copia(voce):
+        """Restituisce una copia, così le view non modificano la voce in cache"""
+        transcript, info = voce
+        return transcript, dict(info) if info else None
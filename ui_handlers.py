@@ -4,9 +4,14 @@
 import discord
 from database import DatabaseManager
 from config import GIORNI
-from views import (MenuPrincipale, ListaAlimentiView, GestioneAlimentoView,
+from templates import EmbedTemplates
+from lista_renderer import ListaRenderer
+from food_index import FoodIndex
+from views import (VistaFreezer, MenuPrincipale, ListaAlimentiView, GestioneAlimentoView,
                    AggiungiAlimentoView, ModificaAlimentiView, ModificaAlimentoView,
-                   SelezioneGiornoView, SelezioneOrarioView)
+                   SelezioneGiornoView, SelezioneOrarioView, SuggerimentoNomeView)
+
+NOTA_ALTRE_PAGINE = " · /lista per vedere tutte le pagine"  # Footer quando si mostra solo la prima
 
 
 class UIHandlers:
@@ -18,64 +23,39 @@ class UIHandlers:
         if not interaction.response.is_done():
             await interaction.response.defer()
         
-        embed = discord.Embed(
-            title="🧊 FreezerBot",
-            description="Gestisci il tuo congelatore facilmente!",
-            color=discord.Color.blue()
-        )
-        embed.add_field(
-            name="📋 Lista",
-            value="Vedi tutti gli alimenti",
-            inline=False
-        )
-        embed.add_field(
-            name="➕ Aggiungi",
-            value="Aggiungi alimenti o porzioni",
-            inline=False
-        )
-
+        embed = EmbedTemplates.crea("menu")
         view = MenuPrincipale()
         
         await interaction.edit_original_response(embed=embed, view=view)
     
     @staticmethod
-    async def mostra_lista(interaction: discord.Interaction):
-        """Mostra la lista degli alimenti"""
+    async def mostra_lista(interaction: discord.Interaction, tutte_le_pagine: bool = False):
+        """
+        Mostra la lista degli alimenti.
+
+        Le pagine oltre la prima vanno in messaggi nuovi, quindi solo il
+        comando /lista le invia (tutte_le_pagine=True): i bottoni Lista e
+        Indietro, premuti più volte, lascerebbero copie orfane nel thread.
+        """
         if not interaction.response.is_done():
             await interaction.response.defer()
         
         alimenti = DatabaseManager.get_alimenti_utente(interaction.user.id)
+        embeds = ListaRenderer.crea_embed(
+            alimenti, nota_pagine="" if tutte_le_pagine else NOTA_ALTRE_PAGINE
+        )
         
         if not alimenti:
-            embed = discord.Embed(
-                title="🧊 Il Tuo Freezer",
-                description="Il freezer è vuoto! Usa **➕ Aggiungi** per iniziare.",
-                color=discord.Color.blue()
-            )
             view = MenuPrincipale()
         else:
-            embed = discord.Embed(
-                title="🧊 Il Tuo Freezer",
-                description=f"Hai **{len(alimenti)}** alimenti salvati:",
-                color=discord.Color.blue()
-            )
-            
-            # Raggruppa per giorno
-            for giorno_num in sorted(set([a['scongela_per_giorno'] for a in alimenti])):
-                alimenti_giorno = [a for a in alimenti if a['scongela_per_giorno'] == giorno_num]
-                testo = "\n".join([
-                    f"• **{a['nome_alimento'].capitalize()}**: {a['quantita']} {a.get('unita', 'pz')}"
-                    for a in alimenti_giorno
-                ])
-                embed.add_field(
-                    name=f"📅 {GIORNI[giorno_num]}",
-                    value=testo,
-                    inline=False
-                )
-            
             view = ListaAlimentiView(alimenti, interaction.user.id)
         
-        await interaction.edit_original_response(embed=embed, view=view)
+        await interaction.edit_original_response(embed=embeds[0], view=view)
+        
+        # Oltre i 6000 caratteri per messaggio: le pagine successive in messaggi separati
+        if tutte_le_pagine:
+            for embed in embeds[1:]:
+                await interaction.followup.send(embed=embed)
     
     @staticmethod
     async def mostra_gestione_alimento(interaction: discord.Interaction, id_univoco: str):
@@ -138,6 +118,8 @@ class UIHandlers:
             color=discord.Color.green()
         )
         
+        # La view legge i nomi dall'indice: se non è in memoria lo carica fuori dal loop
+        await FoodIndex.carica(interaction.user.id)
         view = AggiungiAlimentoView(interaction.user.id)
         
         await interaction.edit_original_response(embed=embed, view=view)
@@ -168,7 +150,7 @@ class UIHandlers:
             )
         
         select.callback = callback
-        view = discord.ui.View()
+        view = VistaFreezer()
         view.add_item(select)
         
         await interaction.edit_original_response(
@@ -176,6 +158,22 @@ class UIHandlers:
             view=view
         )
     
+    @staticmethod
+    async def mostra_suggerimento_nome(interaction: discord.Interaction, nome: str, suggerito: str, prosegui):
+        """Chiede se usare l'alimento già presente con un nome simile o tenere quello scritto"""
+        embed = discord.Embed(
+            title="🔎 Alimento già presente?",
+            description=f"Hai scritto *{nome}*, ma nel freezer hai già **{suggerito.capitalize()}**.\n"
+                        f"Vuoi usare quello o tenere il nome che hai scritto?",
+            color=discord.Color.orange()
+        )
+        view = SuggerimentoNomeView(nome, suggerito, interaction.user.id, prosegui)
+        
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed, view=view)
+        else:
+            await interaction.response.send_message(embed=embed, view=view)
+    
     @staticmethod
     async def mostra_selezione_giorno(interaction: discord.Interaction, nome: str, quantita: int, portion_to_buy: int):
         """Mostra menu per selezionare il giorno"""
@@ -0,0 +1,82 @@
+# vad.py
+"""Rilevamento del parlato (VAD) a energia per tagliare i silenzi prima di Vosk"""
+
+import numpy as np
+from config import (VAD_FRAME_MS, VAD_SOGLIA_MIN, VAD_MOLTIPLICATORE_RUMORE,
+                    VAD_MARGINE_MS, VAD_PAUSA_MAX_MS)
+
+
+class VoiceActivityDetector:
+    """
+    VAD basato sull'energia RMS per frame, vettorizzato con numpy.
+
+    - Stima il rumore di fondo dal 10° percentile dell'energia
+    - Marca come parlato i frame sopra soglia, con un margine prima e dopo
+    - Taglia il silenzio iniziale e finale
+    - Accorcia le pause lunghe a VAD_PAUSA_MAX_MS (Vosk ha bisogno di una
+      pausa breve per separare le parole, non di secondi di silenzio)
+    """
+
+    @staticmethod
+    def parametri() -> str:
+        """Impostazioni che cambiano l'audio passato a Vosk (per la chiave della cache)"""
+        return (f"frame={VAD_FRAME_MS},soglia={VAD_SOGLIA_MIN},rumore={VAD_MOLTIPLICATORE_RUMORE},"
+                f"margine={VAD_MARGINE_MS},pausa={VAD_PAUSA_MAX_MS}")
+
+    @staticmethod
+    def rimuovi_silenzi(pcm: bytes, sample_rate: int = 16000):
+        """
+        Ritorna (pcm_ridotto, statistiche) a partire da PCM 16 bit mono.
+
+        Se non trova parlato restituisce l'audio originale, così una soglia
+        sbagliata non fa mai perdere un vocale.
+        """
+        campioni = np.frombuffer(pcm, dtype=np.int16)
+        campioni_per_frame = sample_rate * VAD_FRAME_MS // 1000
+        n_frame = len(campioni) // campioni_per_frame
+
+        statistiche = {
+            "durata_originale_s": len(campioni) / sample_rate,
+            "durata_finale_s": len(campioni) / sample_rate,
+            "frazione_rimossa": 0.0
+        }
+
+        if n_frame == 0:
+            return pcm, statistiche
+
+        frame = campioni[:n_frame * campioni_per_frame].reshape(n_frame, campioni_per_frame)
+        energia = np.sqrt(np.mean(frame.astype(np.float32) ** 2, axis=1))
+
+        rumore = np.percentile(energia, 10)
+        soglia = max(VAD_SOGLIA_MIN, rumore * VAD_MOLTIPLICATORE_RUMORE)
+        parlato = energia > soglia
+
+        if not parlato.any():
+            return pcm, statistiche
+
+        # Margine attorno al parlato per non tagliare attacchi e code delle parole
+        margine = VAD_MARGINE_MS // VAD_FRAME_MS
+        if margine:
+            finestra = np.ones(2 * margine + 1, dtype=np.int32)
+            parlato = np.convolve(parlato.astype(np.int32), finestra, mode="same") > 0
+
+        # Posizione di ogni frame all'interno della sua sequenza di silenzio
+        indici = np.arange(n_frame)
+        silenzio = ~parlato
+        inizio_silenzio = silenzio & ~np.concatenate(([False], silenzio[:-1]))
+        posizione = indici - np.maximum.accumulate(np.where(inizio_silenzio, indici, 0))
+
+        # Tieni il parlato e solo i primi frame di ogni pausa
+        tieni = parlato | (silenzio & (posizione < VAD_PAUSA_MAX_MS // VAD_FRAME_MS))
+
+        # Taglia testa e coda
+        primo, ultimo = np.flatnonzero(parlato)[[0, -1]]
+        tieni[:primo] = False
+        tieni[ultimo + 1:] = False
+
+        ridotto = frame[tieni].tobytes()
+
+        statistiche["durata_finale_s"] = len(ridotto) / 2 / sample_rate
+        statistiche["frazione_rimossa"] = 1 - len(ridotto) / len(pcm)
+
+        return ridotto, statistiche
@@ -1,17 +1,55 @@
 # views.py
 """Classi View per bottoni e menu interattivi"""
 
+import sys
+import weakref
+from functools import partial
+from collections import Counter
 import discord
 from discord import ui
 from database import DatabaseManager
 from config import GIORNI
 from models import AlimentoHelper
+from click_coalescer import ClickCoalescer
+from metrics import Gauge
+from rate_limiter import RateLimiter
+from mongo_logger import get_logger, campi
 
+log = get_logger(__name__)
 
-class MenuPrincipale(ui.View):
-    """Menu principale con pulsanti Lista, Aggiungi, Modifica alimenti"""
-    def __init__(self):
-        super().__init__(timeout=None)
+VISTE_ATTIVE = weakref.WeakSet()  # Tutte le view ancora in memoria
+
+
+class VistaFreezer(ui.View):
+    """
+    Base delle view del bot: le registra in VISTE_ATTIVE per /metrics e
+    applica il limite di interazioni per utente a ogni click (costo).
+
+    Le view restano in memoria fino al timeout, quindi tengono solo chiavi
+    compatte (user_id, id_univoco, pochi scalari) e rileggono l'alimento
+    dal database quando serve.
+    """
+    costo = 1  # Gettoni prelevati da ogni click
+    
+    def __init__(self, timeout=180):
+        super().__init__(timeout=timeout)
+        VISTE_ATTIVE.add(self)
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await RateLimiter.consenti(interaction, "view", type(self).__name__, self.costo)
+
+
+class MenuPrincipale(VistaFreezer):
+    """
+    Menu principale con pulsanti Lista, Aggiungi, Modifica alimenti.
+
+    Ogni messaggio riceve una view che scade; i click successivi li gestisce
+    l'istanza persistente (timeout=None) registrata all'avvio con add_view.
+    """
+    costo = 2  # Lista e Aggiungi leggono l'intero inventario
+    
+    def __init__(self, timeout=180):
+        super().__init__(timeout=timeout)
     
     @ui.button(label="📋 Lista", style=discord.ButtonStyle.primary, custom_id="lista")
     async def lista_button(self, interaction: discord.Interaction, button: ui.Button):
@@ -27,11 +65,10 @@ class MenuPrincipale(ui.View):
 
 
 
-class ListaAlimentiView(ui.View):
+class ListaAlimentiView(VistaFreezer):
     """View per gestire la lista alimenti con bottoni +/-"""
     def __init__(self, alimenti, user_id):
-        super().__init__(timeout=180)
-        self.alimenti = alimenti
+        super().__init__()
         self.user_id = user_id
         
         # Aggiungi select menu per scegliere l'alimento
@@ -66,48 +103,29 @@ class ListaAlimentiView(ui.View):
         await UIHandlers.mostra_menu_principale(interaction)
 
 
-class GestioneAlimentoView(ui.View):
+class GestioneAlimentoView(VistaFreezer):
     """View per gestire singolo alimento (+1, -1, Rimuovi)"""
     def __init__(self, alimento, user_id):
-        super().__init__(timeout=180)
-        self.alimento = alimento
+        super().__init__()
         self.user_id = user_id
         self.id_univoco = alimento['id_univoco']
+        self.nome = alimento['nome_alimento']
+        self.quantita = alimento['quantita']  # Valore ottimistico durante i click +1/-1
     
     @ui.button(label="➕ Aggiungi 1", style=discord.ButtonStyle.green)
     async def aggiungi_uno(self, interaction: discord.Interaction, button: ui.Button):
-        from ui_handlers import UIHandlers
-        await interaction.response.defer()
-        nuova_quantita = DatabaseManager.aggiorna_quantita(self.user_id, self.id_univoco, 1)
-        self.alimento['quantita'] = nuova_quantita
-        await interaction.edit_original_response(
-            embed=UIHandlers.crea_embed_alimento(self.alimento),
-            view=self
-        )
+        await ClickCoalescer.clicca(interaction, self, 1)
     
     @ui.button(label="➖ Rimuovi 1", style=discord.ButtonStyle.red)
     async def rimuovi_uno(self, interaction: discord.Interaction, button: ui.Button):
-        from notifications import NotificationManager
-        await interaction.response.defer()
-        nuova_quantita = DatabaseManager.aggiorna_quantita(self.user_id, self.id_univoco, -1)
-        self.alimento['quantita'] = nuova_quantita
-        
-        # Notifica se finito
-        if nuova_quantita == 1:
-            await NotificationManager.notifica_quantita_finita(interaction.user, self.alimento)
-        
-        from ui_handlers import UIHandlers
-        await interaction.edit_original_response(
-            embed=UIHandlers.crea_embed_alimento(self.alimento),
-            view=self
-        )
+        await ClickCoalescer.clicca(interaction, self, -1)
     
     @ui.button(label="🗑️ Elimina", style=discord.ButtonStyle.danger)
     async def elimina(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
         DatabaseManager.rimuovi_alimento(self.user_id, self.id_univoco)
         await interaction.edit_original_response(
-            content=f"✅ **{self.alimento['nome_alimento']}** eliminato dal freezer!",
+            content=f"✅ **{self.nome}** eliminato dal freezer!",
             embed=None,
             view=None
         )
@@ -116,7 +134,11 @@ class GestioneAlimentoView(ui.View):
     async def modifica(self, interaction: discord.Interaction, button: ui.Button):
         from ui_handlers import UIHandlers
         await interaction.response.defer()
-        await UIHandlers.mostra_menu_modifica(interaction, self.alimento)
+        alimento = DatabaseManager.get_alimento_by_id(self.user_id, self.id_univoco)
+        if not alimento:
+            await interaction.edit_original_response(content="❌ Alimento non trovato!", embed=None, view=None)
+            return
+        await UIHandlers.mostra_menu_modifica(interaction, alimento)
     
     @ui.button(label="◀️ Indietro", style=discord.ButtonStyle.secondary, row=2)
     async def indietro(self, interaction: discord.Interaction, button: ui.Button):
@@ -125,29 +147,27 @@ class GestioneAlimentoView(ui.View):
         await UIHandlers.mostra_lista(interaction)
 
 
-class AggiungiAlimentoView(ui.View):
+class AggiungiAlimentoView(VistaFreezer):
     """View per aggiungere nuovo alimento o porzione esistente"""
     def __init__(self, user_id):
-        super().__init__(timeout=180)
+        super().__init__()
         self.user_id = user_id
         
-        # Ottieni alimenti esistenti
-        alimenti = DatabaseManager.get_alimenti_utente(user_id)
+        from food_index import FoodIndex
         
-        if alimenti:
-            # Crea set di nomi unici
-            nomi_unici = list(set([a['nome_alimento'] for a in alimenti]))
+        # Nomi esistenti dall'indice in memoria, già in ordine alfabetico
+        nomi_unici = FoodIndex.nomi(user_id)
+        
+        if nomi_unici:
+            options = [discord.SelectOption(label=nome.capitalize(), value=nome) 
+                      for nome in nomi_unici[:25]]
             
-            if nomi_unici:
-                options = [discord.SelectOption(label=nome.capitalize(), value=nome) 
-                          for nome in nomi_unici[:25]]
-                
-                select = ui.Select(
-                    placeholder="Aggiungi porzione a alimento esistente",
-                    options=options
-                )
-                select.callback = self.select_esistente_callback
-                self.add_item(select)
+            select = ui.Select(
+                placeholder="Aggiungi porzione a alimento esistente",
+                options=options
+            )
+            select.callback = self.select_esistente_callback
+            self.add_item(select)
     
     async def select_esistente_callback(self, interaction: discord.Interaction):
         from ui_handlers import UIHandlers
@@ -204,22 +224,64 @@ class NuovoAlimentoModal(ui.Modal, title="➕ Aggiungi Nuovo Alimento"):
         default="150"
     )
     
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        # L'invio crea un alimento: stesso limite per utente dei click delle view
+        return await RateLimiter.consenti(interaction, "modal", type(self).__name__)
+    
     async def on_submit(self, interaction: discord.Interaction):
         from ui_handlers import UIHandlers
+        from food_index import FoodIndex
         await interaction.response.defer()
-        # Mostra menu per scegliere giorno
-        await UIHandlers.mostra_selezione_giorno(
-            interaction,
-            self.nome.value,
-            int(self.quantita.value),
-            int(self.portion_to_buy.value)
+        
+        nome = FoodIndex.normalizza(self.nome.value)
+        await FoodIndex.carica(interaction.user.id)
+        prosegui = partial(
+            UIHandlers.mostra_selezione_giorno,
+            quantita=int(self.quantita.value),
+            portion_to_buy=int(self.portion_to_buy.value)
         )
+        
+        # Nome quasi uguale a un alimento già presente: lo propone, ma sceglie l'utente
+        suggerito = FoodIndex.miglior_corrispondenza(interaction.user.id, nome)
+        if suggerito and suggerito != nome:
+            await UIHandlers.mostra_suggerimento_nome(interaction, nome, suggerito, prosegui)
+            return
+        
+        # Mostra menu per scegliere giorno
+        await prosegui(interaction, nome)
+
 
+class SuggerimentoNomeView(VistaFreezer):
+    """
+    Il nome scritto somiglia a un alimento già presente: l'utente sceglie se
+    usare quello esistente o tenere il proprio (mai sostituito in automatico).
+    prosegui(interaction, nome) continua il flusso con il nome scelto.
+    """
+    def __init__(self, nome, suggerito, user_id, prosegui):
+        super().__init__()
+        self.nome = nome
+        self.suggerito = suggerito
+        self.user_id = user_id
+        self.prosegui = prosegui
+        
+        self.usa_suggerito.label = f"🔎 Usa {suggerito.capitalize()}"[:80]
+        self.tieni_nome.label = f"✏️ Tieni {nome.capitalize()}"[:80]
+    
+    @ui.button(style=discord.ButtonStyle.green)
+    async def usa_suggerito(self, interaction: discord.Interaction, button: ui.Button):
+        await interaction.response.defer()
+        await self.prosegui(interaction, self.suggerito)
+    
+    @ui.button(style=discord.ButtonStyle.secondary)
+    async def tieni_nome(self, interaction: discord.Interaction, button: ui.Button):
+        await interaction.response.defer()
+        await self.prosegui(interaction, self.nome)
 
-class SelezioneGiornoView(ui.View):
+
+class SelezioneGiornoView(VistaFreezer):
     """View per selezionare il giorno di scongelamento"""
     def __init__(self, nome, quantita, portion_to_buy, user_id):
-        super().__init__(timeout=180)
+        super().__init__()
         self.nome = nome
         self.quantita = quantita
         self.portion_to_buy = portion_to_buy
@@ -249,10 +311,10 @@ class SelezioneGiornoView(ui.View):
         )
 
 
-class SelezioneOrarioView(ui.View):
+class SelezioneOrarioView(VistaFreezer):
     """View per selezionare orario reminder"""
     def __init__(self, nome, quantita, portion_to_buy, giorno, user_id):
-        super().__init__(timeout=180)
+        super().__init__()
         self.nome = nome
         self.quantita = quantita
         self.portion_to_buy = portion_to_buy
@@ -309,7 +371,7 @@ class SelezioneOrarioView(ui.View):
                 )
                 embed.set_footer(text="Vuoi aggiungere la quantità all'alimento esistente?")
                 
-                view = ConfermaIncrementoView(alimento_esistente, alimento_dict, self.user_id)
+                view = ConfermaIncrementoView(alimento_esistente['id_univoco'], self.quantita, self.user_id)
                 await interaction.edit_original_response(embed=embed, view=view)
             else:
                 # Alimento nuovo, inserisci normalmente
@@ -337,7 +399,7 @@ class SelezioneOrarioView(ui.View):
                 await interaction.edit_original_response(embed=embed, view=None)
             
         except Exception as e:
-            print(f"❌ Errore nel callback orario: {e}")
+            log.exception("❌ Errore nel callback orario: %s", e, extra=campi(user_id=str(self.user_id)))
             if not interaction.response.is_done():
                 await interaction.response.send_message(
                     content="❌ Si è verificato un errore. Riprova!",
@@ -350,12 +412,12 @@ class SelezioneOrarioView(ui.View):
                 )
 
 
-class ConfermaIncrementoView(ui.View):
+class ConfermaIncrementoView(VistaFreezer):
     """View per confermare l'incremento di un alimento esistente"""
-    def __init__(self, alimento_esistente, alimento_nuovo, user_id):
-        super().__init__(timeout=180)
-        self.alimento_esistente = alimento_esistente
-        self.alimento_nuovo = alimento_nuovo
+    def __init__(self, id_univoco, quantita, user_id):
+        super().__init__()
+        self.id_univoco = id_univoco
+        self.quantita = quantita
         self.user_id = user_id
     
     @ui.button(label="✅ Sì, aggiungi quantità", style=discord.ButtonStyle.green)
@@ -363,28 +425,25 @@ class ConfermaIncrementoView(ui.View):
         try:
             await interaction.response.defer()
             
-            # Incrementa la quantità
-            result = DatabaseManager.incrementa_quantita_alimento(
-                self.alimento_esistente['id_univoco'],
-                self.alimento_nuovo['quantita']
+            # Incrementa la quantità e rilegge l'alimento nella stessa scrittura
+            alimento = DatabaseManager.aggiorna_quantita(
+                self.user_id, self.id_univoco, self.quantita, completo=True
             )
             
-            if result:
-                nuova_quantita = self.alimento_esistente['quantita'] + self.alimento_nuovo['quantita']
-                
+            if alimento:
                 embed = discord.Embed(
                     title="✅ Quantità Aggiornata!",
-                    description=f"**{self.alimento_esistente['nome_alimento'].capitalize()}** aggiornato!",
+                    description=f"**{alimento['nome_alimento'].capitalize()}** aggiornato!",
                     color=discord.Color.green()
                 )
                 embed.add_field(
                     name="📦 Nuova Quantità",
-                    value=f"{nuova_quantita} porzioni",
+                    value=f"{alimento['quantita']} porzioni",
                     inline=True
                 )
                 embed.add_field(
                     name="📅 Per il giorno",
-                    value=GIORNI[self.alimento_esistente['scongela_per_giorno']],
+                    value=GIORNI[alimento['scongela_per_giorno']],
                     inline=True
                 )
                 
@@ -395,7 +454,7 @@ class ConfermaIncrementoView(ui.View):
                     ephemeral=True
                 )
         except Exception as e:
-            print(f"❌ Errore conferma incremento: {e}")
+            log.exception("❌ Errore conferma incremento: %s", e, extra=campi(user_id=str(self.user_id)))
             await interaction.followup.send(
                 content="❌ Si è verificato un errore. Riprova!",
                 ephemeral=True
@@ -411,10 +470,10 @@ class ConfermaIncrementoView(ui.View):
 
 
 
-class ModificaAlimentiView(ui.View):
+class ModificaAlimentiView(VistaFreezer):
     """View per la modifica degli alimenti"""
     def __init__(self, user_id):
-        super().__init__(timeout=180)
+        super().__init__()
         self.user_id = user_id
         
         alimenti = DatabaseManager.get_alimenti_utente(user_id)
@@ -449,17 +508,17 @@ class ModificaAlimentiView(ui.View):
         await UIHandlers.mostra_menu_principale(interaction)
 
 
-class ModificaAlimentoView(ui.View):
+class ModificaAlimentoView(VistaFreezer):
     """View per modificare singolo alimento"""
     def __init__(self, alimento, user_id):
-        super().__init__(timeout=180)
-        self.alimento = alimento
+        super().__init__()
         self.user_id = user_id
         self.id_univoco = alimento['id_univoco']
+        self.notifiche_abilitate = alimento['notifiche_abilitate']
     
     @ui.button(label="📅 Cambia Giorno", style=discord.ButtonStyle.primary)
     async def cambia_giorno(self, interaction: discord.Interaction, button: ui.Button):
-        print("🔴 BOTTONE CAMBIA GIORNO PREMUTO")
+        log.debug("🔴 BOTTONE CAMBIA GIORNO PREMUTO", extra=campi(user_id=str(self.user_id)))
         
         options = [discord.SelectOption(label=giorno, value=str(num)) 
                 for num, giorno in GIORNI.items()]
@@ -467,64 +526,53 @@ class ModificaAlimentoView(ui.View):
         select = ui.Select(placeholder="Nuovo giorno", options=options)
         
         async def callback(inter):
-            print("🔵 CALLBACK SELECT AVVIATA")
+            log.debug("🔵 CALLBACK SELECT AVVIATA")
             await inter.response.defer()
             
             try:
                 nuovo_giorno = int(inter.data['values'][0])
-                print(f"📝 Nuovo giorno: {nuovo_giorno}")
-                
-                reminder_day = AlimentoHelper.calcola_reminder_day(nuovo_giorno)
+                log.debug("📝 Nuovo giorno: %s", nuovo_giorno)
                 
-                # Calcola nuovo id_univoco
-                nuovo_id_univoco = AlimentoHelper.crea_id_univoco(
-                    self.alimento['nome_alimento'],
-                    nuovo_giorno,
-                    self.alimento['portion_to_buy'],
-                    self.user_id
+                # Un solo passaggio: giorno, reminder_day, id_univoco e coda notifiche
+                alimento_aggiornato, unito = DatabaseManager.cambia_giorno_alimento(
+                    self.user_id, self.id_univoco, nuovo_giorno
                 )
                 
-                # Elimina il vecchio alimento
-                DatabaseManager.rimuovi_alimento(self.user_id, self.id_univoco)
-                print("✅ Vecchio alimento eliminato")
-                
-                # Prepara il nuovo alimento aggiornato
-                alimento_aggiornato = self.alimento.copy()
-                alimento_aggiornato['id_univoco'] = nuovo_id_univoco
-                alimento_aggiornato['scongela_per_giorno'] = nuovo_giorno
-                alimento_aggiornato['reminder_day'] = reminder_day
-                
-                # Inserisci il nuovo alimento
-                DatabaseManager.inserisci_alimento_nuovo(alimento_aggiornato)
-                print("✅ Nuovo alimento inserito")
+                if alimento_aggiornato is None:
+                    await inter.edit_original_response(
+                        content="❌ Alimento non trovato! Potrebbe essere stato eliminato.",
+                        embed=None,
+                        view=None
+                    )
+                    return
                 
-                # ⭐ IMPORTANTE: Aggiorna self.alimento con i nuovi dati
-                self.alimento = alimento_aggiornato
-                self.id_univoco = nuovo_id_univoco
-                print(f"✅ self.alimento aggiornato: Giorno {GIORNI[nuovo_giorno]}")
+                # ⭐ IMPORTANTE: la view punta ora alla variante aggiornata
+                self.id_univoco = alimento_aggiornato['id_univoco']
+                self.notifiche_abilitate = alimento_aggiornato['notifiche_abilitate']
+                log.debug("✅ id_univoco aggiornato: Giorno %s", GIORNI[nuovo_giorno])
                 
                 # ⭐ Ricrea l'embed CON i dati aggiornati
                 from ui_handlers import UIHandlers
-                embed = UIHandlers.crea_embed_alimento(self.alimento)
+                embed = UIHandlers.crea_embed_alimento(alimento_aggiornato)
                 
                 await inter.edit_original_response(
+                    content=f"🔀 Unito alla variante già presente per {GIORNI[nuovo_giorno]}" if unito else None,
                     embed=embed,
                     view=self
                 )
-                print("✅ CALLBACK COMPLETATA")
+                log.info("✅ Giorno cambiato: %s", GIORNI[nuovo_giorno],
+                         extra=campi(user_id=str(self.user_id), alimento_id=str(alimento_aggiornato['_id'])))
                 
             except Exception as e:
-                print(f"❌ ERRORE: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("❌ ERRORE: %s", e, extra=campi(user_id=str(self.user_id)))
 
         
         select.callback = callback
-        view = ui.View()
+        view = VistaFreezer()
         view.add_item(select)
-        print("🔄 Mostrando select menu...")
+        log.debug("🔄 Mostrando select menu...")
         await interaction.response.edit_message(view=view)
-        print("✅ SELECT MENU VISUALIZZATO")
+        log.debug("✅ SELECT MENU VISUALIZZATO")
 
     
     @ui.button(label="🕐 Cambia Orario", style=discord.ButtonStyle.primary)
@@ -549,20 +597,20 @@ class ModificaAlimentoView(ui.View):
             )
         
         select.callback = callback
-        view = ui.View()
+        view = VistaFreezer()
         view.add_item(select)
         await interaction.response.edit_message(view=view)
     
     @ui.button(label="🔔 Notifiche", style=discord.ButtonStyle.secondary)
     async def toggle_notifiche(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
-        stato_attuale = self.alimento['notifiche_abilitate']
-        nuovo_stato = not stato_attuale
+        nuovo_stato = not self.notifiche_abilitate
         
         DatabaseManager.aggiorna_alimento(
             self.user_id, self.id_univoco,
             {"notifiche_abilitate": nuovo_stato}
         )
+        self.notifiche_abilitate = nuovo_stato
         
         stato_testo = "attivate ✅" if nuovo_stato else "disattivate ❌"
         await interaction.edit_original_response(
@@ -575,3 +623,38 @@ class ModificaAlimentoView(ui.View):
         from ui_handlers import UIHandlers
         await interaction.response.defer()
         await UIHandlers.mostra_lista(interaction)
+
+
+def _dimensione(oggetto, visti) -> int:
+    """Byte occupati da un valore e da ciò che contiene (esclusi componenti e oggetti discord)"""
+    if id(oggetto) in visti or isinstance(oggetto, (ui.Item, ui.View, discord.Interaction)):
+        return 0
+    visti.add(id(oggetto))
+    dimensione = sys.getsizeof(oggetto)
+    if isinstance(oggetto, dict):
+        dimensione += sum(_dimensione(k, visti) + _dimensione(v, visti) for k, v in oggetto.items())
+    elif isinstance(oggetto, (list, tuple, set, frozenset)):
+        dimensione += sum(_dimensione(v, visti) for v in oggetto)
+    return dimensione
+
+
+def _memoria_viste():
+    """Byte dello stato proprio (attributi pubblici) delle view attive, per classe"""
+    totali = Counter()
+    for vista in list(VISTE_ATTIVE):
+        stato = [
+            v for k, v in vars(vista).items()
+            if not k.startswith("_") and k != "id" and not isinstance(v, ui.Item)
+        ]
+        totali[(type(vista).__name__,)] += _dimensione(stato, set())
+    return dict(totali)
+
+
+VISTE_IN_MEMORIA = Gauge(
+    "freezerbot_live_views", "View in memoria (in attesa di click o del timeout)", labels=("vista",),
+    funzione=lambda: dict(Counter((type(vista).__name__,) for vista in list(VISTE_ATTIVE)))
+)
+MEMORIA_VISTE = Gauge(
+    "freezerbot_live_view_state_bytes", "Byte dello stato tenuto dalle view in memoria", labels=("vista",),
+    funzione=_memoria_viste
+)
@@ -2,37 +2,131 @@
 """Sistema di riconoscimento vocale GRATUITO con Vosk"""
 
 import discord
+import asyncio
 import io
 import json
-import wave
+import os
+import threading
+import tempfile
+import time
 import subprocess
-from vosk import Model, KaldiRecognizer
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from database import DatabaseManager
 from models import AlimentoHelper
-from config import GIORNI, GIORNI_INVERSO
+from config import (GIORNI, GIORNI_INVERSO, VOSK_WARMUP, VOSK_MODEL_WAIT_TIMEOUT,
+                    VOICE_POOL_SIZE, VOICE_CHUNK_FRAMES, VOICE_VAD_ENABLED)
+from transcript_cache import TranscriptCache
+from vad import VoiceActivityDetector
+from food_index import FoodIndex
+from metrics import VOICE_DURATA, memoria_residente_bytes
+from mongo_logger import get_logger, campi
+from shutdown import Shutdown
+from views import VistaFreezer
+
+log = get_logger(__name__)
 
 # Il modello Vosk viene scaricato una volta e riutilizzato
-VOSK_MODEL_PATH = "./vosk-model-small-it-0.22"  # Modello italiano
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "./vosk-model-small-it-0.22")  # Modello italiano
+SAMPLE_RATE = 16000
 
 
 class VoiceHandler:
     """Handler per processare messaggi vocali con Vosk"""
     
-    model = None  # Caricato una volta all'avvio
+    model = None  # Caricato in background dopo la connessione al gateway
+    model_pronto = threading.Event()  # Settato quando il caricamento termina (anche se fallisce)
+    _thread_caricamento = None
+    _lock_caricamento = threading.Lock()
+    _pool = None  # ThreadPoolExecutor per ffmpeg + Vosk
+    chunk_frames = VOICE_CHUNK_FRAMES  # Campioni passati ad AcceptWaveform per volta
+    vad_abilitato = VOICE_VAD_ENABLED  # Taglio dei silenzi prima del riconoscimento
     
     @staticmethod
     def carica_modello():
-        """Carica il modello Vosk"""
+        """Carica il modello Vosk (bloccante: usare avvia_caricamento_in_background)"""
         try:
             if not VoiceHandler.model:
-                print("📥 Caricamento modello Vosk italiano...")
+                log.info("📥 Caricamento modello Vosk italiano...")
+                inizio = time.perf_counter()
+                
+                # Import qui: vosk è pesante e serve solo per i vocali
+                from vosk import Model
                 VoiceHandler.model = Model(VOSK_MODEL_PATH)
-                print("✅ Modello Vosk caricato!")
+                
+                durata = time.perf_counter() - inizio
+                log.info("✅ Modello Vosk caricato in %.2fs (RSS: %.0f MB)",
+                         durata, VoiceHandler._memoria_residente_mb(),
+                         extra=campi(job="vosk_load", latency_ms=round(durata * 1000, 1)))
+                
+                if VOSK_WARMUP:
+                    VoiceHandler._warmup_modello()
+        except Exception as e:
+            log.error("❌ Errore caricamento modello Vosk: %s", e)
+            log.warning("💡 Scarica il modello con: python download_vosk_model.py")
+        finally:
+            VoiceHandler.model_pronto.set()
+    
+    @staticmethod
+    def avvia_caricamento_in_background():
+        """Avvia il caricamento del modello in un thread separato (idempotente)"""
+        with VoiceHandler._lock_caricamento:
+            if VoiceHandler.model or VoiceHandler._thread_caricamento:
+                return
+            
+            VoiceHandler.model_pronto.clear()
+            VoiceHandler._thread_caricamento = threading.Thread(
+                target=VoiceHandler._esegui_caricamento,
+                name="vosk-loader",
+                daemon=True
+            )
+            VoiceHandler._thread_caricamento.start()
+    
+    @staticmethod
+    def _esegui_caricamento():
+        """Corpo del thread di caricamento"""
+        try:
+            VoiceHandler.carica_modello()
+        finally:
+            with VoiceHandler._lock_caricamento:
+                VoiceHandler._thread_caricamento = None
+    
+    @staticmethod
+    async def attendi_modello(timeout=VOSK_MODEL_WAIT_TIMEOUT) -> bool:
+        """
+        Attende che il modello sia pronto senza bloccare l'event loop.
+        
+        Se il caricamento non è mai partito (o è fallito) lo riavvia.
+        """
+        if VoiceHandler.model:
+            return True
+        
+        VoiceHandler.avvia_caricamento_in_background()
+        
+        if not VoiceHandler.model_pronto.is_set():
+            log.info("⏳ Modello Vosk in caricamento, attendo...")
+            await asyncio.to_thread(VoiceHandler.model_pronto.wait, timeout)
+        
+        return VoiceHandler.model is not None
+    
+    @staticmethod
+    def _warmup_modello():
+        """Decodifica un secondo di silenzio per scaldare le cache del modello"""
+        try:
+            from vosk import KaldiRecognizer
+            inizio = time.perf_counter()
+            rec = KaldiRecognizer(VoiceHandler.model, SAMPLE_RATE)
+            rec.AcceptWaveform(b"\x00\x00" * SAMPLE_RATE)
+            rec.FinalResult()
+            log.info("🔥 Warm-up Vosk completato in %.2fs", time.perf_counter() - inizio)
         except Exception as e:
-            print(f"❌ Errore caricamento modello Vosk: {e}")
-            print("💡 Scarica il modello con: python download_vosk_model.py")
+            log.warning("⚠️ Warm-up Vosk fallito: %s", e)
+    
+    @staticmethod
+    def _memoria_residente_mb() -> float:
+        """Memoria residente del processo in MB"""
+        return memoria_residente_bytes() / (1024 * 1024)
     
     @staticmethod
     async def processa_messaggio_vocale(message: discord.Message):
@@ -52,28 +146,39 @@ class VoiceHandler:
             if not attachment.content_type or not attachment.content_type.startswith('audio/'):
                 return False
             
-            print(f"🎤 Ricevuto messaggio vocale da {message.author.name}")
+            log_campi = campi(user_id=str(message.author.id), job="voice")
+            log.info("🎤 Ricevuto messaggio vocale da %s", message.author.name, extra=log_campi)
             
             # Invia typing indicator
             async with message.channel.typing():
                 # Scarica l'audio
                 audio_data = await attachment.read()
-                
-                # Trascrivi con Vosk
-                transcript = await VoiceHandler.trascrivi_audio_vosk(audio_data, attachment.filename)
-                
+                audio_hash = TranscriptCache.calcola_hash(audio_data, VoiceHandler.configurazione())
+
+                # Stesso audio già trascritto? Salta ffmpeg e Vosk
+                cached = await TranscriptCache.ottieni(audio_hash)
+
+                if cached:
+                    transcript, info = cached
+                    log.info("♻️ Trascrizione dalla cache (hit rate %.0f%%)", TranscriptCache.hit_rate() * 100,
+                             extra=log_campi)
+                else:
+                    # Trascrivi con Vosk
+                    transcript = await VoiceHandler.trascrivi_audio_vosk(audio_data, attachment.filename)
+                    info = VoiceHandler.estrai_info_alimento(transcript) if transcript else None
+
+                    if transcript:
+                        await TranscriptCache.salva(audio_hash, transcript, info)
+
                 if not transcript:
                     await message.reply("❌ Non sono riuscito a capire l'audio. Riprova parlando più chiaramente!")
                     return True
                 
-                print(f"📝 Trascrizione: {transcript}")
+                log.info("📝 Trascrizione: %s", transcript, extra=log_campi)
                 
                 # Invia trascrizione
                 await message.reply(f"📝 Ho capito: *\"{transcript}\"*\n\n🔄 Sto elaborando...")
-                
-                # Estrai informazioni
-                info = VoiceHandler.estrai_info_alimento(transcript)
-                
+
                 if not info:
                     await message.channel.send(
                         "❌ Non ho capito i dettagli dell'alimento.\n\n"
@@ -88,102 +193,142 @@ class VoiceHandler:
             return True
             
         except Exception as e:
-            print(f"❌ Errore processamento vocale: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("❌ Errore processamento vocale: %s", e)
             
             await message.reply(
                 "❌ Si è verificato un errore nel processare il messaggio vocale."
             )
             return True
     
+    @staticmethod
+    def configurazione() -> str:
+        """Modello e VAD in uso: fanno parte della chiave della cache delle trascrizioni"""
+        vad = VoiceActivityDetector.parametri() if VoiceHandler.vad_abilitato else "off"
+        return f"modello={os.path.basename(os.path.normpath(VOSK_MODEL_PATH))};vad={vad}"
+    
     @staticmethod
     async def trascrivi_audio_vosk(audio_data: bytes, filename: str) -> str:
         """
         Trascrivi audio usando Vosk (completamente gratuito e offline).
         
-        Vosk funziona meglio con audio WAV a 16kHz mono.
+        Vosk funziona meglio con audio PCM a 16kHz mono.
         Discord invia OGG/Opus, quindi convertiamo prima con ffmpeg.
+        Conversione e riconoscimento sono bloccanti: girano nel pool
+        dei vocali, non sull'event loop.
         """
         try:
-            # Salva temporaneamente l'audio
-            temp_input = f"/tmp/{filename}"
-            temp_wav = "/tmp/audio_converted.wav"
-            
-            with open(temp_input, 'wb') as f:
-                f.write(audio_data)
-            
-            # Converti in WAV 16kHz mono con ffmpeg
-            subprocess.run([
-                'ffmpeg', '-i', temp_input,
-                '-ar', '16000',  # Sample rate 16kHz
-                '-ac', '1',      # Mono
-                '-f', 'wav',
-                temp_wav,
-                '-y'  # Sovrascrivi se esiste
-            ], check=True, capture_output=True)
-            
-            # Carica il modello (se non già caricato)
-            if not VoiceHandler.model:
-                VoiceHandler.carica_modello()
-            
-            if not VoiceHandler.model:
-                print("❌ Modello Vosk non disponibile")
-                return None
-            
-            # Apri il file WAV
-            wf = wave.open(temp_wav, "rb")
-            
-            # Verifica che sia 16kHz mono
-            if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getframerate() != 16000:
-                print(f"❌ Audio non compatibile: {wf.getnchannels()}ch, {wf.getsampwidth()}B, {wf.getframerate()}Hz")
-                wf.close()
+            # Attendi il modello (caricato in background all'avvio)
+            if not await VoiceHandler.attendi_modello():
+                log.error("❌ Modello Vosk non disponibile")
                 return None
             
-            # Crea recognizer
-            rec = KaldiRecognizer(VoiceHandler.model, wf.getframerate())
-            rec.SetWords(True)
-            
-            # Processa audio
-            results = []
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    if 'text' in result:
-                        results.append(result['text'])
-            
-            # Risultato finale
-            final_result = json.loads(rec.FinalResult())
-            if 'text' in final_result:
-                results.append(final_result['text'])
-            
-            wf.close()
-            
-            # Unisci tutti i risultati
-            transcript = ' '.join(results).strip()
-            
-            # Pulisci file temporanei
-            import os
-            try:
-                os.remove(temp_input)
-                os.remove(temp_wav)
-            except:
-                pass
-            
-            return transcript if transcript else None
+            loop = asyncio.get_running_loop()
+            with Shutdown.in_volo("vocale"):
+                return await loop.run_in_executor(
+                    VoiceHandler._get_pool(),
+                    VoiceHandler._trascrivi_sync,
+                    audio_data,
+                    filename
+                )
             
         except subprocess.CalledProcessError as e:
-            print(f"❌ Errore ffmpeg: {e.stderr.decode() if e.stderr else e}")
+            log.error("❌ Errore ffmpeg: %s", e.stderr.decode() if e.stderr else e)
             return None
         except Exception as e:
-            print(f"❌ Errore trascrizione Vosk: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("❌ Errore trascrizione Vosk: %s", e)
             return None
     
+    @staticmethod
+    def _trascrivi_sync(audio_data: bytes, filename: str) -> str:
+        """Conversione + riconoscimento (eseguito in un thread del pool)"""
+        inizio = time.perf_counter()
+        pcm = VoiceHandler.converti_audio(audio_data, filename)
+        fine_conversione = time.perf_counter()
+        VOICE_DURATA.observe(fine_conversione - inizio, fase="conversione")
+        
+        if VoiceHandler.vad_abilitato:
+            pcm, statistiche = VoiceActivityDetector.rimuovi_silenzi(pcm, SAMPLE_RATE)
+            VOICE_DURATA.observe(time.perf_counter() - fine_conversione, fase="vad")
+            log.debug("✂️ VAD: %.1fs → %.1fs (%.0f%% silenzio rimosso)",
+                      statistiche['durata_originale_s'], statistiche['durata_finale_s'],
+                      statistiche['frazione_rimossa'] * 100)
+        
+        inizio_riconoscimento = time.perf_counter()
+        transcript = VoiceHandler.riconosci_pcm(pcm)
+        fine = time.perf_counter()
+        VOICE_DURATA.observe(fine - inizio_riconoscimento, fase="riconoscimento")
+        VOICE_DURATA.observe(fine - inizio, fase="totale")
+        return transcript if transcript else None
+    
+    @staticmethod
+    def converti_audio(audio_data: bytes, filename: str) -> bytes:
+        """Converte l'audio in PCM 16 bit, 16kHz mono con ffmpeg"""
+        # File temporaneo con nome univoco: più vocali possono essere in conversione insieme
+        suffisso = os.path.splitext(filename)[1] or ".ogg"
+        with tempfile.NamedTemporaryFile(suffix=suffisso) as temp_input:
+            temp_input.write(audio_data)
+            temp_input.flush()
+            
+            risultato = subprocess.run([
+                'ffmpeg', '-i', temp_input.name,
+                '-ar', str(SAMPLE_RATE),  # Sample rate 16kHz
+                '-ac', '1',               # Mono
+                '-f', 's16le',            # PCM grezzo su stdout, niente file WAV
+                'pipe:1'
+            ], check=True, capture_output=True)
+        
+        return risultato.stdout
+    
+    @staticmethod
+    def riconosci_pcm(pcm: bytes, chunk_frames: int = None) -> str:
+        """Esegue il riconoscimento Vosk su PCM 16 bit, 16kHz mono"""
+        from vosk import KaldiRecognizer
+        
+        chunk_bytes = (chunk_frames or VoiceHandler.chunk_frames) * 2  # 2 byte per campione
+        
+        rec = KaldiRecognizer(VoiceHandler.model, SAMPLE_RATE)
+        rec.SetWords(True)
+        
+        # Processa audio
+        results = []
+        for offset in range(0, len(pcm), chunk_bytes):
+            if rec.AcceptWaveform(pcm[offset:offset + chunk_bytes]):
+                result = json.loads(rec.Result())
+                if 'text' in result:
+                    results.append(result['text'])
+        
+        # Risultato finale
+        final_result = json.loads(rec.FinalResult())
+        if 'text' in final_result:
+            results.append(final_result['text'])
+        
+        # Unisci tutti i risultati
+        return ' '.join(results).strip()
+    
+    @staticmethod
+    def configura_pool(dimensione: int):
+        """Imposta il numero di vocali elaborati in parallelo"""
+        if VoiceHandler._pool:
+            VoiceHandler._pool.shutdown(wait=True)
+        VoiceHandler._pool = ThreadPoolExecutor(
+            max_workers=dimensione,
+            thread_name_prefix="vosk"
+        )
+    
+    @staticmethod
+    def chiudi_pool():
+        """Ferma il pool dei vocali scartando quelli non ancora iniziati"""
+        if VoiceHandler._pool:
+            VoiceHandler._pool.shutdown(wait=False, cancel_futures=True)
+            VoiceHandler._pool = None
+    
+    @staticmethod
+    def _get_pool():
+        """Pool dei vocali, creato al primo utilizzo"""
+        if not VoiceHandler._pool:
+            VoiceHandler.configura_pool(VOICE_POOL_SIZE)
+        return VoiceHandler._pool
+    
     @staticmethod
     def estrai_info_alimento(testo: str) -> dict:
         """
@@ -258,8 +403,22 @@ class VoiceHandler:
     @staticmethod
     async def mostra_conferma_vocale(message: discord.Message, info: dict):
         """Mostra embed di conferma con bottoni"""
-        from views import ConfermaAlimentoVocaleView
+        # Vosk sbaglia spesso di una lettera: aggancia il nome a un alimento esistente
+        await FoodIndex.carica(message.author.id)
+        nome_esistente = FoodIndex.miglior_corrispondenza(message.author.id, info["nome"])
+        if nome_esistente and nome_esistente != info["nome"]:
+            log.info("🔎 Nome corretto: '%s' → '%s'", info['nome'], nome_esistente)
+            info["nome_originale"] = info["nome"]
+            info["nome"] = nome_esistente
+        
+        embed = VoiceHandler.crea_embed_conferma(info)
+        view = ConfermaAlimentoVocaleView(info, message.author.id)
         
+        await message.channel.send(embed=embed, view=view)
+    
+    @staticmethod
+    def crea_embed_conferma(info: dict):
+        """Crea l'embed di conferma per i dati estratti dal vocale"""
         embed = discord.Embed(
             title="🎤 Alimento da Messaggio Vocale",
             description="Ho estratto queste informazioni. Confermi?",
@@ -272,19 +431,40 @@ class VoiceHandler:
         embed.add_field(name="📅 Giorno", value=GIORNI[info["giorno"]], inline=True)
         embed.add_field(name="🕐 Orario Reminder", value=info["orario"], inline=True)
         
-        view = ConfermaAlimentoVocaleView(info, message.author.id)
+        if info.get("nome_originale"):
+            embed.add_field(
+                name="🔎 Alimento già presente",
+                value=f"Ho capito *{info['nome_originale']}*, uso **{info['nome'].capitalize()}** che hai già nel freezer.",
+                inline=False
+            )
         
-        await message.channel.send(embed=embed, view=view)
+        return embed
 
 
-# Aggiungi questa classe alla fine del file (o importala da views.py)
-class ConfermaAlimentoVocaleView(discord.ui.View):
+class ConfermaAlimentoVocaleView(VistaFreezer):
     """View per confermare l'alimento estratto dal vocale"""
     
     def __init__(self, info: dict, user_id: int):
-        super().__init__(timeout=180)
-        self.info = info
+        super().__init__()
+        # Solo i campi usati, non il dict del parsing
+        self.nome = info["nome"]
+        self.nome_originale = info.get("nome_originale")
+        self.quantita = info["quantita"]
+        self.grammi = info["grammi"]
+        self.giorno = info["giorno"]
+        self.orario = info["orario"]
         self.user_id = user_id
+        
+        # Il bottone per tenere il nome trascritto serve solo se l'abbiamo corretto
+        if not self.nome_originale:
+            self.remove_item(self.usa_nome_originale)
+    
+    def info(self) -> dict:
+        """I dati da mostrare nell'embed di conferma"""
+        return {
+            "nome": self.nome, "nome_originale": self.nome_originale, "quantita": self.quantita,
+            "grammi": self.grammi, "giorno": self.giorno, "orario": self.orario
+        }
     
     @discord.ui.button(label="✅ Conferma e Aggiungi", style=discord.ButtonStyle.green)
     async def conferma(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -293,40 +473,36 @@ class ConfermaAlimentoVocaleView(discord.ui.View):
             
             alimento_dict = AlimentoHelper.crea_alimento_dict(
                 user_id=self.user_id,
-                nome=self.info["nome"],
-                quantita=self.info["quantita"],
-                portion_to_buy=self.info["grammi"],
-                giorno=self.info["giorno"],
-                orario=self.info["orario"]
+                nome=self.nome,
+                quantita=self.quantita,
+                portion_to_buy=self.grammi,
+                giorno=self.giorno,
+                orario=self.orario
             )
             
-            alimento_esistente = DatabaseManager.alimento_esiste(alimento_dict['id_univoco'])
+            # Un solo upsert atomico, come /aggiungi: la quantità mostrata è quella scritta
+            alimento, creato = DatabaseManager.aggiungi_porzioni(alimento_dict)
             
-            if alimento_esistente:
-                DatabaseManager.incrementa_quantita_alimento(
-                    alimento_dict['id_univoco'],
-                    self.info["quantita"]
-                )
-                nuova_quantita = alimento_esistente['quantita'] + self.info["quantita"]
-                
+            if not creato:
                 embed = discord.Embed(
                     title="✅ Quantità Aggiornata!",
-                    description=f"**{self.info['nome'].capitalize()}** già esistente. Quantità aggiornata!",
+                    description=f"**{self.nome.capitalize()}** già esistente. Quantità aggiornata!",
                     color=discord.Color.green()
                 )
-                embed.add_field(name="📦 Nuova Quantità", value=f"{nuova_quantita} porzioni", inline=True)
+                embed.add_field(name="📦 Nuova Quantità", value=f"{alimento['quantita']} porzioni", inline=True)
             else:
-                DatabaseManager.inserisci_alimento_nuovo(alimento_dict)
-                reminder_day = AlimentoHelper.calcola_reminder_day(self.info["giorno"])
-                
                 embed = discord.Embed(
                     title="✅ Alimento Aggiunto!",
-                    description=f"**{self.info['nome'].capitalize()}** aggiunto al freezer!",
+                    description=f"**{self.nome.capitalize()}** aggiunto al freezer!",
                     color=discord.Color.green()
                 )
-                embed.add_field(name="📦 Quantità", value=f"{self.info['quantita']} porzioni", inline=True)
-                embed.add_field(name="📅 Per il giorno", value=GIORNI[self.info["giorno"]], inline=True)
-                embed.add_field(name="📢 Reminder", value=f"{GIORNI[reminder_day]} alle {self.info['orario']}", inline=True)
+                embed.add_field(name="📦 Quantità", value=f"{alimento['quantita']} porzioni", inline=True)
+                embed.add_field(name="📅 Per il giorno", value=GIORNI[alimento['scongela_per_giorno']], inline=True)
+                embed.add_field(
+                    name="📢 Reminder",
+                    value=f"{GIORNI[alimento['reminder_day']]} alle {alimento['reminder_hours']}",
+                    inline=True
+                )
             
             for item in self.children:
                 item.disabled = True
@@ -334,9 +510,19 @@ class ConfermaAlimentoVocaleView(discord.ui.View):
             await interaction.edit_original_response(embed=embed, view=self)
             
         except Exception as e:
-            print(f"❌ Errore conferma vocale: {e}")
+            log.exception("❌ Errore conferma vocale: %s", e, extra=campi(user_id=str(self.user_id)))
             await interaction.followup.send("❌ Errore nel salvataggio. Riprova!", ephemeral=True)
     
+    @discord.ui.button(label="✏️ Usa nome trascritto", style=discord.ButtonStyle.secondary)
+    async def usa_nome_originale(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.defer()
+        self.nome, self.nome_originale = self.nome_originale, None
+        self.remove_item(button)
+        await interaction.edit_original_response(
+            embed=VoiceHandler.crea_embed_conferma(self.info()),
+            view=self
+        )
+    
     @discord.ui.button(label="❌ Annulla", style=discord.ButtonStyle.red)
     async def annulla(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
@@ -2,17 +2,154 @@
 """Server HTTP per Render"""
 
 from aiohttp import web
+import asyncio
+import functools
+import hmac
 import os
+from config import ADMIN_TOKEN, PROFILO_MAX_SECONDI
+from mongo_logger import get_logger
+from metrics import Metrics
+from readiness import Readiness
+from loop_watchdog import LoopWatchdog
+from profiling import Profiler, ProfiloOccupato
+
+log = get_logger(__name__)
+
+
+def richiede_admin(handler):
+    """Protegge un endpoint di debug con ADMIN_TOKEN (header Authorization: Bearer ...)"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        if not ADMIN_TOKEN:
+            raise web.HTTPNotFound()
+        fornito = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(fornito.encode(), ADMIN_TOKEN.encode()):
+            log.warning("⚠️ Accesso negato a %s da %s", request.path, request.remote)
+            raise web.HTTPUnauthorized()
+        return await handler(request)
+    return wrapper
+
+
+def _parametro(request, nome, tipo, default):
+    """Legge un parametro di query tipizzato (HTTP 400 se non valido)"""
+    try:
+        return tipo(request.query.get(nome, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{nome} non valido")
 
 
 class WebServer:
     """Server web per health check"""
     
+    runner = None
+    
     @staticmethod
     async def health_check(request):
         """Endpoint per health check di Render"""
         return web.Response(text="Bot is running!")
     
+    @staticmethod
+    async def ready(request):
+        """Readiness: stato delle dipendenze letto dalla cache delle probe"""
+        pronto, corpo = Readiness.stato()
+        return web.Response(text=corpo, status=200 if pronto else 503, content_type="application/json")
+    
+    @staticmethod
+    async def metrics(request):
+        """Metriche in formato di esposizione Prometheus"""
+        return web.Response(
+            body=Metrics.esporta().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+    
+    @staticmethod
+    @richiede_admin
+    async def blocchi_loop(request):
+        """Hotspot dei blocchi dell'event loop rilevati dal watchdog"""
+        return web.json_response(LoopWatchdog.report(_parametro(request, "limite", int, 20)))
+    
+    @staticmethod
+    @richiede_admin
+    async def profilo_cpu(request):
+        """
+        Profilo CPU per N secondi.
+        
+        ?secondi=10&modo=cprofile (pstats del thread del loop) oppure
+        modo=campionamento (stack collapsed di tutti i thread, &solo_loop=1)
+        """
+        secondi = min(_parametro(request, "secondi", float, 10), PROFILO_MAX_SECONDI)
+        modo = request.query.get("modo", "cprofile")
+        try:
+            if modo == "cprofile":
+                testo = await Profiler.cprofile(
+                    secondi,
+                    limite=_parametro(request, "limite", int, 40),
+                    ordine=request.query.get("ordine", "cumulative")
+                )
+            elif modo == "campionamento":
+                testo = await Profiler.campiona(secondi, solo_loop=request.query.get("solo_loop") == "1")
+            else:
+                raise web.HTTPBadRequest(text="modo deve essere cprofile o campionamento")
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        except ProfiloOccupato:
+            raise web.HTTPConflict(text="profiling già in corso")
+        return web.Response(text=testo)
+    
+    @staticmethod
+    @richiede_admin
+    async def profilo_job(request):
+        """cProfile della prossima esecuzione di un job (?attesa=120&esegui_ora=1)"""
+        job_id = request.match_info["job_id"]
+        try:
+            testo = await Profiler.profila_job(
+                job_id,
+                attesa=_parametro(request, "attesa", float, 120),
+                esegui_ora=request.query.get("esegui_ora") == "1",
+                limite=_parametro(request, "limite", int, 40),
+                ordine=request.query.get("ordine", "cumulative")
+            )
+        except KeyError:
+            raise web.HTTPNotFound(text=f"job {job_id} non trovato")
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        except ProfiloOccupato:
+            raise web.HTTPConflict(text="profiling già in corso")
+        except asyncio.TimeoutError:
+            raise web.HTTPGatewayTimeout(text=f"il job {job_id} non è partito in tempo")
+        return web.Response(text=testo)
+    
+    @staticmethod
+    @richiede_admin
+    async def memoria_avvia(request):
+        """Avvia tracemalloc e prende la snapshot di riferimento (?frame=10)"""
+        await asyncio.to_thread(Profiler.avvia_tracemalloc, _parametro(request, "frame", int, 10))
+        return web.json_response({"tracemalloc": "avviato"})
+    
+    @staticmethod
+    @richiede_admin
+    async def memoria_ferma(request):
+        """Ferma tracemalloc"""
+        Profiler.ferma_tracemalloc()
+        return web.json_response({"tracemalloc": "fermato"})
+    
+    @staticmethod
+    @richiede_admin
+    async def memoria_diff(request):
+        """Crescita della memoria rispetto alla snapshot di riferimento"""
+        try:
+            diff = await asyncio.to_thread(
+                Profiler.diff_memoria,
+                _parametro(request, "limite", int, 25),
+                request.query.get("raggruppa", "lineno"),
+                request.query.get("aggiorna_base") == "1"
+            )
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if diff is None:
+            raise web.HTTPConflict(text="tracemalloc non attivo: POST /debug/memoria/avvia")
+        return web.json_response(diff)
+    
     @staticmethod
     async def start_web_server():
         """Avvia un semplice web server per Render"""
@@ -21,9 +158,26 @@ class WebServer:
         app = web.Application()
         app.router.add_get('/', WebServer.health_check)
         app.router.add_get('/health', WebServer.health_check)
+        app.router.add_get('/ready', WebServer.ready)
+        app.router.add_get('/metrics', WebServer.metrics)
+        app.router.add_get('/debug/blocchi', WebServer.blocchi_loop)
+        app.router.add_get('/debug/profilo', WebServer.profilo_cpu)
+        app.router.add_get('/debug/profilo/job/{job_id}', WebServer.profilo_job)
+        app.router.add_post('/debug/memoria/avvia', WebServer.memoria_avvia)
+        app.router.add_post('/debug/memoria/ferma', WebServer.memoria_ferma)
+        app.router.add_get('/debug/memoria', WebServer.memoria_diff)
         
         runner = web.AppRunner(app)
         await runner.setup()
         site = web.TCPSite(runner, '0.0.0.0', PORT)
         await site.start()
-        print(f'✅ Web server avviato sulla porta {PORT}')
+        WebServer.runner = runner
+        log.info("✅ Web server avviato sulla porta %s", PORT)
+    
+    @staticmethod
+    async def stop_web_server():
+        """Chiude il web server (le richieste in corso vengono completate)"""
+        if WebServer.runner:
+            await WebServer.runner.cleanup()
+            WebServer.runner = None
+            log.info("✅ Web server chiuso")